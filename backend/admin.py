@@ -5,7 +5,8 @@ from .models import Shop, ProductInfo, Order, Contact, User
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    list_display = ("id", "name",)
+    list_display = ("id", "name", "import_interval", "last_checked_at", "last_check_status",
+                    "last_import_at", "last_import_status",)
     search_fields = ("name",)
     ordering = ("-name",)
 
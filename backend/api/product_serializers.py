@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from backend.models import ProductParameter, ProductInfo, Product
+from backend.models import ProductParameter, ProductInfo, ProductInfoHistory, Product
 
 
 # --- СЕРИАЛИЗАТОРЫ ДЛЯ ПРОДУКТОВ ---
@@ -67,6 +67,28 @@ class ProductInfoListSerializer(serializers.ModelSerializer):
         ]
 
 
+# --- СЕРИАЛИЗАТОРЫ ДЛЯ ИСТОРИИ ЦЕН И ОСТАТКОВ ---
+class ProductInfoHistorySerializer(serializers.ModelSerializer):
+    """Сериализатор для точки истории цен и остатков."""
+
+    class Meta:
+        model = ProductInfoHistory
+        fields = ["recorded_at", "price", "price_rrc", "quantity"]
+
+
+class ProductInfoHistoryBucketSerializer(serializers.Serializer):
+    """Сериализатор для агрегированной истории за интервал (день, неделя, месяц)."""
+    bucket = serializers.DateTimeField() # Начало интервала
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price_avg = serializers.DecimalField(max_digits=12, decimal_places=2)
+    price_rrc_min = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price_rrc_max = serializers.DecimalField(max_digits=10, decimal_places=2)
+    quantity_min = serializers.IntegerField()
+    quantity_max = serializers.IntegerField()
+    changes = serializers.IntegerField() # Число изменений за интервал
+
+
 # --- СЕРИАЛИЗАТОР ДЛЯ ЗАГРУЗКИ ИЗОБРАЖЕНИЙ ПРОДУКТОВ ---
 class ProductImageUploadSerializer(serializers.ModelSerializer):
     """Сериализатор только для загрузки изображения товара."""
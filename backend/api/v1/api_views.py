@@ -1,12 +1,21 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from celery.result import AsyncResult
+import hashlib
+import os
+from celery.result import AsyncResult, GroupResult
+from celery.utils import uuid
 
 from backend.models import Shop
-from backend.tasks import import_all_shops_data_task, import_shop_data_task
+from backend.tasks import import_all_shops_data_task, import_shop_data_task, import_shop_data_chunked_task
+from backend.import_lock import reserve_shop_import, release_shop_import, get_task_import_lock
+from backend.feed_storage import HashingFileUploadHandler, store_feed_file
+from backend.utils import FEED_FORMATS
+from backend.redis_client import cache_metrics
+from backend.catalog_cache import local_product_list_cache
 
 
 # --- API View-класс для запуска импорта ВСЕХ магазинов ---
@@ -25,21 +34,147 @@ class StartImportAllShopsView(APIView):
         )
 
 
+def is_true(value) -> bool:
+    """Булево значение из JSON или формы ("true", "1", "yes")."""
+    return value is True or str(value).lower() in ("1", "true", "yes")
+
+
 # --- API View-класс для запуска импорта КОНКРЕТНОГО магазина ---
 class StartImportShopView(APIView):
     """
     API View для запуска асинхронного импорта данных КОНКРЕТНОГО магазина.
     POST /api/v1/start-import-shop/<int:shop_id>/
+    Необязательные поля: yaml_file_path, chunk_size (импорт по частям параллельно),
+    dry_run (только предпросмотр изменений без записи в БД), full_diff (сохранить полный отчёт предпросмотра).
+    Если импорт магазина уже выполняется или стоит в очереди, новая задача не создаётся:
+    возвращается ID уже запущенной задачи и already_running=True.
     """
     permission_classes = [IsAuthenticated]
 
     def post(self, request, shop_id, *args, **kwargs):
         shop = get_object_or_404(Shop, id=shop_id) # Проверяем существование магазина
         yaml_file_path = request.data.get("yaml_file_path") # Получаем путь к YAML-файлу
-        task = import_shop_data_task.delay(shop_id, yaml_file_path) # Запускаем Celery-задачу
+        chunk_size = request.data.get("chunk_size") # Размер части для параллельного импорта
+
+        if is_true(request.data.get("dry_run")):
+            # Предпросмотр ничего не пишет, поэтому аренду магазина не захватывает
+            task = import_shop_data_task.apply_async(
+                args=(shop_id, yaml_file_path),
+                kwargs={"dry_run": True, "full_diff": is_true(request.data.get("full_diff"))},
+            )
+            return Response(
+                {"task_id": task.id, "message": f"Предпросмотр импорта магазина {shop.name} начат.", "dry_run": True},
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        if chunk_size:
+            try:
+                chunk_size = int(chunk_size)
+            except (TypeError, ValueError):
+                chunk_size = 0
+            if chunk_size <= 0:
+                return Response(
+                    {"status": "error", "message": "chunk_size должен быть положительным числом."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Импорт большого файла по частям на нескольких воркерах
+            task, args = import_shop_data_chunked_task, (shop_id, yaml_file_path, chunk_size)
+        else:
+            task, args = import_shop_data_task, (shop_id, yaml_file_path)
+
+        # ID задачи выдаём заранее, чтобы захватить аренду магазина до постановки в очередь
+        task_id = uuid()
+        holder = reserve_shop_import(shop_id, task_id)
+        if holder != task_id:
+            return Response(
+                {"task_id": holder, "message": f"Импорт магазина {shop.name} уже выполняется.",
+                 "already_running": True},
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        try:
+            task.apply_async(args=args, task_id=task_id) # Запускаем Celery-задачу
+        except Exception:
+            release_shop_import(shop_id, task_id)
+            raise
+
+        return Response(
+            {"task_id": task_id, "message": f"Импорт магазина {shop.name} начат.", "already_running": False},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+# --- API View-класс для загрузки файла поставщика ---
+class UploadShopFeedView(APIView):
+    """
+    API View для загрузки файла поставщика и запуска его импорта.
+    POST /api/v1/shops/<int:shop_id>/feed/ (multipart/form-data, поле file)
+    Доступно только поставщику магазина. Файл пишется на диск частями с подсчётом SHA-256,
+    сохраняется в хранилище и становится файлом источника магазина. Если содержимое совпадает
+    с последним импортом, импорт не запускается.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, shop_id, *args, **kwargs):
+        shop = get_object_or_404(Shop, id=shop_id) # Проверяем существование магазина
+        if not shop.is_supplier(request.user):
+            return Response(
+                {"status": "error", "message": "Загружать файлы может только поставщик этого магазина."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Обработчик загрузки задаётся до первого обращения к request.data / request.FILES
+        request._request.upload_handlers = [HashingFileUploadHandler(request._request)]
+        uploaded_file = request.FILES.get("file")
+        if uploaded_file is None:
+            return Response(
+                {"status": "error", "message": "Файл не передан (ожидается поле file)."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        if extension not in FEED_FORMATS:
+            return Response(
+                {"status": "error",
+                 "message": f"Неподдерживаемый формат файла. Допустимые расширения: {', '.join(FEED_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        source_hash = getattr(uploaded_file, "sha256", None)
+        if source_hash is None: # Файл разобран другим обработчиком загрузки
+            digest = hashlib.sha256()
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+            source_hash = digest.hexdigest()
+
+        if source_hash == shop.source_hash:
+            return Response(
+                {"status": "unchanged", "source_hash": source_hash,
+                 "message": f"Файл совпадает с последним импортом магазина {shop.name}, импорт не требуется."},
+                status=status.HTTP_200_OK
+            )
+
+        task_id = uuid()
+        holder = reserve_shop_import(shop.id, task_id)
+        if holder != task_id:
+            # Файл не сохраняем: выполняющийся импорт читает прежний файл источника
+            return Response(
+                {"status": "error", "task_id": holder, "already_running": True,
+                 "message": f"Импорт магазина {shop.name} уже выполняется, повторите загрузку после него."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            source_file = store_feed_file(shop.id, uploaded_file, source_hash, extension)
+            Shop.objects.filter(id=shop.id).update(source_file=source_file)
+            import_shop_data_task.apply_async(args=(shop.id, source_file), task_id=task_id)
+        except Exception:
+            release_shop_import(shop.id, task_id)
+            raise
 
         return Response(
-            {"task_id": task.id, "message": f"Импорт магазина {shop.name} начат."},
+            {"status": "accepted", "task_id": task_id, "source_file": source_file, "source_hash": source_hash,
+             "already_running": False, "message": f"Файл сохранён, импорт магазина {shop.name} начат."},
             status=status.HTTP_202_ACCEPTED
         )
 
@@ -54,7 +189,12 @@ class GetImportStatusView(APIView):
 
     def get(self, request, task_id, *args, **kwargs):
         task_result = AsyncResult(task_id)
-        
+
+        if task_result.state == "SUCCESS" and isinstance(task_result.result, dict) \
+                and "group_id" in task_result.result:
+            # Задача импорта всех магазинов запустила подзадачи — собираем их общий статус
+            return Response(self.get_group_status(task_result.result))
+
         if task_result.state == "PENDING": # Если задача еще не запущена
             response = {
                 "state": task_result.state,
@@ -63,7 +203,9 @@ class GetImportStatusView(APIView):
         elif task_result.state == "PROGRESS": # Если задача выполняется
             response = {
                 "state": task_result.state,
-                "status": "Задача выполняется..."
+                "status": "Задача выполняется...",
+                # Обработано/всего записей, текущая категория, скорость и ETA
+                "progress": task_result.info if isinstance(task_result.info, dict) else None,
             }
         elif task_result.state == "SUCCESS": # Если задача завершена успешно
             response = {
@@ -83,5 +225,54 @@ class GetImportStatusView(APIView):
                 "status": str(task_result.info),
             }
 
+        # Аренда импорта магазина, которую захватила задача (shop_id, владелец, оставшееся время)
+        lock = get_task_import_lock(task_id)
+        if lock is not None:
+            response["lock"] = lock
+
         return Response(response)
 
+    @staticmethod
+    def get_group_status(fan_out: dict) -> dict:
+        """Сводный статус параллельного импорта: прогресс подзадач и отчёт callback-задачи."""
+        group_result = GroupResult.restore(fan_out["group_id"])
+        subtasks = group_result.results if group_result else []
+        progress = {
+            "total": len(subtasks),
+            "completed": sum(1 for subtask in subtasks if subtask.ready()),
+            "failed": sum(1 for subtask in subtasks if subtask.failed()),
+        }
+
+        callback_result = AsyncResult(fan_out["callback_task_id"])
+        if callback_result.state == "SUCCESS":
+            return {
+                "state": callback_result.state,
+                "status": "Задача завершена успешно",
+                "progress": progress,
+                "message": callback_result.result,
+            }
+        if callback_result.state == "FAILURE":
+            return {
+                "state": callback_result.state,
+                "status": "Задача завершена с ошибкой",
+                "progress": progress,
+                "message": str(callback_result.info),
+            }
+        return {
+            "state": "PROGRESS",
+            "status": f"Импорт магазинов выполняется: {progress['completed']} из {progress['total']}",
+            "progress": progress,
+        }
+
+
+# --- API View-класс для метрик кэша ---
+class CacheMetricsView(APIView):
+    """
+    API View для мониторинга кэша: состояние выключателя Redis, бюджеты операций
+    и заполненность кэша страниц в памяти процесса.
+    GET /api/v1/cache-metrics/
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({**cache_metrics(), "local_product_list_cache": local_product_list_cache.stats()})
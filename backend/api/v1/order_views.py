@@ -5,6 +5,7 @@ from rest_framework.permissions import IsAuthenticated
 
 from backend.models import Cart, Contact, Order, OrderItem
 from backend.api.order_serializers import OrderSerializer
+from backend.cache_invalidation import bulk_cache_invalidation
 
 
 class ConfirmOrderView(APIView):
@@ -54,6 +55,12 @@ class ConfirmOrderView(APIView):
                 "message": "Корзина пуста!"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        # Пакетный режим: списание остатков по всем позициям — одна очистка кэша
+        with bulk_cache_invalidation():
+            return self.create_order(user, cart)
+
+    def create_order(self, user, cart):
+        """Создаёт заказ из позиций корзины и списывает остатки товаров."""
         # Создаем заказ
         order = Order.objects.create(user=user)
 
@@ -1,20 +1,28 @@
 from rest_framework import generics, filters
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response as DRFResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.cache import cache
-import json
-
-from backend.models import Product, ProductInfo
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from datetime import datetime, time
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from backend.models import Product, ProductInfo, ProductInfoHistory
 from backend.api.product_serializers import (ProductInfoListSerializer, ProductListSerializer,
-                                            ProductImageUploadSerializer)
+                                            ProductImageUploadSerializer, ProductInfoHistorySerializer,
+                                            ProductInfoHistoryBucketSerializer)
 from backend.api.filters import ProductInfoFilter
-from backend.redis_client import get_cache, set_cache
-
-
-# Время жизни кэша (Time-To-Live). Например, 10 минут.
-CACHE_TTL = 60 * 10
+from backend.catalog_cache import get_product_list, get_product_detail, etag_matches
+from backend.cache_codec import gunzip_body
+from backend.tasks import refresh_product_list_cache_task
 
 
 class ProductInfoListView(generics.ListAPIView):
@@ -59,34 +67,61 @@ class ProductInfoListView(generics.ListAPIView):
         )
     
     def list(self, request, *args, **kwargs):
-        """Формирование уникального ключа кэша"""
-        # 1. Формирование ключа кэша
-        query_params = dict(request.query_params.items())
-        query_string = json.dumps(query_params, sort_keys=True)
-        cache_key = f"product_list:{query_string}"
-
-        # 2. Попытка получения данных из Redis с помощью нашей функции
-        cached_data = get_cache(cache_key)
-
-        if cached_data:
-            print("--- CACHE HIT (redis-py): Ответ взят из Redis ---")
-            # Возвращаем данные, которые уже являются словарем/списком Python
-            return DRFResponse(
-                data=cached_data,
-                status=200,
-                content_type="application/json"
-            )
-        # 3. Если кэша нет
-        print("--- CACHE MISS: Запрос к БД ---")
-        response = super().list(request, *args, **kwargs)
+        """
+        Список из кэша Redis с защитой от лавины промахов (см. backend/catalog_cache.get_product_list).
+        Кэш хранит готовое тело ответа, поэтому попадание отдаётся без повторной сериализации,
+        а запрос с совпадающим If-None-Match получает 304 (тело записи при этом из Redis не читается).
+        """
+        query_params = request.query_params
+        entry, cache_status = get_product_list(
+            query_params,
+            render=self.render_page,
+            schedule_refresh=lambda token: refresh_product_list_cache_task.delay(query_params.urlencode(), token),
+            if_none_match=request.META.get("HTTP_IF_NONE_MATCH"),
+        )
+        print(f"--- CACHE {cache_status.upper()}: список товаров ---")
+        response = cached_page_response(request, entry)
+        response["X-Cache"] = cache_status.upper()
+        return response
 
-        # Если данные успешно получены, сохраняем их
-        if response.status_code == 200:
-            set_cache(cache_key, response.data, timeout=CACHE_TTL)
-            print("--- INFO: Данные сохранены в Redis через redis-py ---")
+    @classmethod
+    def render_page(cls, query_params) -> bytes:
+        """
+        Собирает из БД готовое тело JSON-ответа страницы списка по параметрам запроса (фильтры, поиск, сортировка).
+        Общая функция для запроса и фоновой пересборки кэша, поэтому не зависит от исходного запроса.
+        """
+        http_request = HttpRequest()
+        http_request.method = "GET"
+        http_request.GET = query_params
+        view = cls(request=Request(http_request), format_kwarg=None, args=(), kwargs={})
+        queryset = view.filter_queryset(view.get_queryset())
+        return JSONRenderer().render(view.get_serializer(queryset, many=True).data)
 
+
+def cached_page_response(request, entry: dict) -> HttpResponse:
+    """
+    HTTP-ответ из записи кэша с готовым телом (см. backend/catalog_cache.build_page_entry).
+    Совпадающий If-None-Match — 304 без тела; сжатое тело отдаётся как есть клиентам,
+    принимающим gzip, остальным — распакованным.
+    """
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and etag_matches(if_none_match, entry["etag"]):
+        response = HttpResponseNotModified()
+        response["ETag"] = entry["etag"]
         return response
-            
+
+    body = entry["body"]
+    response = HttpResponse(content_type="application/json")
+    if entry["encoding"] == "gzip":
+        if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            response["Content-Encoding"] = "gzip"
+        else:
+            body = gunzip_body(body)
+    response.content = body
+    response["ETag"] = entry["etag"]
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
 
 class ProductDetailView(generics.RetrieveAPIView):
     """
@@ -101,6 +136,79 @@ class ProductDetailView(generics.RetrieveAPIView):
     permission_classes = [AllowAny]  # Доступно всем пользователям
     lookup_field = "id"  # Поле, по которому ищем (обычно id)
 
+    def retrieve(self, request, *args, **kwargs):
+        """Карточка из кэша Redis (read-through, см. backend/catalog_cache.get_product_detail)."""
+        product_id = kwargs[self.lookup_field]
+        data, cache_status = get_product_detail(
+            product_id, render=lambda: self.get_serializer(self.get_object()).data
+        )
+        response = DRFResponse(data)
+        response["X-Cache"] = cache_status.upper()
+        return response
+
+
+class ProductInfoHistoryView(generics.ListAPIView):
+    """
+    API View для получения истории цен и остатков информации о товаре.
+    GET /api/v1/product-infos/<int:id>/history/
+    Параметры запроса: bucket (day, week, month) — агрегировать по интервалам (min/max/avg),
+    date_from, date_to — границы периода (дата или дата и время в ISO 8601).
+    """
+    permission_classes = [IsAuthenticated]  # Доступно только авторизованным пользователям
+
+    # Функции усечения даты до начала интервала
+    BUCKETS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+
+    def get_serializer_class(self):
+        if self.request.query_params.get("bucket"):
+            return ProductInfoHistoryBucketSerializer
+        return ProductInfoHistorySerializer
+
+    def get_queryset(self):
+        """Точки истории за период или их агрегаты по интервалам (по индексу product_info, recorded_at)."""
+        product_info = get_object_or_404(ProductInfo, id=self.kwargs["id"])
+        queryset = ProductInfoHistory.objects.filter(product_info=product_info)
+
+        date_from = self.parse_boundary("date_from")
+        if date_from is not None:
+            queryset = queryset.filter(recorded_at__gte=date_from)
+        date_to = self.parse_boundary("date_to", end_of_day=True)
+        if date_to is not None:
+            queryset = queryset.filter(recorded_at__lte=date_to)
+
+        bucket = self.request.query_params.get("bucket")
+        if not bucket:
+            return queryset.order_by("recorded_at")
+        if bucket not in self.BUCKETS:
+            raise ValidationError({"bucket": f"Допустимые значения: {', '.join(self.BUCKETS)}."})
+        return (
+            queryset.annotate(bucket=self.BUCKETS[bucket]("recorded_at"))
+            .values("bucket")
+            .annotate(
+                price_min=Min("price"), price_max=Max("price"), price_avg=Avg("price"),
+                price_rrc_min=Min("price_rrc"), price_rrc_max=Max("price_rrc"),
+                quantity_min=Min("quantity"), quantity_max=Max("quantity"),
+                changes=Count("id"),
+            )
+            .order_by("bucket")
+        )
+
+    def parse_boundary(self, param: str, end_of_day: bool = False):
+        """Граница периода из параметра запроса; дата без времени — начало (или конец) дня."""
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.max if end_of_day else time.min) if day else parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({param: "Ожидается дата или дата и время в формате ISO 8601."})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
 
 class ProductImageUploadView(generics.UpdateAPIView):
     """
@@ -9,8 +9,12 @@ urlpatterns = [
     path("start-import-all-shops/", api_views.StartImportAllShopsView.as_view(), name="start_import_all_shops_api_v1"),
     # URL для импорта данных конкретного магазина из YAML-файла + Celery-задача
     path("start-import-shop/<int:shop_id>/", api_views.StartImportShopView.as_view(), name="start_import_shop_api_v1"),
+    # URL для загрузки файла поставщика магазина + Celery-задача импорта
+    path("shops/<int:shop_id>/feed/", api_views.UploadShopFeedView.as_view(), name="upload_shop_feed_api_v1"),
     # URL для статуса импорта
     path("import-status/<task_id>/", api_views.GetImportStatusView.as_view(), name="get_import_status_api_v1"),
+    # URL для метрик кэша (только для администраторов)
+    path("cache-metrics/", api_views.CacheMetricsView.as_view(), name="cache_metrics_api_v1"),
 
     # URL для регистрации и аутентификации пользователя
     path("register/", auth_views.UserRegistrationAPIView.as_view(), name="user_registration_api_v1"),
@@ -19,6 +23,8 @@ urlpatterns = [
 
     # URL для просмотра списка информации о товарах
     path("product-infos/", product_views.ProductInfoListView.as_view(), name="product_info_list_api_v1"),
+    # URL для истории цен и остатков информации о товаре
+    path("product-infos/<int:id>/history/", product_views.ProductInfoHistoryView.as_view(), name="product_info_history_api_v1"),
     # URL для просмотра детальной информации о товаре
     path("products/<int:id>/", product_views.ProductDetailView.as_view(), name="product_detail_api_v1"),
 
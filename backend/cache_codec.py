@@ -0,0 +1,117 @@
+"""
+Сжатие значений кэша.
+
+Значения не меньше CACHE_COMPRESS_MIN_SIZE байт сжимаются (zlib для JSON-кэша, gzip для готовых
+тел ответов, которые отдаются клиентам как есть с Content-Encoding: gzip). Сжатое значение хранится,
+только если оно заметно меньше исходного (CACHE_COMPRESS_MIN_RATIO), иначе сжатие — лишняя работа
+при каждом чтении. Сжатые JSON-значения начинаются с заголовка ZLIB_HEADER, которого не бывает
+в начале JSON, поэтому значения, записанные раньше без сжатия, читаются как прежде.
+compression_stats считает коэффициент сжатия и затраты процессорного времени (см. cache_metrics).
+"""
+import gzip
+import os
+import threading
+import time
+import zlib
+
+
+# Значения меньше этого размера (байт) не сжимаются: выигрыш меньше затрат
+CACHE_COMPRESS_MIN_SIZE = int(os.getenv("CACHE_COMPRESS_MIN_SIZE", 1024))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", 6))
+# Сжатое значение хранится, только если оно не больше этой доли исходного
+CACHE_COMPRESS_MIN_RATIO = 0.9
+
+ZLIB_HEADER = b"\x00zlib1\x00" # Заголовок сжатого значения (версия формата 1)
+
+
+class CompressionStats:
+    """Счётчики сжатия процесса: объём до и после, процессорное время сжатия и распаковки."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters = {
+                "compressed": 0, # значений сохранено сжатыми
+                "skipped": 0, # значений сохранено без сжатия (малы или плохо сжимаются)
+                "decompressed": 0,
+                "raw_bytes": 0, # исходный размер сжатых значений
+                "stored_bytes": 0, # размер сжатых значений
+                "compress_cpu": 0.0,
+                "decompress_cpu": 0.0,
+            }
+
+    def add(self, **values) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self._counters[name] += value
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        raw_bytes = counters["raw_bytes"]
+        return {
+            "compressed": counters["compressed"],
+            "skipped": counters["skipped"],
+            "decompressed": counters["decompressed"],
+            "raw_bytes": raw_bytes,
+            "stored_bytes": counters["stored_bytes"],
+            "ratio": round(counters["stored_bytes"] / raw_bytes, 4) if raw_bytes else None,
+            "compress_cpu_ms": round(counters["compress_cpu"] * 1000, 3),
+            "decompress_cpu_ms": round(counters["decompress_cpu"] * 1000, 3),
+        }
+
+
+compression_stats = CompressionStats()
+
+
+def maybe_compress(data: bytes, compress, min_size: int = None):
+    """
+    Сжатое значение функцией compress(data) или None, если data меньше min_size
+    (по умолчанию CACHE_COMPRESS_MIN_SIZE) либо сжатие не даёт выигрыша.
+    """
+    min_size = CACHE_COMPRESS_MIN_SIZE if min_size is None else min_size
+    if len(data) < min_size:
+        compression_stats.add(skipped=1)
+        return None
+    started = time.thread_time()
+    compressed = compress(data)
+    cpu = time.thread_time() - started
+    if len(compressed) > len(data) * CACHE_COMPRESS_MIN_RATIO:
+        compression_stats.add(skipped=1, compress_cpu=cpu)
+        return None
+    compression_stats.add(compressed=1, raw_bytes=len(data), stored_bytes=len(compressed), compress_cpu=cpu)
+    return compressed
+
+
+def timed_decompress(data: bytes, decompress) -> bytes:
+    """Распаковывает data функцией decompress с учётом процессорного времени."""
+    started = time.thread_time()
+    result = decompress(data)
+    compression_stats.add(decompressed=1, decompress_cpu=time.thread_time() - started)
+    return result
+
+
+def encode_value(data: bytes) -> bytes:
+    """Значение для Redis: zlib с заголовком ZLIB_HEADER или исходные байты."""
+    compressed = maybe_compress(data, lambda raw: zlib.compress(raw, CACHE_COMPRESS_LEVEL))
+    return data if compressed is None else ZLIB_HEADER + compressed
+
+
+def decode_value(raw: bytes) -> bytes:
+    """Исходные байты значения из Redis (значения без заголовка возвращаются как есть)."""
+    if raw.startswith(ZLIB_HEADER):
+        return timed_decompress(raw[len(ZLIB_HEADER):], zlib.decompress)
+    return raw
+
+
+def gzip_body(body: bytes, min_size: int = None, level: int = CACHE_COMPRESS_LEVEL):
+    """Тело ответа, сжатое gzip (для Content-Encoding: gzip), или None, если сжимать не нужно."""
+    return maybe_compress(body, lambda raw: gzip.compress(raw, compresslevel=level, mtime=0), min_size)
+
+
+def gunzip_body(body: bytes) -> bytes:
+    """Распаковывает тело ответа для клиентов без поддержки gzip."""
+    return timed_decompress(body, gzip.decompress)
@@ -0,0 +1,218 @@
+"""
+Инвалидация кэша каталога.
+
+Обработчики сигналов и импорт не вызывают очистку Redis напрямую, а запрашивают её здесь.
+Внутри bulk_cache_invalidation() запросы не выполняются сразу, а объединяются
+в одну инвалидацию после фиксации транзакции — пакетная запись тысяч строк
+стоит одной инвалидации вместо тысячи.
+Запрос с магазинами и категориями инвалидирует только страницы с их тегами
+(см. backend/catalog_cache.py), запрос без аргументов — весь кэш списка товаров.
+После инвалидации планируется прогрев популярных страниц (schedule_product_list_warmup).
+Изменения строк ProductInfo инвалидируют страницы по магазину и ID товара
+(invalidate_product_list_cache_for_products): категории товаров в пакетном режиме
+узнаются одним запросом при выполнении отложенной инвалидации, а не запросом на строку.
+Карточки товаров инвалидируются по ID товаров (invalidate_product_detail_cache) и тоже
+объединяются в пакетном режиме в одну команду. Изменения параметров инвалидируют карточки
+по ID строк ProductInfo (invalidate_product_detail_cache_for_infos): товары строк узнаются
+одним запросом после фиксации транзакции.
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+import logging
+
+from django.db import transaction
+
+from backend.catalog_cache import (clear_product_list_cache, invalidate_product_list_tags,
+                                   claim_product_list_warmup, PRODUCT_LIST_WARM_DELAY, invalidate_product_details)
+
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def is_bulk_mode() -> bool:
+    """Выполняется ли код внутри bulk_cache_invalidation()."""
+    return getattr(_state, "depth", 0) > 0
+
+
+def invalidate_product_list_cache(shop_ids=None, category_ids=None):
+    """
+    Запрашивает инвалидацию кэша списка товаров.
+    Args:
+        shop_ids, category_ids: Магазины и категории изменившихся товаров. Если не переданы,
+            инвалидируется весь кэш (например, изменились общие для всех магазинов строки).
+    Returns:
+        В пакетном режиме инвалидация откладывается и возвращается None,
+        иначе возвращается результат clear_product_list_cache() или invalidate_product_list_tags().
+    """
+    targeted = shop_ids is not None or category_ids is not None
+    if is_bulk_mode():
+        _state.pending = True
+        if not targeted:
+            _state.pending_all = True
+        else:
+            _state.pending_shop_ids.update(shop_ids or ())
+            _state.pending_category_ids.update(category_ids or ())
+        return None
+    return apply_product_list_invalidation(shop_ids, category_ids, everything=not targeted)
+
+
+def invalidate_product_list_cache_for_products(shop_id: int, product_ids, category_ids=()):
+    """
+    Запрашивает инвалидацию страниц магазина shop_id и категорий товаров product_ids
+    (категории, которые уже известны, передаются в category_ids).
+    Категории товаров узнаются одним запросом, в пакетном режиме — только при выполнении
+    отложенной инвалидации. Если товара уже нет в БД, инвалидируется весь кэш.
+    Returns:
+        None в пакетном режиме, иначе результат invalidate_product_list_cache().
+    """
+    if is_bulk_mode():
+        _state.pending = True
+        _state.pending_shop_ids.add(shop_id)
+        _state.pending_category_ids.update(category_ids)
+        _state.pending_category_product_ids.update(product_ids)
+        return None
+    category_ids = set(category_ids)
+    if product_ids:
+        product_category_ids = resolve_product_category_ids(product_ids)
+        if product_category_ids is None:
+            return invalidate_product_list_cache()
+        category_ids |= product_category_ids
+    return invalidate_product_list_cache(shop_ids=[shop_id], category_ids=category_ids)
+
+
+def resolve_product_category_ids(product_ids):
+    """Категории товаров product_ids одним запросом или None, если какого-то товара уже нет в БД."""
+    from backend.models import Product # models импортируется позже этого модуля при загрузке приложений
+
+    product_ids = set(product_ids)
+    rows = Product.objects.filter(id__in=product_ids).values_list("id", "category_id")
+    category_ids = {category_id for _, category_id in rows}
+    return category_ids if len(rows) == len(product_ids) else None
+
+
+def invalidate_product_detail_cache(product_ids):
+    """
+    Запрашивает инвалидацию карточек указанных товаров.
+    Returns:
+        В пакетном режиме инвалидация откладывается и возвращается None,
+        иначе возвращается результат invalidate_product_details().
+    """
+    if is_bulk_mode():
+        _state.pending_product_ids.update(product_ids)
+        return None
+    return invalidate_product_details(product_ids)
+
+
+def invalidate_product_detail_cache_for_infos(product_info_ids):
+    """
+    Запрашивает инвалидацию карточек товаров, которым принадлежат строки ProductInfo product_info_ids
+    (например, у строки изменили или удалили параметр). Товары строк узнаются одним запросом
+    после фиксации транзакции, в пакетном режиме — одним запросом на всю пачку.
+    """
+    if is_bulk_mode():
+        _state.pending_product_info_ids.update(product_info_ids)
+        return
+    transaction.on_commit(partial(apply_product_info_detail_invalidation, set(product_info_ids)))
+
+
+def resolve_product_info_product_ids(product_info_ids) -> set:
+    """Товары строк ProductInfo одним запросом; строки, которых уже нет в БД, пропускаются."""
+    from backend.models import ProductInfo # models импортируется позже этого модуля при загрузке приложений
+
+    return set(ProductInfo.objects.filter(id__in=product_info_ids).order_by().values_list("product_id", flat=True))
+
+
+def apply_product_info_detail_invalidation(product_info_ids):
+    """
+    Инвалидирует карточки товаров строк product_info_ids.
+    Строки, удалённые вместе с параметрами, пропускаются: их карточки инвалидирует сигнал ProductInfo.
+    """
+    product_ids = resolve_product_info_product_ids(product_info_ids)
+    if product_ids:
+        return invalidate_product_details(product_ids)
+    return None
+
+
+def apply_product_list_invalidation(shop_ids=(), category_ids=(), everything: bool = False):
+    """Выполняет инвалидацию (весь кэш или теги) и планирует прогрев популярных страниц."""
+    if everything:
+        result = clear_product_list_cache()
+    else:
+        result = invalidate_product_list_tags(shop_ids or (), category_ids or ())
+    schedule_product_list_warmup()
+    return result
+
+
+def schedule_product_list_warmup() -> bool:
+    """
+    Ставит задачу прогрева популярных страниц через PRODUCT_LIST_WARM_DELAY секунд.
+    Инвалидации за это время не планируют новых задач: их страницы соберёт уже запланированный прогрев.
+    """
+    if not claim_product_list_warmup():
+        return False
+    from backend.tasks import warm_product_list_cache_task # tasks импортирует этот модуль
+
+    try:
+        warm_product_list_cache_task.apply_async(countdown=PRODUCT_LIST_WARM_DELAY)
+    except Exception as err:
+        logger.error(f"Не удалось запланировать прогрев кэша списка товаров: {err}")
+        return False
+    return True
+
+
+@contextmanager
+def bulk_cache_invalidation(using=None):
+    """
+    Пакетный режим записи: запросы на инвалидацию внутри блока откладываются
+    и выполняются одной инвалидацией кэша после фиксации текущей транзакции
+    (или сразу при выходе из блока, если транзакции нет). Блоки можно вкладывать.
+    Теги и ID товаров запросов объединяются; если хотя бы один запрос был на весь кэш, очищается весь кэш.
+    """
+    outermost = not is_bulk_mode()
+    if outermost:
+        _state.pending = False
+        _state.pending_all = False
+        _state.pending_shop_ids = set()
+        _state.pending_category_ids = set()
+        _state.pending_category_product_ids = set()
+        _state.pending_product_ids = set()
+        _state.pending_product_info_ids = set()
+    _state.depth = getattr(_state, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if outermost and (_state.pending or _state.pending_product_ids or _state.pending_product_info_ids):
+            logger.debug("Отложенная инвалидация кэша каталога после пакетной записи.")
+            transaction.on_commit(
+                partial(
+                    apply_bulk_invalidation, _state.pending, _state.pending_all,
+                    _state.pending_shop_ids, _state.pending_category_ids, _state.pending_product_ids,
+                    _state.pending_category_product_ids, _state.pending_product_info_ids,
+                ),
+                using=using,
+            )
+            _state.pending = False
+
+
+def apply_bulk_invalidation(pending_list: bool, everything: bool, shop_ids: set, category_ids: set, product_ids: set,
+                            category_product_ids: set = frozenset(), product_info_ids: set = frozenset()):
+    """
+    Выполняет инвалидации, накопленные в пакетном режиме, одним обработчиком после фиксации транзакции.
+    Категории товаров category_product_ids и товары строк product_info_ids узнаются здесь одним запросом каждые.
+    """
+    if product_info_ids:
+        product_ids = product_ids | resolve_product_info_product_ids(product_info_ids)
+    if product_ids:
+        invalidate_product_details(product_ids)
+    if pending_list and not everything and category_product_ids:
+        product_category_ids = resolve_product_category_ids(category_product_ids)
+        if product_category_ids is None:
+            everything = True
+        else:
+            category_ids = category_ids | product_category_ids
+    if pending_list:
+        apply_product_list_invalidation(shop_ids, category_ids, everything=everything)
@@ -0,0 +1,729 @@
+"""
+Кэш списка товаров с поколениями (generation) и тегами.
+
+Ключ записи содержит номер текущего поколения и версии её тегов:
+product_list:<поколение>:<тег>=<версия>,...:<параметры запроса>.
+Тег описывает, какие товары может содержать страница: shop:<id> — страница отфильтрована
+по магазину, category:<id> — по категории, all — остальные страницы (без этих фильтров).
+
+Инвалидация не ищет и не удаляет ключи (без KEYS/SCAN по базе), поэтому её цена
+не зависит от количества закэшированных вариантов запроса:
+- весь кэш — один INCR счётчика поколения;
+- изменения товаров магазина S в категориях C — INCR тегов shop:S, category:C и all;
+  страницы, отфильтрованные по другим магазинам и категориям, остаются в кэше.
+После INCR читатели строят ключи с новыми версиями, а старые записи больше не читаются
+и удаляются Redis по истечении их TTL. Ответ, собранный по данным до инвалидации,
+записывается под старым ключом и тоже не будет прочитан.
+
+Защита от лавины промахов (см. get_product_list):
+- запись хранит время свежести (soft TTL); устаревшая запись отдаётся, пока одна
+  фоновая задача пересобирает её (stale-while-revalidate);
+- пересобирает страницу только владелец блокировки product_list:lock:<параметры> (single-flight),
+  остальные запросы получают последнюю версию страницы (даже инвалидированную)
+  или недолго ждут, пока владелец её запишет.
+
+В кэше хранится готовое тело JSON-ответа (при большом размере — сжатое gzip) с ETag:
+попадание отдаётся клиенту без разбора и повторной сериализации, а запрос с совпадающим
+If-None-Match получает 304 без тела. Заголовок записи (ETag и время свежести) дублируется
+под отдельным ключом <ключ записи>:header, поэтому для 304 тело из Redis не читается.
+
+Перед Redis стоит LRU-кэш в памяти процесса (local_product_list_cache): горячие страницы
+отдаются без сетевых запросов. Его согласованность с Redis обеспечивают
+ключи с версиями: версии берутся из снимка в памяти (version_snapshot, не больше
+PRODUCT_LIST_VERSION_MAX_KEYS счётчиков), нужные счётчики которого перечитываются
+одним MGET не чаще раза в PRODUCT_LIST_VERSION_MAX_AGE секунд, поэтому после инвалидации
+другой процесс отдаёт старую страницу не дольше этого интервала. Без Redis (нет общих версий)
+кэш процесса не используется.
+
+Популярность вариантов запроса копится в отсортированном множестве product_list:popular
+(счётчики процесса отправляются пачкой, веса затухают с периодом полураспада
+PRODUCT_LIST_POPULARITY_HALF_LIFE). После инвалидации warm_product_list заранее собирает
+самые популярные страницы, чтобы первые после импорта запросы не шли в БД.
+
+Карточка товара кэшируется отдельно под ключом product_detail:<id> (read-through, get_product_detail)
+и удаляется только для изменившихся товаров (invalidate_product_details).
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from django.db import connections
+from django.http import QueryDict
+from django.utils.http import parse_etags
+
+from backend import redis_client
+from backend.cache_codec import CACHE_COMPRESS_MIN_SIZE, CACHE_COMPRESS_LEVEL, gzip_body
+from backend.local_cache import LocalLRUCache, VersionSnapshot, IdSnapshot, HitCounter
+
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_LIST_PREFIX = "product_list"
+
+# Счётчик поколения кэша списка товаров (без TTL: сброс счётчика вернул бы старые поколения)
+PRODUCT_LIST_GENERATION_KEY = f"{PRODUCT_LIST_PREFIX}:generation"
+# Версия тега: product_list:tag:<тег> (без TTL по той же причине)
+PRODUCT_LIST_TAG_PREFIX = f"{PRODUCT_LIST_PREFIX}:tag"
+
+# Тег страниц, не отфильтрованных ни по магазину, ни по категории
+ALL_TAG = "all"
+
+# Как часто (секунды) процесс перечитывает версии из Redis; 0 — при каждом запросе
+PRODUCT_LIST_VERSION_MAX_AGE = 0.5
+# Сколько счётчиков версий хранит снимок процесса (самые давно использованные вытесняются)
+PRODUCT_LIST_VERSION_MAX_KEYS = 1024
+# Как часто (секунды) процесс может перечитать ID магазинов и категорий, встретив неизвестный ID
+PRODUCT_LIST_TAG_IDS_MAX_AGE = 60
+# Ограничения кэша страниц в памяти процесса
+PRODUCT_LIST_LOCAL_MAX_ENTRIES = 256
+PRODUCT_LIST_LOCAL_MAX_BYTES = 32 * 1024 * 1024
+
+version_snapshot = VersionSnapshot(max_age=PRODUCT_LIST_VERSION_MAX_AGE, max_keys=PRODUCT_LIST_VERSION_MAX_KEYS)
+local_product_list_cache = LocalLRUCache(
+    max_entries=PRODUCT_LIST_LOCAL_MAX_ENTRIES, max_bytes=PRODUCT_LIST_LOCAL_MAX_BYTES
+)
+
+
+def shop_tag(shop_id: int) -> str:
+    return f"shop:{shop_id}"
+
+
+def category_tag(category_id: int) -> str:
+    return f"category:{category_id}"
+
+
+def tag_version_key(tag: str) -> str:
+    return f"{PRODUCT_LIST_TAG_PREFIX}:{tag}"
+
+
+def load_shop_ids() -> list:
+    from backend.models import Shop # Кэш не зависит от моделей при импорте модуля
+
+    return Shop.objects.values_list("id", flat=True)
+
+
+def load_category_ids() -> list:
+    from backend.models import Category
+
+    return Category.objects.values_list("id", flat=True)
+
+
+# Существующие магазины и категории: теги заводятся только для них
+known_tag_ids = {
+    "shop_id": IdSnapshot(load_shop_ids, PRODUCT_LIST_TAG_IDS_MAX_AGE),
+    "category_id": IdSnapshot(load_category_ids, PRODUCT_LIST_TAG_IDS_MAX_AGE),
+}
+
+
+def product_list_tag_exists(param: str, object_id: int) -> bool:
+    """Есть ли магазин (param="shop_id") или категория (param="category_id") с таким ID."""
+    return object_id in known_tag_ids[param]
+
+
+def product_list_tags(query_params) -> list:
+    """
+    Теги страницы списка товаров по параметрам запроса (фильтры shop_id и category_id).
+    Страница без этих фильтров может содержать товары любого магазина и получает тег all.
+    Фильтр по несуществующему (или ещё не известному процессу) ID тега не получает: тег all
+    увеличивается при любой инвалидации, поэтому такая страница всё равно инвалидируется,
+    а произвольные ID из запросов не заводят счётчиков версий.
+    """
+    tags = []
+    for param, make_tag in (("shop_id", shop_tag), ("category_id", category_tag)):
+        value = query_params.get(param)
+        if value and value.isdigit() and product_list_tag_exists(param, int(value)):
+            tags.append(make_tag(int(value)))
+    return tags or [ALL_TAG]
+
+
+def fetch_versions(keys: list) -> list:
+    """Счётчики версий из Redis одним MGET (с бюджетом чтения и через выключатель кэша)."""
+    with redis_client.cache_operation() as client:
+        return client.mget(keys)
+
+
+def get_product_list_versions(tags: list):
+    """
+    Текущее поколение кэша и версии тегов из снимка процесса (см. version_snapshot):
+    запрос MGET к Redis выполняется, только если снимок устарел или в нём нет нужных тегов.
+    Returns:
+        tuple: (поколение, [версии тегов]) или None, если версии недоступны (Redis недоступен
+            или выключатель разомкнут): записи с непроверенными версиями не читаются и не пишутся.
+    """
+    if not redis_client.cache_available():
+        # Версии нельзя проверить — записи процесса и снимок не используются до восстановления Redis
+        version_snapshot.clear()
+        local_product_list_cache.clear()
+        return None
+    try:
+        generation, *versions = version_snapshot.get(
+            fetch_versions, [PRODUCT_LIST_GENERATION_KEY, *map(tag_version_key, tags)]
+        )
+    except Exception as err:
+        logger.error(f"Ошибка при чтении версий кэша списка товаров: {err}")
+        # Без актуальных версий записи процесса нельзя проверить — сбрасываем их
+        local_product_list_cache.clear()
+        return None
+    return generation, versions
+
+
+def local_cache_enabled() -> bool:
+    """Можно ли использовать кэш процесса: есть Redis и снимок версий актуален."""
+    return redis_client.is_redis_connected() and version_snapshot.healthy
+
+
+def product_list_cache_key(query_string: str, tags: list = (ALL_TAG,)):
+    """
+    Ключ кэша списка товаров для параметров запроса с текущими версиями поколения и тегов
+    или None, если версии недоступны (кэш списка товаров в этом случае не используется).
+    """
+    versions = get_product_list_versions(list(tags))
+    if versions is None:
+        return None
+    generation, versions = versions
+    tag_part = ",".join(f"{tag}={version}" for tag, version in zip(tags, versions))
+    return f"{PRODUCT_LIST_PREFIX}:{generation}:{tag_part}:{query_string}"
+
+
+def invalidate_product_list_tags(shop_ids=(), category_ids=()) -> int:
+    """
+    Инвалидирует только страницы с тегами указанных магазинов и категорий,
+    а также страницы без фильтров (тег all): INCR версий тегов одним pipeline.
+    Returns:
+        int: Количество инвалидированных тегов; 0, если Redis не подключён; -1 при ошибке.
+    """
+    if not redis_client.is_redis_connected():
+        return 0
+    tags = [ALL_TAG, *map(shop_tag, sorted(set(shop_ids))), *map(category_tag, sorted(set(category_ids)))]
+    try:
+        # Инвалидация выполняется и при разомкнутом выключателе (иначе она потеряется), но с бюджетом записи
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            pipeline = client.pipeline(transaction=False)
+            for tag in tags:
+                pipeline.incr(tag_version_key(tag))
+            versions = pipeline.execute()
+    except Exception as err:
+        logger.error(f"Ошибка при инвалидации тегов кэша списка товаров: {err}")
+        return -1
+    # Этот процесс видит свою инвалидацию сразу, не дожидаясь обновления снимка версий
+    for tag, version in zip(tags, versions):
+        version_snapshot.update(tag_version_key(tag), version)
+    logger.info(f"Кэш списка товаров инвалидирован по тегам: {', '.join(tags)}.")
+    return len(tags)
+
+
+def clear_product_list_cache() -> int:
+    """
+    Инвалидирует весь кэш списка товаров одним INCR счётчика поколения.
+    Returns:
+        int: Новый номер поколения; 0, если Redis не подключён; -1 при ошибке.
+    """
+    if not redis_client.is_redis_connected():
+        logger.error("Невозможно очистить кэш: Redis не подключен.")
+        return 0
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            generation = client.incr(PRODUCT_LIST_GENERATION_KEY)
+        version_snapshot.update(PRODUCT_LIST_GENERATION_KEY, generation)
+        logger.info(f"Кэш списка товаров инвалидирован, новое поколение: {generation}.")
+        return generation
+    except Exception as err:
+        logger.error(f"Ошибка при очистке кэша: {err}")
+        return -1
+
+
+# --- ЗАЩИТА от лавины промахов (single-flight) и stale-while-revalidate ---
+# Сколько секунд запись считается свежей (soft TTL)
+PRODUCT_LIST_FRESH_TTL = 60 * 10
+# Сколько секунд после этого запись ещё хранится и отдаётся устаревшей, пока её пересобирают
+PRODUCT_LIST_STALE_TTL = 60 * 5
+# Время жизни блокировки пересборки страницы (секунды)
+PRODUCT_LIST_LOCK_TTL = 30
+# Сколько секунд запрос без устаревшей копии ждёт, пока другой запрос пересоберёт страницу
+PRODUCT_LIST_LOCK_WAIT = 1.0
+PRODUCT_LIST_LOCK_POLL = 0.05
+
+# --- ГОТОВЫЕ тела ответов ---
+# Тела ответов не меньше этого размера (байт) хранятся сжатыми gzip; None — не сжимать
+PRODUCT_LIST_GZIP_MIN_SIZE = CACHE_COMPRESS_MIN_SIZE
+PRODUCT_LIST_GZIP_LEVEL = CACHE_COMPRESS_LEVEL
+
+# Удаляет блокировку, только если её держит указанный владелец
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def page_etag(body: bytes) -> str:
+    """Слабый ETag тела страницы: хэш содержимого (одинаков для сжатого и несжатого представления)."""
+    return f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+
+def build_page_entry(body: bytes) -> dict:
+    """
+    Запись кэша страницы: готовое тело JSON-ответа (сжатое gzip, если оно не меньше
+    PRODUCT_LIST_GZIP_MIN_SIZE и сжатие даёт выигрыш, см. backend/cache_codec.py), его ETag и время свежести.
+    """
+    entry = {"fresh_until": time.time() + PRODUCT_LIST_FRESH_TTL, "etag": page_etag(body), "encoding": "identity"}
+    compressed = None
+    if PRODUCT_LIST_GZIP_MIN_SIZE is not None:
+        compressed = gzip_body(body, PRODUCT_LIST_GZIP_MIN_SIZE, PRODUCT_LIST_GZIP_LEVEL)
+    if compressed is not None:
+        body = compressed
+        entry["encoding"] = "gzip"
+    entry["body"] = body
+    return entry
+
+
+def uncached_page_entry(body: bytes) -> dict:
+    """
+    Запись страницы, которая не сохраняется в кэш (версии недоступны): тело без сжатия,
+    чтобы не тратить время на gzip ради одного ответа.
+    """
+    return {"fresh_until": time.time(), "etag": page_etag(body), "encoding": "identity", "body": body}
+
+
+def encode_page_header(entry: dict) -> bytes:
+    """Заголовок записи кэша страницы (всё, кроме тела) в JSON."""
+    return json.dumps({key: value for key, value in entry.items() if key != "body"}).encode()
+
+
+def encode_page_entry(entry: dict) -> bytes:
+    """Значение для Redis: заголовок записи (JSON) в первой строке, затем тело как есть."""
+    return encode_page_header(entry) + b"\n" + entry["body"]
+
+
+def decode_page_entry(raw: bytes):
+    """
+    Запись кэша из значения Redis. Разбирается только заголовок, тело не копируется в объекты Python.
+    Значения старого формата (без заголовка) считаются отсутствующими.
+    """
+    header, separator, body = raw.partition(b"\n")
+    if not separator:
+        return None
+    try:
+        entry = json.loads(header)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or "etag" not in entry:
+        return None
+    entry["body"] = body
+    return entry
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Совпадает ли ETag страницы с заголовком If-None-Match (слабое сравнение)."""
+    etags = {value.removeprefix("W/") for value in parse_etags(if_none_match)}
+    return "*" in etags or etag.removeprefix("W/") in etags
+
+
+def product_list_query_string(query_params) -> str:
+    """Нормализованные параметры запроса страницы (часть ключей кэша)."""
+    return json.dumps(dict(query_params.items()), sort_keys=True)
+
+
+def latest_entry_key(query_string: str) -> str:
+    """Ключ-указатель на последнюю записанную версию страницы (для выдачи устаревшей копии)."""
+    return f"{PRODUCT_LIST_PREFIX}:latest:{query_string}"
+
+
+def rebuild_lock_key(query_string: str) -> str:
+    return f"{PRODUCT_LIST_PREFIX}:lock:{query_string}"
+
+
+def page_header_key(cache_key: str) -> str:
+    """Ключ заголовка записи страницы (ETag и время свежести без тела)."""
+    return f"{cache_key}:header"
+
+
+def read_product_list_entry(cache_key, keep_local: bool = True):
+    """
+    Запись кэша страницы (см. build_page_entry) из Redis или None.
+    С keep_local=True прочитанная запись сохраняется и в кэше процесса.
+    """
+    if not redis_client.cache_available():
+        return None
+    try:
+        with redis_client.cache_operation() as client:
+            raw = client.get(cache_key)
+    except Exception as err:
+        logger.error(f"Ошибка при получении страницы списка товаров из Redis: {err}")
+        return None
+    entry = decode_page_entry(raw) if raw else None
+    if entry is not None and keep_local and local_cache_enabled():
+        local_product_list_cache.set(cache_key, entry, len(raw))
+    return entry
+
+
+def read_product_list_header(cache_key: str):
+    """Заголовок записи кэша страницы (см. encode_page_header) из Redis без тела или None."""
+    if not redis_client.cache_available():
+        return None
+    try:
+        with redis_client.cache_operation() as client:
+            raw = client.get(page_header_key(cache_key))
+    except Exception as err:
+        logger.error(f"Ошибка при получении заголовка страницы списка товаров из Redis: {err}")
+        return None
+    try:
+        header = json.loads(raw) if raw else None
+    except ValueError:
+        return None
+    return header if isinstance(header, dict) and "etag" in header else None
+
+
+def read_stale_product_list_entry(query_string: str):
+    """Последняя записанная версия страницы, даже если её теги уже инвалидированы."""
+    if not redis_client.cache_available():
+        return None
+    try:
+        with redis_client.cache_operation() as client:
+            cache_key = client.get(latest_entry_key(query_string))
+    except Exception as err:
+        logger.error(f"Ошибка при получении устаревшей страницы списка товаров из Redis: {err}")
+        return None
+    return read_product_list_entry(cache_key, keep_local=False) if cache_key else None
+
+
+def store_product_list_entry(cache_key: str, query_string: str, body: bytes) -> dict:
+    """
+    Собирает запись кэша из готового тела ответа, сохраняет её в Redis и в кэше процесса
+    и обновляет указатель на последнюю версию страницы. Возвращает запись.
+    """
+    entry = build_page_entry(body)
+    if not redis_client.cache_available():
+        return entry
+    ttl = PRODUCT_LIST_FRESH_TTL + PRODUCT_LIST_STALE_TTL
+    raw = encode_page_entry(entry)
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.set(cache_key, raw, ex=ttl)
+            pipeline.set(page_header_key(cache_key), encode_page_header(entry), ex=ttl)
+            pipeline.set(latest_entry_key(query_string), cache_key, ex=ttl)
+            pipeline.execute()
+    except Exception as err:
+        logger.error(f"Ошибка при сохранении страницы списка товаров в Redis: {err}")
+        return entry
+    if local_cache_enabled():
+        local_product_list_cache.set(cache_key, entry, len(raw))
+    return entry
+
+
+def acquire_product_list_rebuild(query_string: str):
+    """
+    Захватывает блокировку пересборки страницы.
+    Returns:
+        str: Токен владельца или None, если страницу уже пересобирает другой запрос.
+            Без Redis блокировка не нужна и токен выдаётся всегда.
+    """
+    token = uuid.uuid4().hex
+    if not redis_client.cache_available():
+        return token
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            acquired = client.set(rebuild_lock_key(query_string), token, nx=True, ex=PRODUCT_LIST_LOCK_TTL)
+    except Exception as err:
+        logger.error(f"Ошибка при захвате блокировки пересборки страницы списка товаров: {err}")
+        return token
+    return token if acquired else None
+
+
+def release_product_list_rebuild(query_string: str, token: str) -> None:
+    """Освобождает блокировку пересборки страницы, если её держит владелец token."""
+    if not redis_client.cache_available():
+        return
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            client.eval(RELEASE_LOCK_SCRIPT, 1, rebuild_lock_key(query_string), token)
+    except Exception as err:
+        logger.error(f"Ошибка при снятии блокировки пересборки страницы списка товаров: {err}")
+
+
+def refresh_product_list(query_params, render, token: str = None) -> dict:
+    """
+    Собирает тело страницы функцией render(query_params), сохраняет его в кэш с текущими версиями тегов
+    (без версий — не сохраняет) и освобождает блокировку пересборки token. Используется
+    запросом-владельцем блокировки и фоновой задачей refresh_product_list_cache_task. Возвращает запись кэша.
+    """
+    query_string = product_list_query_string(query_params)
+    # Ключ строится до сборки: данные, собранные во время инвалидации, запишутся под старыми версиями
+    cache_key = product_list_cache_key(query_string, product_list_tags(query_params))
+    try:
+        if cache_key is None:
+            return uncached_page_entry(render(query_params))
+        return store_product_list_entry(cache_key, query_string, render(query_params))
+    finally:
+        if token:
+            release_product_list_rebuild(query_string, token)
+
+
+def get_product_list(query_params, render, schedule_refresh=None, if_none_match: str = None) -> tuple:
+    """
+    Страница списка товаров из кэша с защитой от лавины промахов.
+    Args:
+        query_params: Параметры запроса (QueryDict).
+        render (callable): Собирает из БД готовое тело JSON-ответа (bytes) по параметрам запроса.
+        schedule_refresh (callable): Ставит фоновую пересборку устаревшей записи, получает токен
+            блокировки (и обязан её освободить). Без него устаревшая запись пересобирается сразу.
+        if_none_match (str): Заголовок If-None-Match запроса. Если он совпадает с ETag свежей записи,
+            из Redis читается только заголовок записи.
+    Returns:
+        tuple: (запись кэша, статус "local" | "hit" | "stale" | "miss" | "bypass"); "local" — из кэша процесса,
+            "bypass" — версии недоступны, и страница собрана из БД без чтения и записи кэша.
+            Запись содержит body, encoding ("identity" или "gzip") и etag; для совпавшего
+            if_none_match — только заголовок без body (ответ 304).
+    """
+    query_string = product_list_query_string(query_params)
+    cache_key = product_list_cache_key(query_string, product_list_tags(query_params))
+    if cache_key is None:
+        return uncached_page_entry(render(query_params)), "bypass"
+    record_product_list_hit(query_string)
+
+    if local_cache_enabled():
+        entry = local_product_list_cache.get(cache_key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            return entry, "local"
+
+    if if_none_match:
+        # Клиент уже получил эту версию страницы — для 304 достаточно заголовка записи
+        header = read_product_list_header(cache_key)
+        if header is not None and header["fresh_until"] > time.time():
+            if etag_matches(if_none_match, header["etag"]):
+                return header, "hit"
+
+    entry = read_product_list_entry(cache_key)
+    if entry is not None:
+        if entry["fresh_until"] > time.time():
+            return entry, "hit"
+        # Запись устарела: отдаём её, а пересобирает только один запрос
+        token = acquire_product_list_rebuild(query_string)
+        if token is None:
+            return entry, "stale"
+        if schedule_refresh is not None:
+            try:
+                schedule_refresh(token)
+                return entry, "stale"
+            except Exception as err:
+                logger.error(f"Не удалось запустить фоновую пересборку страницы списка товаров: {err}")
+        return refresh_product_list(query_params, render, token), "miss"
+
+    # Записи текущей версии нет (инвалидация или первый запрос)
+    token = acquire_product_list_rebuild(query_string)
+    if token is None:
+        stale = read_stale_product_list_entry(query_string)
+        if stale is not None:
+            return stale, "stale"
+        deadline = time.monotonic() + PRODUCT_LIST_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PRODUCT_LIST_LOCK_POLL)
+            entry = read_product_list_entry(cache_key)
+            if entry is not None:
+                return entry, "hit"
+        # Владелец блокировки не успел — собираем страницу сами, не дожидаясь его
+    return refresh_product_list(query_params, render, token), "miss"
+
+
+# --- ПОПУЛЯРНОСТЬ вариантов запроса и прогрев кэша ---
+# Отсортированное множество: вариант запроса (нормализованные параметры) -> затухающий счёт обращений
+PRODUCT_LIST_POPULAR_KEY = f"{PRODUCT_LIST_PREFIX}:popular"
+# Время (unix) последнего затухания счётов
+PRODUCT_LIST_POPULAR_DECAYED_KEY = f"{PRODUCT_LIST_POPULAR_KEY}:decayed_at"
+# Ключ-флаг: прогрев уже запланирован (живёт PRODUCT_LIST_WARM_DELAY секунд)
+PRODUCT_LIST_WARM_SCHEDULED_KEY = f"{PRODUCT_LIST_PREFIX}:warm:scheduled"
+
+PRODUCT_LIST_POPULARITY_FLUSH_INTERVAL = 5.0 # Как часто (секунды) процесс отправляет счётчики обращений
+PRODUCT_LIST_POPULARITY_MAX_SIZE = 1000 # Сколько самых популярных вариантов хранится
+PRODUCT_LIST_POPULARITY_HALF_LIFE = 24 * 60 * 60 # За это время (секунды) счёт уменьшается вдвое
+PRODUCT_LIST_POPULARITY_MIN_SCORE = 0.01 # Варианты с меньшим счётом удаляются при затухании
+
+PRODUCT_LIST_WARM_TOP = int(os.getenv("PRODUCT_LIST_WARM_TOP", 20)) # Сколько популярных страниц прогревать
+PRODUCT_LIST_WARM_CONCURRENCY = int(os.getenv("PRODUCT_LIST_WARM_CONCURRENCY", 4)) # Потоков сборки страниц
+# Задержка прогрева (секунды): инвалидации за это время объединяются в один прогрев
+PRODUCT_LIST_WARM_DELAY = 10
+
+product_list_hits = HitCounter(PRODUCT_LIST_POPULARITY_FLUSH_INTERVAL)
+
+
+def record_product_list_hit(query_string: str) -> None:
+    """Учитывает обращение к варианту запроса; счётчики процесса отправляются в Redis пачкой."""
+    counts = product_list_hits.add(query_string)
+    if counts:
+        flush_product_list_hits(counts)
+
+
+def flush_product_list_hits(counts: dict) -> None:
+    """Добавляет счётчики обращений в рейтинг одним pipeline и обрезает рейтинг до PRODUCT_LIST_POPULARITY_MAX_SIZE."""
+    if not redis_client.cache_available():
+        return
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            pipeline = client.pipeline(transaction=False)
+            for query_string, count in counts.items():
+                pipeline.zincrby(PRODUCT_LIST_POPULAR_KEY, count, query_string)
+            pipeline.zremrangebyrank(PRODUCT_LIST_POPULAR_KEY, 0, -PRODUCT_LIST_POPULARITY_MAX_SIZE - 1)
+            pipeline.execute()
+    except Exception as err:
+        logger.error(f"Ошибка при сохранении популярности страниц списка товаров: {err}")
+
+
+def decay_product_list_popularity() -> float:
+    """
+    Уменьшает счёты популярности пропорционально времени с прошлого затухания
+    (вдвое за PRODUCT_LIST_POPULARITY_HALF_LIFE) и удаляет варианты, к которым давно не обращались.
+    Returns:
+        float: Применённый множитель (1.0, если затухание не выполнялось).
+    """
+    if not redis_client.cache_available():
+        return 1.0
+    now = time.time()
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            # SET ... GET атомарно: параллельный вызов увидит уже новое время и почти не изменит счёты
+            decayed_at = client.set(PRODUCT_LIST_POPULAR_DECAYED_KEY, now, get=True)
+            if decayed_at is None:
+                return 1.0
+            factor = 0.5 ** (max(now - float(decayed_at), 0) / PRODUCT_LIST_POPULARITY_HALF_LIFE)
+            pipeline = client.pipeline(transaction=True)
+            pipeline.zunionstore(PRODUCT_LIST_POPULAR_KEY, {PRODUCT_LIST_POPULAR_KEY: factor})
+            pipeline.zremrangebyscore(PRODUCT_LIST_POPULAR_KEY, "-inf", f"({PRODUCT_LIST_POPULARITY_MIN_SCORE}")
+            pipeline.execute()
+    except Exception as err:
+        logger.error(f"Ошибка при затухании популярности страниц списка товаров: {err}")
+        return 1.0
+    return factor
+
+
+def popular_product_list_queries(limit: int) -> list:
+    """Самые популярные варианты запроса (нормализованные параметры) по убыванию счёта."""
+    if limit <= 0 or not redis_client.cache_available():
+        return []
+    try:
+        with redis_client.cache_operation() as client:
+            members = client.zrevrange(PRODUCT_LIST_POPULAR_KEY, 0, limit - 1)
+    except Exception as err:
+        logger.error(f"Ошибка при чтении популярности страниц списка товаров: {err}")
+        return []
+    return [member.decode() if isinstance(member, bytes) else member for member in members]
+
+
+def claim_product_list_warmup() -> bool:
+    """Резервирует прогрев кэша: True, если за последние PRODUCT_LIST_WARM_DELAY секунд он не планировался."""
+    if not redis_client.cache_available():
+        return False # Без Redis прогревать нечего
+    try:
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            return bool(client.set(PRODUCT_LIST_WARM_SCHEDULED_KEY, 1, nx=True, ex=PRODUCT_LIST_WARM_DELAY))
+    except Exception as err:
+        logger.error(f"Ошибка при планировании прогрева кэша списка товаров: {err}")
+        return False
+
+
+def warm_product_list_page(query_string: str, render) -> str:
+    """
+    Собирает страницу варианта запроса, если её нет в кэше в текущей версии.
+    Returns:
+        str: "warmed" — собрана, "fresh" — уже в кэше, "locked" — её собирает другой запрос,
+            "skipped" — версии кэша недоступны, и собранную страницу некуда записать.
+    """
+    query_params = QueryDict(mutable=True)
+    query_params.update(json.loads(query_string))
+    cache_key = product_list_cache_key(query_string, product_list_tags(query_params))
+    if cache_key is None:
+        return "skipped"
+    entry = read_product_list_entry(cache_key, keep_local=False)
+    if entry is not None and entry["fresh_until"] > time.time():
+        return "fresh"
+    token = acquire_product_list_rebuild(query_string)
+    if token is None:
+        return "locked"
+    refresh_product_list(query_params, render, token)
+    return "warmed"
+
+
+def warm_product_list(render, limit: int = None, concurrency: int = None) -> dict:
+    """
+    Прогрев кэша: собирает limit (PRODUCT_LIST_WARM_TOP) самых популярных страниц
+    не больше чем в concurrency (PRODUCT_LIST_WARM_CONCURRENCY) потоков.
+    Returns:
+        dict: Количество страниц по результатам ("warmed", "fresh", "locked", "skipped", "errors").
+    """
+    limit = PRODUCT_LIST_WARM_TOP if limit is None else limit
+    concurrency = PRODUCT_LIST_WARM_CONCURRENCY if concurrency is None else concurrency
+    decay_product_list_popularity()
+    queries = popular_product_list_queries(limit)
+    summary = {"warmed": 0, "fresh": 0, "locked": 0, "skipped": 0, "errors": 0}
+
+    def warm(query_string: str) -> str:
+        try:
+            return warm_product_list_page(query_string, render)
+        except Exception as err:
+            logger.error(f"Ошибка при прогреве страницы списка товаров {query_string}: {err}")
+            return "errors"
+
+    def warm_in_thread(query_string: str) -> str:
+        try:
+            return warm(query_string)
+        finally:
+            connections.close_all() # Соединения с БД рабочего потока не переиспользуются
+
+    if concurrency <= 1 or len(queries) <= 1:
+        results = map(warm, queries)
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(queries))) as executor:
+            results = list(executor.map(warm_in_thread, queries))
+    for result in results:
+        summary[result] += 1
+    logger.info(f"Прогрев кэша списка товаров: {summary}.")
+    return summary
+
+
+# --- КЭШ карточки товара ---
+PRODUCT_DETAIL_PREFIX = "product_detail"
+PRODUCT_DETAIL_TTL = 60 * 10 # Время жизни карточки (секунды): ограничивает устаревание при изменениях без сигналов
+
+
+def product_detail_cache_key(product_id: int) -> str:
+    return f"{PRODUCT_DETAIL_PREFIX}:{product_id}"
+
+
+def get_product_detail(product_id: int, render) -> tuple:
+    """
+    Карточка товара из кэша (одно чтение из Redis), при промахе — render() из БД с записью в кэш.
+    Returns:
+        tuple: (данные карточки, статус "hit" | "miss").
+    """
+    cache_key = product_detail_cache_key(product_id)
+    data = redis_client.get_cache(cache_key)
+    if data is not None:
+        return data, "hit"
+    data = render()
+    redis_client.set_cache(cache_key, data, timeout=PRODUCT_DETAIL_TTL)
+    return data, "miss"
+
+
+def invalidate_product_details(product_ids) -> int:
+    """
+    Удаляет карточки указанных товаров одной командой DEL.
+    Returns:
+        int: Количество удалённых карточек; 0, если Redis не подключён; -1 при ошибке.
+    """
+    keys = [product_detail_cache_key(product_id) for product_id in sorted(set(product_ids))]
+    if not keys or not redis_client.is_redis_connected():
+        return 0
+    try:
+        # Как и инвалидация тегов, выполняется и при разомкнутом выключателе, но с бюджетом записи
+        with redis_client.cache_operation(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            deleted = client.delete(*keys)
+    except Exception as err:
+        logger.error(f"Ошибка при инвалидации карточек товаров: {err}")
+        return -1
+    logger.info(f"Кэш карточек товаров инвалидирован: {len(keys)} товаров.")
+    return deleted
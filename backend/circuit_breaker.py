@@ -0,0 +1,95 @@
+"""
+Автоматический выключатель (circuit breaker) для внешнего сервиса.
+
+- closed: запросы выполняются, подряд идущие ошибки считаются;
+- open: после failure_threshold ошибок подряд запросы не выполняются reset_timeout секунд;
+- half_open: по истечении reset_timeout пропускается один пробный запрос —
+  успех замыкает выключатель, ошибка снова размыкает его.
+"""
+import threading
+import time
+
+
+class CircuitBreaker:
+    """Выключатель с порогом ошибок подряд и пробным запросом после паузы."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Замыкает выключатель и обнуляет счётчики."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = 0.0
+            self._probe_started_at = None
+            self._counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+            self._last_error = ""
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Можно ли выполнить запрос. В состоянии half_open разрешается один пробный запрос;
+        если его результат не пришёл за reset_timeout, разрешается следующий.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_started_at = None
+            if self._state == self.HALF_OPEN and (
+                self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout
+            ):
+                self._probe_started_at = now
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._counters["successes"] += 1
+            self._consecutive_failures = 0
+            self._state = self.CLOSED
+            self._probe_started_at = None
+
+    def record_failure(self, error: Exception = None) -> None:
+        with self._lock:
+            self._counters["failures"] += 1
+            self._consecutive_failures += 1
+            self._last_error = repr(error) if error is not None else ""
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._counters["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+    def metrics(self) -> dict:
+        """Состояние и счётчики выключателя (для мониторинга)."""
+        with self._lock:
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = round(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0), 3)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": retry_in,
+                "last_error": self._last_error,
+                **self._counters,
+            }
@@ -0,0 +1,134 @@
+"""
+Хранение файлов поставщиков, загруженных через API.
+
+Загружаемый файл пишется частями во временный файл на диске (в память целиком не попадает),
+SHA-256 считается по мере получения частей. Затем файл копируется частями в хранилище
+default_storage под именем feeds/shop_<id>/<sha256>.<расширение>: одинаковое содержимое
+хранится один раз, а воркер на любом узле читает файл из общего хранилища.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+logger = logging.getLogger(__name__)
+
+# Каталог хранилища для файлов поставщиков
+FEED_UPLOAD_DIR = "feeds"
+# Каталог хранилища для частей импорта по частям
+FEED_CHUNK_DIR = f"{FEED_UPLOAD_DIR}/chunks"
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемый файл во временный файл на диске и считает его SHA-256
+    по мере получения частей. Хэш доступен в атрибуте sha256 загруженного файла.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.digest.hexdigest()
+        return uploaded_file
+
+
+def feed_storage_name(shop_id: int, source_hash: str, extension: str) -> str:
+    """Имя файла поставщика в хранилище: по хэшу содержимого, чтобы одинаковые файлы не дублировались."""
+    return f"{FEED_UPLOAD_DIR}/shop_{shop_id}/{source_hash}{extension.lower()}"
+
+
+def store_feed_file(shop_id: int, uploaded_file, source_hash: str, extension: str) -> str:
+    """
+    Сохраняет загруженный файл в хранилище (копирование частями) и возвращает его имя.
+    Если файл с таким содержимым уже сохранён, он не копируется повторно.
+    """
+    name = feed_storage_name(shop_id, source_hash, extension)
+    if default_storage.exists(name):
+        return name
+    uploaded_file.seek(0)
+    return default_storage.save(name, uploaded_file)
+
+
+@contextmanager
+def local_feed_file(path: str):
+    """
+    Локальный путь к файлу поставщика для чтения импортом.
+    Файлы из хранилища (feeds/...) отсутствующие на локальном диске, открываются через default_storage:
+    из файлового хранилища — напрямую, из удалённого — через скачивание во временный файл.
+    Остальные пути возвращаются как есть.
+    """
+    if os.path.exists(path) or not path.startswith(f"{FEED_UPLOAD_DIR}/") or not default_storage.exists(path):
+        yield path
+        return
+
+    try:
+        storage_path = default_storage.path(path)
+    except NotImplementedError:
+        storage_path = None # Хранилище не файловое (например, S3) — скачиваем файл
+    if storage_path is not None:
+        yield storage_path
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(path)[1], delete=False) as local_file:
+        with default_storage.open(path, "rb") as stored_file:
+            shutil.copyfileobj(stored_file, local_file, 1024 * 1024)
+    logger.debug(f"Файл поставщика {path} скачан из хранилища в {local_file.name}.")
+    try:
+        yield local_file.name
+    finally:
+        os.remove(local_file.name)
+
+
+def feed_file_stat(path: str):
+    """
+    Размер и время изменения файла поставщика (size, mtime) без чтения содержимого,
+    или None, если файла нет ни на диске, ни в хранилище.
+    """
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+    if not path.startswith(f"{FEED_UPLOAD_DIR}/") or not default_storage.exists(path):
+        return None
+    try:
+        mtime = default_storage.get_modified_time(path).timestamp()
+    except NotImplementedError:
+        mtime = None # Хранилище не отдаёт время изменения — сравниваем только размер и хэш
+    return default_storage.size(path), mtime
+
+
+def store_feed_chunk(import_id: str, number: int, records: list) -> str:
+    """
+    Сохраняет записи одной части импорта в хранилище (строка JSON на запись) и возвращает имя файла.
+    Части пишет задача, один раз прочитавшая файл поставщика; воркеры читают только свою часть.
+    """
+    content = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    return default_storage.save(f"{FEED_CHUNK_DIR}/{import_id}/{number:05d}.jsonl", ContentFile(content.encode()))
+
+
+def read_feed_chunk(name: str) -> list:
+    """Записи части импорта, сохранённой store_feed_chunk (FileNotFoundError, если файла нет)."""
+    if not default_storage.exists(name):
+        raise FileNotFoundError(name)
+    with default_storage.open(name, "rb") as chunk_file:
+        return [json.loads(line) for line in chunk_file if line.strip()]
+
+
+def delete_feed_chunks(names) -> None:
+    """Удаляет файлы частей импорта из хранилища (отсутствующие пропускаются)."""
+    for name in names:
+        default_storage.delete(name)
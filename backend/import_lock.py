@@ -0,0 +1,196 @@
+"""
+Блокировка импорта магазина.
+
+На каждый магазин одновременно выполняется (или стоит в очереди) не больше одного импорта:
+задача импорта держит аренду (lease) с ограниченным временем жизни, ключ хранит ID задачи-владельца.
+Повторный запрос на импорт того же магазина получает ID уже запущенной задачи вместо новой.
+Аренда хранится в Redis, а если он недоступен — в памяти процесса (тесты, локальный запуск).
+"""
+import threading
+import time
+import logging
+
+from backend import redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# Время жизни аренды (в секундах); задача продлевает её, пока публикует прогресс
+IMPORT_LOCK_TTL = 15 * 60
+
+IMPORT_LOCK_PREFIX = "import_lock"
+
+
+def shop_lock_key(shop_id: int) -> str:
+    """Ключ аренды импорта магазина: хранит ID задачи-владельца."""
+    return f"{IMPORT_LOCK_PREFIX}:shop:{shop_id}"
+
+
+def task_lock_key(task_id: str) -> str:
+    """Обратный ключ: по ID задачи находит магазин, аренду которого она держит."""
+    return f"{IMPORT_LOCK_PREFIX}:task:{task_id}"
+
+
+# --- ХРАНИЛИЩА аренды ---
+class RedisLockStore:
+    """Аренда в Redis: проверка владельца и запись выполняются атомарно Lua-скриптами."""
+
+    # Захватывает свободную аренду или продлевает свою; возвращает ID владельца
+    RESERVE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current and current ~= ARGV[1] then
+        return current
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[2])
+    return ARGV[1]
+    """
+
+    # Удаляет аренду, только если её держит указанная задача
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        redis.call('DEL', KEYS[1], KEYS[2])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def reserve(self, shop_id: int, task_id: str, ttl: int) -> str:
+        holder = self.client.eval(
+            self.RESERVE_SCRIPT, 2, shop_lock_key(shop_id), task_lock_key(task_id), task_id, ttl, shop_id
+        )
+        return holder.decode() # Клиент возвращает bytes (decode_responses=False)
+
+    def release(self, shop_id: int, task_id: str) -> bool:
+        return bool(self.client.eval(self.RELEASE_SCRIPT, 2, shop_lock_key(shop_id), task_lock_key(task_id), task_id))
+
+    def get(self, shop_id: int) -> tuple:
+        pipeline = self.client.pipeline()
+        pipeline.get(shop_lock_key(shop_id))
+        pipeline.ttl(shop_lock_key(shop_id))
+        holder, ttl = pipeline.execute()
+        if holder is None:
+            return None, None
+        return holder.decode(), ttl
+
+    def get_task_shop(self, task_id: str):
+        shop_id = self.client.get(task_lock_key(task_id))
+        return int(shop_id) if shop_id else None
+
+
+class LocalLockStore:
+    """Аренда в памяти процесса: защищает только от повторных импортов внутри одного процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (value, expires_at)
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def reserve(self, shop_id: int, task_id: str, ttl: int) -> str:
+        with self._lock:
+            entry = self._get(shop_lock_key(shop_id))
+            if entry is not None and entry[0] != task_id:
+                return entry[0]
+            expires_at = time.monotonic() + ttl
+            self._entries[shop_lock_key(shop_id)] = (task_id, expires_at)
+            self._entries[task_lock_key(task_id)] = (shop_id, expires_at)
+            return task_id
+
+    def release(self, shop_id: int, task_id: str) -> bool:
+        with self._lock:
+            entry = self._get(shop_lock_key(shop_id))
+            if entry is None or entry[0] != task_id:
+                return False
+            del self._entries[shop_lock_key(shop_id)]
+            self._entries.pop(task_lock_key(task_id), None)
+            return True
+
+    def get(self, shop_id: int) -> tuple:
+        with self._lock:
+            entry = self._get(shop_lock_key(shop_id))
+        if entry is None:
+            return None, None
+        return entry[0], max(int(entry[1] - time.monotonic()), 0)
+
+    def get_task_shop(self, task_id: str):
+        with self._lock:
+            entry = self._get(task_lock_key(task_id))
+        return entry[0] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+local_lock_store = LocalLockStore()
+
+
+def get_lock_store():
+    """Хранилище аренды: Redis, если он подключён, иначе память процесса."""
+    if redis_client.is_redis_connected():
+        return RedisLockStore(redis_client.get_redis_client())
+    return local_lock_store
+
+
+# --- ПУБЛИЧНЫЕ функции ---
+def reserve_shop_import(shop_id: int, task_id: str, ttl: int = IMPORT_LOCK_TTL) -> str:
+    """
+    Захватывает (или продлевает собственную) аренду импорта магазина для задачи task_id.
+    Returns:
+        str: ID задачи, которая держит аренду. Если он не равен task_id,
+            импорт магазина уже выполняется или стоит в очереди.
+    """
+    try:
+        return get_lock_store().reserve(shop_id, task_id, ttl)
+    except Exception as err:
+        # Недоступный Redis не должен останавливать импорт
+        logger.error(f"Ошибка при захвате блокировки импорта магазина {shop_id}: {err}")
+        return task_id
+
+
+def release_shop_import(shop_id: int, task_id: str) -> bool:
+    """Освобождает аренду импорта магазина, если её держит задача task_id."""
+    try:
+        return get_lock_store().release(shop_id, task_id)
+    except Exception as err:
+        logger.error(f"Ошибка при снятии блокировки импорта магазина {shop_id}: {err}")
+        return False
+
+
+def get_shop_import_lock(shop_id: int):
+    """Состояние аренды импорта магазина: {"shop_id", "task_id", "ttl"} или None, если она свободна."""
+    try:
+        holder, ttl = get_lock_store().get(shop_id)
+    except Exception as err:
+        logger.error(f"Ошибка при чтении блокировки импорта магазина {shop_id}: {err}")
+        return None
+    if holder is None:
+        return None
+    return {"shop_id": shop_id, "task_id": holder, "ttl": ttl}
+
+
+def get_task_import_lock(task_id: str):
+    """
+    Состояние аренды магазина, которую захватила задача task_id, или None.
+    В ответе "held" — держит ли задача аренду до сих пор.
+    """
+    try:
+        shop_id = get_lock_store().get_task_shop(task_id)
+    except Exception as err:
+        logger.error(f"Ошибка при чтении блокировки импорта задачи {task_id}: {err}")
+        return None
+    if shop_id is None:
+        return None
+    lock = get_shop_import_lock(shop_id) or {"shop_id": shop_id, "task_id": None, "ttl": None}
+    return {**lock, "held": lock["task_id"] == task_id}
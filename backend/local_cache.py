@@ -0,0 +1,190 @@
+"""
+Кэш в памяти процесса перед Redis.
+
+LocalLRUCache хранит уже разобранные записи (без сетевого запроса и json.loads при попадании)
+с ограничением по количеству записей и по суммарному размеру в байтах.
+VersionSnapshot хранит в процессе снимок общих счётчиков версий из Redis и перечитывает
+нужные счётчики одним MGET не чаще раза в max_age секунд: ключи записей строятся по этим версиям,
+поэтому инвалидация в Redis (INCR версии) видна всем процессам не позже чем через max_age.
+IdSnapshot хранит множество существующих ID, чтобы не заводить счётчики для произвольных ID из запросов.
+HitCounter копит счётчики обращений в процессе, чтобы отправлять их в Redis пачкой,
+а не отдельной командой на каждый запрос.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUCache:
+    """LRU-кэш в памяти процесса, ограниченный количеством записей и суммарным размером."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value, size: int) -> None:
+        """Сохраняет запись размером size байт, вытесняя самые давно использованные записи."""
+        if size > self.max_bytes or self.max_entries <= 0:
+            return # Запись больше всего кэша не храним
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+class VersionSnapshot:
+    """
+    Снимок счётчиков версий из Redis в памяти процесса (LRU не больше max_keys счётчиков).
+    Счётчик перечитывается, когда его значение старше max_age секунд: новые и устаревшие
+    счётчики запроса читаются одним MGET, остальные счётчики снимка при этом не читаются.
+    Счётчики, увеличенные этим процессом, обновляются в снимке немедленно (см. update).
+    """
+
+    def __init__(self, max_age: float, max_keys: int = 1024):
+        self.max_age = max_age
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._values = OrderedDict()  # key -> (версия, время чтения)
+        self.healthy = False  # последнее чтение из Redis прошло успешно
+
+    def get(self, fetch, keys: list) -> list:
+        """
+        Версии указанных счётчиков; fetch(keys) читает значения из Redis одним MGET.
+        Ошибки Redis пробрасываются вызывающему коду (снимок при этом помечается неисправным).
+        """
+        now = time.monotonic()
+        known, to_fetch = {}, []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                item = self._values.get(key)
+                if item is None or now - item[1] >= self.max_age:
+                    to_fetch.append(key)
+                else:
+                    self._values.move_to_end(key)
+                    known[key] = item[0]
+        if not to_fetch:
+            return [known[key] for key in keys]
+
+        try:
+            values = fetch(to_fetch)
+        except Exception:
+            self.healthy = False
+            raise
+        with self._lock:
+            for key, value in zip(to_fetch, values):
+                known[key] = int(value or 0)
+                self._store(key, known[key], now)
+            self.healthy = True
+        return [known[key] for key in keys]
+
+    def update(self, key: str, value: int) -> None:
+        """Запоминает новое значение счётчика, увеличенного этим процессом."""
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                self._store(key, value, time.monotonic())
+            elif value > item[0]:
+                self._store(key, value, item[1])
+
+    def _store(self, key: str, value: int, fetched_at: float) -> None:
+        self._values[key] = (value, fetched_at)
+        self._values.move_to_end(key)
+        while len(self._values) > self.max_keys:
+            self._values.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.healthy = False
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class IdSnapshot:
+    """
+    Множество существующих ID (например, магазинов) в памяти процесса.
+    load() перечитывает его, только когда спрашивают о неизвестном ID, и не чаще раза в max_age секунд:
+    новые объекты становятся известны не позже чем через max_age.
+    """
+
+    def __init__(self, load, max_age: float):
+        self.load = load
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._ids = frozenset()
+        self._loaded_at = float("-inf")
+
+    def __contains__(self, object_id) -> bool:
+        if object_id in self._ids:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now - self._loaded_at < self.max_age:
+                return False
+            self._loaded_at = now
+        self._ids = frozenset(self.load())
+        return object_id in self._ids
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids = frozenset()
+            self._loaded_at = float("-inf")
+
+
+class HitCounter:
+    """Счётчики обращений в памяти процесса, которые отдаются на запись пачкой раз в flush_interval секунд."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._flushed_at = time.monotonic()
+
+    def add(self, key: str):
+        """
+        Учитывает обращение к key. Если с прошлого сброса прошло flush_interval секунд,
+        возвращает накопленные счётчики (и обнуляет их), иначе None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._counts[key] += 1
+            if now - self._flushed_at < self.flush_interval:
+                return None
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = now
+            return counts
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+            self._flushed_at = time.monotonic()
@@ -0,0 +1,120 @@
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from backend.models import Shop
+from backend.utils import load_shop_data, detect_feed_format
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper: считает SQL-запросы, выполненные через соединение."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def process_peak_rss_mb() -> float:
+    """Пиковый RSS процесса с его запуска (МБ): ru_maxrss в килобайтах на Linux и в байтах на macOS."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет производительность импорта файлов поставщиков (YAML, JSON, NDJSON, CSV) через load_shop_data "
+        "на текущей БД (SQLite или PostgreSQL). Результат каждого прогона выводится "
+        "одной JSON-строкой: строк/с, число запросов, пик памяти, длительность транзакции. "
+        "Скорость замеряется без tracemalloc, память — отдельным прогоном того же импорта с откатом транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Файлы поставщиков (см. generate_catalog).")
+        parser.add_argument("--runs", type=int, default=2,
+                            help="Прогонов на файл: первый — первичный импорт, следующие — повторные.")
+        parser.add_argument("--force", action="store_true",
+                            help="Перезаписывать все строки (без проверки хэша файла и отпечатков).")
+        parser.add_argument("--streaming", choices=["auto", "on", "off"], default="auto",
+                            help="Режим чтения файла.")
+        parser.add_argument("--skip-memory", action="store_true",
+                            help="Не замерять память (без дополнительного прогона с откатом).")
+        parser.add_argument("--output", help="Дописать результаты в файл (JSON Lines) вместо stdout.")
+
+    def handle(self, *args, **options):
+        streaming = {"auto": None, "on": True, "off": False}[options["streaming"]]
+        output = open(options["output"], "a", encoding="utf-8") if options["output"] else self.stdout
+
+        try:
+            for path in options["paths"]:
+                shop, _ = Shop.objects.get_or_create(
+                    name=f"bench:{os.path.basename(path)}", defaults={"source_file": path, "state": False}
+                )
+                for run in range(1, options["runs"] + 1):
+                    result = self.measure(shop, path, run, streaming, options["force"], not options["skip_memory"])
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        finally:
+            if options["output"]:
+                output.close()
+
+    @staticmethod
+    def measure(shop: Shop, path: str, run: int, streaming, force: bool, memory: bool = True) -> dict:
+        """Выполняет один импорт и собирает метрики."""
+        # Память замеряется до основного прогона: после него неизменившийся файл уже не импортируется
+        memory_metrics = Command.measure_memory(shop, path, streaming, force) if memory else {}
+
+        counter = QueryCounter()
+        started_at = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            result = load_shop_data(shop.id, path, streaming=streaming, force=force)
+        wall_seconds = time.perf_counter() - started_at
+
+        counts = result.get("counts", {})
+        processed = sum(
+            value for counter, value in counts.get("product_infos", {}).items() if counter != "removed"
+        )
+        return {
+            "file": path,
+            "file_size_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+            "format": detect_feed_format(path),
+            "db_vendor": connection.vendor,
+            "run": run,
+            "status": result["status"],
+            "product_infos": processed,
+            "rows_per_sec": round(processed / wall_seconds, 1) if wall_seconds else None,
+            "queries": counter.count,
+            "wall_seconds": round(wall_seconds, 3),
+            "transaction_seconds": result.get("timings", {}).get("transaction_seconds"),
+            **memory_metrics,
+            "process_peak_rss_mb": round(process_peak_rss_mb(), 1),
+            "counts": counts,
+        }
+
+    @staticmethod
+    def measure_memory(shop: Shop, path: str, streaming, force: bool) -> dict:
+        """
+        Прогон того же импорта под tracemalloc с откатом транзакции: tracemalloc замедляет импорт,
+        поэтому скорость им не замеряется. rss_peak_growth_mb — на сколько прогон поднял пиковый RSS
+        процесса (0, если пик был достигнут раньше, например предыдущим прогоном).
+        """
+        rss_before = process_peak_rss_mb()
+        tracemalloc.start()
+        try:
+            with transaction.atomic():
+                load_shop_data(shop.id, path, streaming=streaming, force=force)
+                transaction.set_rollback(True)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            "peak_python_memory_mb": round(peak_bytes / (1024 * 1024), 2),
+            "rss_peak_growth_mb": round(process_peak_rss_mb() - rss_before, 1),
+        }
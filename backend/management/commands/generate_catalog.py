@@ -0,0 +1,155 @@
+import csv
+import json
+import os
+import random
+
+from django.core.management.base import BaseCommand
+
+from backend.utils import CSV_PARAMETER_PREFIX
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетические файлы поставщиков (YAML, JSON, NDJSON, CSV) заданного размера "
+        "для нагрузочного тестирования импорта."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shops", type=int, default=1, help="Количество файлов (магазинов).")
+        parser.add_argument("--categories", type=int, default=10, help="Категорий в файле.")
+        parser.add_argument("--products", type=int, default=100, help="Товаров в категории.")
+        parser.add_argument("--infos", type=int, default=5, help="Вариантов (product_infos) товара.")
+        parser.add_argument("--parameters", type=int, default=4, help="Параметров у варианта.")
+        parser.add_argument("--format", choices=["yaml", "json", "ndjson", "csv"], default="yaml",
+                            help="Формат файлов.")
+        parser.add_argument("--output-dir", default="data/generated", help="Каталог для файлов.")
+        parser.add_argument("--seed", type=int, default=42, help="Зерно генератора случайных чисел.")
+
+    def handle(self, *args, **options):
+        os.makedirs(options["output_dir"], exist_ok=True)
+        writer = getattr(self, f"write_{options['format']}")
+
+        for shop_number in range(1, options["shops"] + 1):
+            # Одинаковое зерно даёт одинаковые данные во всех форматах
+            rng = random.Random(options["seed"] + shop_number - 1)
+            path = os.path.join(options["output_dir"], f"bench_shop{shop_number}.{options['format']}")
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                rows = writer(file, shop_number, self.iter_categories(rng, options), options)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            self.stdout.write(
+                self.style.SUCCESS(f"Создан файл {path}: {rows} записей product_info, {size_mb:.1f} МБ.")
+            )
+
+    @staticmethod
+    def iter_categories(rng: random.Random, options: dict):
+        """
+        Выдаёт категории по одной (в памяти одновременно только одна категория).
+        Названия категорий, товаров и параметров общие для всех файлов, как у реальных поставщиков.
+        """
+        for category in range(options["categories"]):
+            products = []
+            for product in range(options["products"]):
+                infos = []
+                for info in range(options["infos"]):
+                    price = rng.randint(100, 100000)
+                    infos.append({
+                        "name": f"Товар {category}-{product} вариант {info}",
+                        "price": f"{price}.00",
+                        "price_rrc": f"{int(price * 1.1)}.00",
+                        "quantity": rng.randint(1, 500),
+                        "parameters": [
+                            {"name": f"Параметр {parameter}", "value": f"Значение {rng.randint(1, 50)}"}
+                            for parameter in range(options["parameters"])
+                        ],
+                    })
+                products.append({"name": f"Товар {category}-{product}", "product_infos": infos})
+            yield {
+                "name": f"Категория {category}",
+                "description": f"Синтетическая категория {category}",
+                "products": products,
+            }
+
+    @staticmethod
+    def write_yaml(file, shop_number: int, categories, options: dict) -> int:
+        """
+        Пишет YAML-файл построчно, не собирая его в памяти.
+        Строки экранируются как JSON — это корректные YAML-скаляры в двойных кавычках.
+        """
+        quote = lambda value: json.dumps(value, ensure_ascii=False)
+        rows = 0
+
+        file.write(f"name: {quote(f'bench_shop{shop_number}')}\ncategories:\n")
+        for category in categories:
+            file.write(f"  - name: {quote(category['name'])}\n")
+            file.write(f"    description: {quote(category['description'])}\n")
+            file.write("    products:\n")
+            for product in category["products"]:
+                file.write(f"      - name: {quote(product['name'])}\n")
+                file.write("        product_infos:\n")
+                for info in product["product_infos"]:
+                    file.write(f"          - name: {quote(info['name'])}\n")
+                    file.write(f"            price: {info['price']}\n")
+                    file.write(f"            price_rrc: {info['price_rrc']}\n")
+                    file.write(f"            quantity: {info['quantity']}\n")
+                    if info["parameters"]:
+                        file.write("            parameters:\n")
+                    for parameter in info["parameters"]:
+                        file.write(f"              - name: {quote(parameter['name'])}\n")
+                        file.write(f"                value: {quote(parameter['value'])}\n")
+                    rows += 1
+        return rows
+
+    @staticmethod
+    def write_json(file, shop_number: int, categories, options: dict) -> int:
+        """Пишет JSON той же структуры, что и YAML, по одной категории за раз."""
+        rows = 0
+        file.write(f'{{"name": {json.dumps(f"bench_shop{shop_number}")}, "categories": [\n')
+        for index, category in enumerate(categories):
+            if index:
+                file.write(",\n")
+            file.write(json.dumps(category, ensure_ascii=False))
+            rows += sum(len(product["product_infos"]) for product in category["products"])
+        file.write("\n]}\n")
+        return rows
+
+    @staticmethod
+    def write_ndjson(file, shop_number: int, categories, options: dict) -> int:
+        """Пишет NDJSON: одна строка на вариант товара, параметры — словарём."""
+        rows = 0
+        for category in categories:
+            for product in category["products"]:
+                for info in product["product_infos"]:
+                    file.write(json.dumps({
+                        "category": category["name"],
+                        "category_description": category["description"],
+                        "product": product["name"],
+                        "name": info["name"],
+                        "price": info["price"],
+                        "price_rrc": info["price_rrc"],
+                        "quantity": info["quantity"],
+                        "parameters": {parameter["name"]: parameter["value"] for parameter in info["parameters"]},
+                    }, ensure_ascii=False) + "\n")
+                    rows += 1
+        return rows
+
+    @staticmethod
+    def write_csv(file, shop_number: int, categories, options: dict) -> int:
+        """Пишет CSV: одна строка на вариант товара, по столбцу "param:<название>" на параметр."""
+        parameter_names = [f"Параметр {parameter}" for parameter in range(options["parameters"])]
+        writer = csv.writer(file)
+        writer.writerow([
+            "category", "category_description", "product", "info", "price", "price_rrc", "quantity",
+            *(f"{CSV_PARAMETER_PREFIX}{name}" for name in parameter_names),
+        ])
+        rows = 0
+        for category in categories:
+            for product in category["products"]:
+                for info in product["product_infos"]:
+                    values = {parameter["name"]: parameter["value"] for parameter in info["parameters"]}
+                    writer.writerow([
+                        category["name"], category["description"], product["name"], info["name"],
+                        info["price"], info["price_rrc"], info["quantity"],
+                        *(values.get(name, "") for name in parameter_names),
+                    ])
+                    rows += 1
+        return rows
@@ -0,0 +1,98 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def duplicate_groups(model, fields):
+    """Группы дублей по полям fields: (значения полей, ID оставляемой строки, ID дублей)."""
+    groups = (
+        model.objects.values(*fields).order_by()
+        .annotate(keep_id=Min("id"), rows=Count("id")).filter(rows__gt=1)
+    )
+    for group in groups:
+        values = {field: group[field] for field in fields}
+        duplicate_ids = list(model.objects.filter(**values).exclude(id=group["keep_id"]).values_list("id", flat=True))
+        yield values, group["keep_id"], duplicate_ids
+
+
+def merge_product_infos(apps, keep_id, duplicate_ids):
+    """Переносит позиции заказов, корзин и параметры дублей информации о товаре на оставляемую строку."""
+    OrderItem = apps.get_model("backend", "OrderItem")
+    CartItem = apps.get_model("backend", "CartItem")
+    ProductParameter = apps.get_model("backend", "ProductParameter")
+
+    OrderItem.objects.filter(product_info_id__in=duplicate_ids).update(product_info_id=keep_id)
+    # В корзине товар может быть только один раз: количества складываются
+    for cart_item in CartItem.objects.filter(product_info_id__in=duplicate_ids).order_by("id"):
+        kept = CartItem.objects.filter(cart_id=cart_item.cart_id, product_info_id=keep_id).first()
+        if kept is None:
+            cart_item.product_info_id = keep_id
+            cart_item.save(update_fields=["product_info"])
+        else:
+            kept.quantity += cart_item.quantity
+            kept.save(update_fields=["quantity"])
+            cart_item.delete()
+    # Параметры, которых у оставляемой строки нет, переносятся; остальные удалятся вместе с дублями
+    kept_parameter_ids = set(
+        ProductParameter.objects.filter(product_info_id=keep_id).values_list("parameter_id", flat=True)
+    )
+    for product_parameter in ProductParameter.objects.filter(product_info_id__in=duplicate_ids).order_by("id"):
+        if product_parameter.parameter_id not in kept_parameter_ids:
+            product_parameter.product_info_id = keep_id
+            product_parameter.save(update_fields=["product_info"])
+            kept_parameter_ids.add(product_parameter.parameter_id)
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Объединяет дубли, которые мог создать прежний построчный импорт (get_or_create/create),
+    чтобы уникальные ограничения ниже применились к существующей базе.
+    Остаётся строка с наименьшим ID, ссылки дублей переносятся на неё.
+    """
+    Category = apps.get_model("backend", "Category")
+    Product = apps.get_model("backend", "Product")
+    Parameter = apps.get_model("backend", "Parameter")
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+    ProductParameter = apps.get_model("backend", "ProductParameter")
+
+    # 1. Категории: товары и связи с магазинами переходят к оставляемой категории
+    for _, keep_id, duplicate_ids in duplicate_groups(Category, ["name"]):
+        Product.objects.filter(category_id__in=duplicate_ids).update(category_id=keep_id)
+        kept = Category.objects.get(id=keep_id)
+        kept.shops.add(*Category.shops.through.objects.filter(category_id__in=duplicate_ids).values_list("shop_id", flat=True))
+        Category.objects.filter(id__in=duplicate_ids).delete()
+
+    # 2. Товары и параметры
+    for _, keep_id, duplicate_ids in duplicate_groups(Product, ["name"]):
+        ProductInfo.objects.filter(product_id__in=duplicate_ids).update(product_id=keep_id)
+        Product.objects.filter(id__in=duplicate_ids).delete()
+    for _, keep_id, duplicate_ids in duplicate_groups(Parameter, ["name"]):
+        # Значение оставляемого параметра у той же информации о товаре важнее значения дубля
+        taken = ProductParameter.objects.filter(parameter_id=keep_id).values("product_info_id")
+        ProductParameter.objects.filter(parameter_id__in=duplicate_ids).exclude(product_info_id__in=taken).update(
+            parameter_id=keep_id
+        )
+        Parameter.objects.filter(id__in=duplicate_ids).delete()
+
+    # 3. Информация о товаре (дубли могли появиться и после объединения товаров)
+    for _, keep_id, duplicate_ids in duplicate_groups(ProductInfo, ["product", "shop", "name"]):
+        merge_product_infos(apps, keep_id, duplicate_ids)
+        ProductInfo.objects.filter(id__in=duplicate_ids).delete()
+
+    # 4. Значения параметров
+    for _, keep_id, duplicate_ids in duplicate_groups(ProductParameter, ["product_info", "parameter"]):
+        ProductParameter.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    """
+    Объединение дублей вынесено в отдельную миграцию: на PostgreSQL перенос внешних ключей
+    оставляет отложенные события триггеров, и ALTER TABLE в той же транзакции завершился бы ошибкой.
+    """
+
+    dependencies = [
+        ('backend', '0010_product_detail_view_product_original_image_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
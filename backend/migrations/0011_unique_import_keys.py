@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_merge_duplicate_import_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Название категории'),
+        ),
+        migrations.AlterField(
+            model_name='parameter',
+            name='name',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Название параметра'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Название товара'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productinfo',
+            unique_together={('product', 'shop', 'name')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='productparameter',
+            unique_together={('product_info', 'parameter')},
+        ),
+    ]
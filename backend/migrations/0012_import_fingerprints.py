@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_unique_import_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Отпечаток содержимого при импорте'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 файла источника; неизменившийся файл повторно не импортируется', max_length=64, verbose_name='Хэш последнего импортированного файла'),
+        ),
+    ]
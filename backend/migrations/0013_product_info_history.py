@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_import_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductInfoHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('price_rrc', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Рекомендуемая розничная цена')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество на складе')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения')),
+                ('product_info', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='backend.productinfo', verbose_name='Информация о товаре')),
+            ],
+            options={
+                'verbose_name': 'Запись истории цен',
+                'verbose_name_plural': 'История цен и остатков',
+                'ordering': ['product_info', 'recorded_at'],
+                'indexes': [models.Index(fields=['product_info', 'recorded_at'], name='product_info_history_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_product_info_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='import_interval',
+            field=models.PositiveIntegerField(default=60, help_text='Как часто проверять файл источника на изменения; 0 — не проверять', verbose_name='Интервал проверки файла (мин.)'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_check_status',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='Результат последней проверки файла'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя проверка файла'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_import_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний импорт'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_import_message',
+            field=models.TextField(blank=True, default='', verbose_name='Результат последнего импорта'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_import_status',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='Статус последнего импорта'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='source_mtime',
+            field=models.FloatField(blank=True, help_text='mtime файла при последней проверке (Unix-время)', null=True, verbose_name='Время изменения файла источника'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='source_size',
+            field=models.BigIntegerField(blank=True, help_text='Размер файла при последней проверке', null=True, verbose_name='Размер файла источника (байт)'),
+        ),
+    ]
@@ -78,6 +78,23 @@ class Shop(models.Model):
                                    verbose_name="Путь к файлу источника",
                                    help_text="Относительный путь к файлу (например, data/shop1.yaml)")
     state = models.BooleanField(default=True, verbose_name="Статус получения заказов")
+    source_hash = models.CharField(max_length=64, blank=True, default="",
+                                   verbose_name="Хэш последнего импортированного файла",
+                                   help_text="SHA-256 файла источника; неизменившийся файл повторно не импортируется")
+    # --- Плановая проверка файла источника (Celery beat, см. check_shop_feeds_task) ---
+    import_interval = models.PositiveIntegerField(default=60, verbose_name="Интервал проверки файла (мин.)",
+                                                  help_text="Как часто проверять файл источника на изменения; 0 — не проверять")
+    last_checked_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя проверка файла")
+    last_check_status = models.CharField(max_length=20, blank=True, default="",
+                                         verbose_name="Результат последней проверки файла")
+    source_size = models.BigIntegerField(null=True, blank=True, verbose_name="Размер файла источника (байт)",
+                                         help_text="Размер файла при последней проверке")
+    source_mtime = models.FloatField(null=True, blank=True, verbose_name="Время изменения файла источника",
+                                     help_text="mtime файла при последней проверке (Unix-время)")
+    last_import_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний импорт")
+    last_import_status = models.CharField(max_length=20, blank=True, default="",
+                                          verbose_name="Статус последнего импорта")
+    last_import_message = models.TextField(blank=True, default="", verbose_name="Результат последнего импорта")
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -108,7 +125,7 @@ class Shop(models.Model):
 class Category(models.Model):
     """Модель Категории товаров"""
 
-    name = models.CharField(max_length=255, verbose_name="Название категории")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название категории")
     description = models.TextField(blank=True, verbose_name="Описание категории")
     shops = models.ManyToManyField(Shop, related_name="categories", verbose_name="Магазин")
 
@@ -123,7 +140,7 @@ class Category(models.Model):
 
 class Product(models.Model):
     """Модель Товара"""
-    name = models.CharField(max_length=255, verbose_name="Название товара")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название товара")
     category = models.ForeignKey(
         Category, on_delete=models.CASCADE, related_name="products", verbose_name="Категория")
     # Поле, которое будет содержать оригинальную картинку
@@ -172,20 +189,47 @@ class ProductInfo(models.Model):
     price_rrc = models.DecimalField(
         max_digits=10, decimal_places=2, verbose_name="Рекомендуемая розничная цена")
     quantity = models.PositiveIntegerField(verbose_name="Количество на складе")
+    fingerprint = models.CharField(max_length=40, blank=True, default="", editable=False,
+                                   verbose_name="Отпечаток содержимого при импорте")
 
     class Meta:
         verbose_name = "Информация о товаре"
         verbose_name_plural = "Список информации о товарах"
         ordering = ["product__name", "shop__name", "price", "quantity"]
+        unique_together = ("product", "shop", "name")  # Ключ для пакетного upsert при импорте
 
     def __str__(self):
         return f"{self.product.name} - {self.shop.name}"
-    
+
+
+class ProductInfoHistory(models.Model):
+    """Модель Истории цен и остатков (только добавление, пишется импортом при изменении значений)"""
+
+    product_info = models.ForeignKey(
+        ProductInfo, on_delete=models.CASCADE, related_name="history", verbose_name="Информация о товаре")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
+    price_rrc = models.DecimalField(
+        max_digits=10, decimal_places=2, verbose_name="Рекомендуемая розничная цена")
+    quantity = models.PositiveIntegerField(verbose_name="Количество на складе")
+    recorded_at = models.DateTimeField(default=timezone.now, verbose_name="Дата изменения")
+
+    class Meta:
+        verbose_name = "Запись истории цен"
+        verbose_name_plural = "История цен и остатков"
+        ordering = ["product_info", "recorded_at"]
+        indexes = [
+            # Временной ряд одной информации о товаре читается по диапазону дат
+            models.Index(fields=["product_info", "recorded_at"], name="product_info_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_info_id} @ {self.recorded_at:%Y-%m-%d %H:%M}: {self.price} / {self.quantity}"
+
 
 class Parameter(models.Model):
     """Модель Параметра товара"""
 
-    name = models.CharField(max_length=255, verbose_name="Название параметра")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название параметра")
 
     class Meta:
         verbose_name = "Параметр"
@@ -209,6 +253,7 @@ class ProductParameter(models.Model):
         verbose_name = "Значение параметра товара"
         verbose_name_plural = "Список значений параметров товаров"
         ordering = ["product_info", "parameter"]
+        unique_together = ("product_info", "parameter")  # Один параметр на информацию о товаре
 
     def __str__(self):
         return f"{self.product_info.product.name} - {self.parameter.name}: {self.value}"
@@ -1,86 +1,221 @@
+"""
+Подключение к Redis (db=1): кэш каталога и аренда импорта.
+
+Клиент создаётся лениво при первом обращении (get_redis_client) поверх общего пула соединений:
+пул проверяет простаивающие соединения (health_check_interval) и переподключается после обрыва,
+поэтому каждая команда — один сетевой запрос без дополнительных SELECT/PING.
+Значения возвращаются как bytes (decode_responses=False): в одном клиенте хранятся
+и текстовые ключи, и готовые (в том числе сжатые) тела ответов.
+Если Redis недоступен при старте, is_redis_connected() повторяет подключение
+не чаще раза в REDIS_RECONNECT_INTERVAL секунд, а не отключает кэш до перезапуска процесса.
+
+Операции кэша (cache_operation) выполняются с бюджетом времени в миллисекундах и через
+автоматический выключатель redis_breaker: после серии ошибок или таймаутов Redis
+пропускается совсем (cache_available() возвращает False), и запросы идут сразу в БД,
+а не ждут таймаута сокета. Инвалидации кэша тоже выполняются с бюджетом записи, но и при
+разомкнутом выключателе, чтобы не потеряться. Проверка подключения (PING) идёт с бюджетом записи
+без повторов. Аренда импорта использует клиента с обычным таймаутом REDIS_SOCKET_TIMEOUT.
+"""
 import os
+import time
+import threading
+from contextlib import contextmanager
 import redis
+from redis.backoff import ExponentialBackoff, NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from redis.retry import Retry
 import json
 import logging
 
+from backend.circuit_breaker import CircuitBreaker
+from backend.cache_codec import encode_value, decode_value, compression_stats
+
 
 logger = logging.getLogger(__name__)
 
 REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = None
+REDIS_DB = 1
+
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5)) # Таймаут команды (секунды)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50)) # Размер пула на процесс
+REDIS_HEALTH_CHECK_INTERVAL = 30 # Соединение, простоявшее дольше (секунды), проверяется перед командой
+REDIS_RECONNECT_INTERVAL = float(os.getenv("REDIS_RECONNECT_INTERVAL", 5)) # Пауза между попытками подключения
+
+# Бюджеты операций кэша (миллисекунды): дольше ждать Redis нет смысла — быстрее прочитать БД
+REDIS_CACHE_READ_TIMEOUT_MS = int(os.getenv("REDIS_CACHE_READ_TIMEOUT_MS", 50))
+REDIS_CACHE_WRITE_TIMEOUT_MS = int(os.getenv("REDIS_CACHE_WRITE_TIMEOUT_MS", 200))
+
+# Выключатель кэша: столько ошибок подряд размыкают его на REDIS_BREAKER_RESET_TIMEOUT секунд
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 5))
+REDIS_BREAKER_RESET_TIMEOUT = float(os.getenv("REDIS_BREAKER_RESET_TIMEOUT", 10))
+
+redis_breaker = CircuitBreaker("redis_cache", REDIS_BREAKER_FAILURE_THRESHOLD, REDIS_BREAKER_RESET_TIMEOUT)
+
+_lock = threading.Lock()
+_clients = {} # бюджет в мс (None — обычный таймаут) -> клиент
+_connected = False
+_next_connect_at = 0.0
+
 
-try: 
-    redis_client = redis.Redis( # Инициализируем Redis-клиента с явными параметрами
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        password=REDIS_PASSWORD,
-        db=1,
-        decode_responses=True, # Позволяет сразу получать данные как строки (str)
-        socket_timeout=5,      # Таймаут соединения
-    )
-    # Проверяем подключение
-    redis_client.ping()
+def get_redis_client(timeout_ms: int = None) -> redis.Redis:
+    """
+    Клиент Redis процесса (создаётся при первом вызове, без сетевых запросов).
+    Args:
+        timeout_ms: Бюджет одной команды в миллисекундах (таймауты подключения и ответа,
+            без повторов). None — таймаут REDIS_SOCKET_TIMEOUT с повтором после обрыва соединения.
+            У каждого бюджета свой пул соединений.
+    """
+    client = _clients.get(timeout_ms)
+    if client is None:
+        with _lock:
+            client = _clients.get(timeout_ms)
+            if client is None:
+                if timeout_ms is None:
+                    timeout = REDIS_SOCKET_TIMEOUT
+                    # Оборванное соединение переоткрывается и команда повторяется
+                    retry = Retry(ExponentialBackoff(cap=0.5, base=0.05), 2)
+                else:
+                    timeout = timeout_ms / 1000
+                    retry = Retry(NoBackoff(), 0) # Повтор вышел бы за бюджет операции
+                pool = redis.ConnectionPool(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    password=REDIS_PASSWORD,
+                    db=REDIS_DB, # База выбирается один раз при открытии соединения
+                    decode_responses=False,
+                    socket_timeout=timeout,
+                    socket_connect_timeout=timeout,
+                    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                    max_connections=REDIS_MAX_CONNECTIONS,
+                    retry=retry,
+                    retry_on_error=[RedisConnectionError, RedisTimeoutError],
+                )
+                client = _clients[timeout_ms] = redis.Redis(connection_pool=pool)
+    return client
+
+
+def is_redis_connected() -> bool:
+    """
+    Доступен ли Redis. После первого успешного PING возвращает True без сетевых запросов
+    (переподключение выполняет пул); пока Redis недоступен, PING повторяется
+    не чаще раза в REDIS_RECONNECT_INTERVAL секунд.
+    """
+    global _connected, _next_connect_at
+    if _connected:
+        return True
+    with _lock:
+        now = time.monotonic()
+        if now < _next_connect_at:
+            return False
+        _next_connect_at = now + REDIS_RECONNECT_INTERVAL
+    try:
+        # Проверка с бюджетом записи и без повторов: недоступный Redis не задерживает запрос на REDIS_SOCKET_TIMEOUT
+        get_redis_client(REDIS_CACHE_WRITE_TIMEOUT_MS).ping()
+    except Exception as err:
+        logger.error(f"Критическая ошибка при подключении redis-py: {err}")
+        return False
     logger.info("Прямое подключение к Redis (redis-py) успешно!")
-    IS_REDIS_CONNECTED = True
-except Exception as err:
-    logger.error(f"Критическая ошибка при подключении redis-py: {err}")
-    redis_client = None
-    IS_REDIS_CONNECTED = False
+    _connected = True
+    return True
+
+
+def pipeline(transaction: bool = False, timeout_ms: int = None):
+    """Pipeline для пакета команд за один сетевой запрос."""
+    return get_redis_client(timeout_ms).pipeline(transaction=transaction)
+
 
+# --- ВЫКЛЮЧАТЕЛЬ операций кэша ---
+def cache_available() -> bool:
+    """Можно ли обращаться к Redis за кэшем: подключение есть и выключатель не разомкнут."""
+    return is_redis_connected() and redis_breaker.allow()
 
+
+@contextmanager
+def cache_operation(timeout_ms: int = REDIS_CACHE_READ_TIMEOUT_MS):
+    """
+    Клиент Redis для операции кэша с бюджетом timeout_ms.
+    Ошибка Redis внутри блока (в том числе превышение бюджета) засчитывается выключателю
+    и пробрасывается дальше, успешное завершение блока его замыкает.
+    """
+    try:
+        yield get_redis_client(timeout_ms)
+    except Exception as err:
+        redis_breaker.record_failure(err)
+        raise
+    redis_breaker.record_success()
+
+
+def cache_metrics() -> dict:
+    """Состояние выключателя, бюджеты операций и сжатие значений кэша (для мониторинга)."""
+    return {
+        "connected": _connected,
+        "breaker": redis_breaker.metrics(),
+        "compression": compression_stats.metrics(),
+        "read_timeout_ms": REDIS_CACHE_READ_TIMEOUT_MS,
+        "write_timeout_ms": REDIS_CACHE_WRITE_TIMEOUT_MS,
+    }
+
+
+# --- JSON-КЭШ ---
 def set_cache(key, data, timeout=600):
-    """Сохраняет данные (JSON-сериализует) в Redis."""
-    if not IS_REDIS_CONNECTED:
+    """Сохраняет данные (JSON-сериализует, большие значения сжимает) в Redis."""
+    if not cache_available():
         return None
     try:
-        redis_client.execute_command('SELECT 1') # Проверяем подключение явно
-        json_data = json.dumps(data) # Сериализуем данные Python в строку JSON
-        redis_client.set(key, json_data, ex=timeout) # Устанавливаем ключ и время жизни
+        json_data = encode_value(json.dumps(data).encode()) # Сериализуем данные Python в JSON и сжимаем
+        with cache_operation(REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            client.set(key, json_data, ex=timeout) # Устанавливаем ключ и время жизни
         return True
     except Exception as err:
         logger.error(f"Ошибка при сохранении данных в Redis: {err}")
         return False
-    
+
 
 def get_cache(key):
     """Получает данные из Redis (JSON-десериализует)."""
-    if not IS_REDIS_CONNECTED:
+    if not cache_available():
         return None
     try:
-        redis_client.execute_command('SELECT 1') # Проверяем БД перед чтением явно
-        json_data = redis_client.get(key)
+        with cache_operation() as client:
+            json_data = client.get(key)
         if json_data:
-            return json.loads(json_data) # Десериализуем строку JSON обратно в данные Python
+            return json.loads(decode_value(json_data)) # Распаковываем и десериализуем JSON обратно в данные Python
         return None
     except Exception as err:
         logger.error(f"Ошибка при получении данных из Redis: {err}")
         return None
- 
 
-def clear_product_list_cache():
-    """Удаляет все ключи кэша (продуктов) из базы данных №1."""
-    if not IS_REDIS_CONNECTED:
-        logger.error("Невозможно очистить кэш: Redis не подключен.")
-        return 0
+
+def get_many_cache(keys) -> dict:
+    """Получает несколько значений одним MGET; в ответе только найденные ключи."""
+    keys = list(keys)
+    if not keys or not cache_available():
+        return {}
     try:
-        # 1. Снова явно выбираем базу данных №1 (критически важно!)
-        redis_client.execute_command('SELECT 1') 
-        
-        # 2. Ищем все ключи, которые начинаются с префикса вашего кэша
-        # ВАЖНО: KEYS * может быть медленным на очень больших базах
-        keys_to_delete = redis_client.keys("product_list:*") 
-        
-        if keys_to_delete:
-            # 3. Удаляем найденные ключи
-            deleted_count = redis_client.delete(*keys_to_delete)
-            logger.info(f"Успешно удалено {deleted_count} ключей кэша продуктов.")
-            return deleted_count
-        
-        logger.info("Не найдено ключей кэша для удаления.")
-        return 0
+        with cache_operation() as client:
+            values = client.mget(keys)
+    except Exception as err:
+        logger.error(f"Ошибка при получении данных из Redis: {err}")
+        return {}
+    return {key: json.loads(decode_value(value)) for key, value in zip(keys, values) if value}
 
+
+def set_many_cache(mapping: dict, timeout=600):
+    """
+    Сохраняет несколько значений за один сетевой запрос.
+    MSET не умеет задавать TTL, поэтому используется pipeline из SET ... EX.
+    """
+    if not mapping or not cache_available():
+        return None
+    try:
+        with cache_operation(REDIS_CACHE_WRITE_TIMEOUT_MS) as client:
+            batch = client.pipeline(transaction=False)
+            for key, data in mapping.items():
+                batch.set(key, encode_value(json.dumps(data).encode()), ex=timeout)
+            batch.execute()
+        return True
     except Exception as err:
-        logger.error(f"Ошибка при очистке кэша: {err}")
-        return -1
-    
+        logger.error(f"Ошибка при сохранении данных в Redis: {err}")
+        return False
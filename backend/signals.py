@@ -1,10 +1,15 @@
 """Здесь будут сигналы Django"""
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from backend.models import Product, ProductInfo
+from backend.models import Product, ProductInfo, ProductParameter
 from backend.tasks import generate_thumbnails
 from imagekit.models import ProcessedImageField
-from backend.redis_client import clear_product_list_cache
+from backend.cache_invalidation import (invalidate_product_list_cache_for_products, invalidate_product_detail_cache,
+                                        invalidate_product_detail_cache_for_infos)
+import logging
+
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Product)
@@ -28,35 +33,57 @@ def process_product_image_async(sender, instance, created, **kwargs):
                 )
 
 
+def invalidate_product_info_cache(instance: ProductInfo):
+    """
+    Инвалидирует страницы списка товаров с тегами магазина и категории объекта ProductInfo.
+    Категория берётся из загруженного товара, иначе узнаётся по ID товара
+    (в пакетном режиме — одним запросом на всю пачку при фиксации транзакции).
+    Если товар уже удалён, инвалидируется весь кэш.
+    """
+    product = instance._state.fields_cache.get("product")
+    if product is not None:
+        return invalidate_product_list_cache_for_products(instance.shop_id, (), category_ids=[product.category_id])
+    return invalidate_product_list_cache_for_products(instance.shop_id, [instance.product_id])
+
+
 @receiver(post_save, sender=ProductInfo)
 def invalidate_product_list_cache_on_save(sender, instance, created, **kwargs):
     """
-    Очищает кэш списка продуктов после сохранения (создания или обновления) 
-    объекта ProductInfo.
+    Инвалидирует кэш страниц списка продуктов с магазином и категорией объекта ProductInfo
+    после сохранения (создания или обновления). В пакетном режиме инвалидация откладывается до фиксации транзакции.
     """
-    print("--- SIGNAL: ProductInfo.post_save сработал. Очистка кэша... ---")
-    
-    # Прямой вызов функции очистки Redis
-    deleted_count = clear_product_list_cache()
-    
-    if deleted_count > 0:
-        print(f"--- INFO: Кэш списка продуктов очищен. Удалено ключей: {deleted_count} ---")
-    else:
-        print("--- INFO: Кэш списка продуктов очищен (ключи не найдены). ---")
+    result = invalidate_product_info_cache(instance)
+    invalidate_product_detail_cache([instance.product_id])
+    if result is not None: # None — инвалидация отложена пакетным режимом
+        logger.debug(f"SIGNAL: ProductInfo.post_save: кэш списка продуктов инвалидирован, результат: {result}")
 
 
 @receiver(post_delete, sender=ProductInfo)
 def invalidate_product_list_cache_on_delete(sender, instance, **kwargs):
     """
-    Очищает кэш списка продуктов после удаления объекта ProductInfo.
+    Инвалидирует кэш страниц списка продуктов с магазином и категорией объекта ProductInfo после его удаления.
+    В пакетном режиме инвалидация откладывается до фиксации транзакции.
     """
-    print("--- SIGNAL: ProductInfo.post_delete сработал. Очистка кэша... ---")
-    
-    # Прямой вызов функции очистки Redis
-    deleted_count = clear_product_list_cache()
-    
-    if deleted_count > 0:
-        print(f"--- INFO: Кэш списка продуктов очищен. Удалено ключей: {deleted_count} ---")
-    else:
-        print("--- INFO: Кэш списка продуктов очищен (ключи не найдены). ---")
+    result = invalidate_product_info_cache(instance)
+    invalidate_product_detail_cache([instance.product_id])
+    if result is not None: # None — инвалидация отложена пакетным режимом
+        logger.debug(f"SIGNAL: ProductInfo.post_delete: кэш списка продуктов инвалидирован, результат: {result}")
 
+
+# --- ИНВАЛИДАЦИЯ кэша карточки товара ---
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail_cache_on_product_change(sender, instance, **kwargs):
+    """Удаляет из кэша карточку изменённого или удалённого товара."""
+    invalidate_product_detail_cache([instance.id])
+
+
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def invalidate_product_detail_cache_on_parameter_change(sender, instance, **kwargs):
+    """
+    Удаляет из кэша карточку товара, у которого изменился или удалён параметр.
+    Обработчик не обращается к БД: товар строки ProductInfo узнаётся одним запросом при фиксации
+    транзакции (в пакетном режиме — на все удалённые параметры сразу).
+    """
+    invalidate_product_detail_cache_for_infos([instance.product_info_id])
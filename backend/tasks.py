@@ -1,14 +1,32 @@
 """Здесь будут Celery-задачи"""
-from celery import shared_task
+from celery import shared_task, group, chord
+from celery.utils import uuid
 from django.core.mail import send_mail
 from django.conf import settings
 from django.apps import apps
+from django.db import transaction
+from django.http import QueryDict
+from django.utils import timezone
 from imagekit import registry
 from imagekit.models import ProcessedImageField
 
+from datetime import timedelta
+import logging
+import yaml
+
 from .models import Shop
-from backend.utils import load_shop_data_from_yaml
-from backend.redis_client import clear_product_list_cache
+from backend.utils import (load_shop_data, preview_shop_data, load_shop_records, detect_feed_format, open_feed_file,
+                           iter_feed_records, iter_record_chunks, merge_import_counts, file_content_hash, unchanged_file_result,
+                           sweep_stale_shop_data)
+from backend.catalog_cache import refresh_product_list, warm_product_list
+from backend.cache_invalidation import (bulk_cache_invalidation, invalidate_product_list_cache,
+                                        invalidate_product_detail_cache)
+from backend.import_lock import reserve_shop_import, release_shop_import
+from backend.feed_storage import (local_feed_file, feed_file_stat, store_feed_chunk, read_feed_chunk,
+                                  delete_feed_chunks)
+
+
+logger = logging.getLogger(__name__)
 
 
 # --- АСИНХРОННЫЕ ЗАДАЧИ для отправки email-писем ---
@@ -62,10 +80,15 @@ def send_contact_confirmation_email_task(contact_id, token):
 
 
 # --- СИНХРОННЫЕ ФУНКЦИИ ЛОГИКИ (перенесены из views.py) ---
-def import_shop_data_logic(shop_id: int, yaml_file_path: str = None) -> dict:
+def import_shop_data_logic(shop_id: int, yaml_file_path: str = None, force: bool = False,
+                           progress_callback=None, dry_run: bool = False, full_diff: bool = False) -> dict:
     """
     Синхронная логика импорта данных КОНКРЕТНОГО магазина.
     Не зависит от Celery или DRF.
+    При force=True строки перезаписываются, даже если файл не изменился.
+    progress_callback получает словарь с прогрессом импорта.
+    При dry_run=True ничего не записывается: возвращается предпросмотр изменений
+    (см. preview_shop_data), с full_diff=True — ещё и полный отчёт в хранилище.
     """
     try:
         shop = Shop.objects.get(id=shop_id)
@@ -77,26 +100,28 @@ def import_shop_data_logic(shop_id: int, yaml_file_path: str = None) -> dict:
     if yaml_file_path is None:
         yaml_file_path = shop.get_source_file_path()
     
-    # Вызываем основную функцию импорта из utils
-    return load_shop_data_from_yaml(shop_id=shop.id, yaml_file_path=yaml_file_path)
+    # Файл, загруженный через API, может лежать в общем хранилище, а не на диске воркера
+    with local_feed_file(yaml_file_path) as local_path:
+        if dry_run:
+            return preview_shop_data(shop_id=shop.id, file_path=local_path, full_diff=full_diff)
+        # Вызываем основную функцию импорта из utils (формат файла определяется по расширению)
+        return load_shop_data(
+            shop_id=shop.id, file_path=local_path, force=force, progress_callback=progress_callback
+        )
 
 
-def import_all_shops_data_logic() -> dict:
+def summarize_import_results(shop_results: list) -> dict:
     """
-    Синхронная логика для импорта данных *ВСЕХ* активных магазинов.
-    Не зависит от Celery или DRF.
+    Формирует сводный отчёт об импорте нескольких магазинов.
+    Args:
+        shop_results (list): Пары (магазин, результат import_shop_data_logic).
     """
-    shops = Shop.objects.filter(state=True) # Получаем список АКТИВНЫХ магазинов
-
     results_list = []
     success_count = 0
     error_count = 0
+    skipped_count = 0
 
-    for shop in shops:
-        yaml_file_path = shop.get_source_file_path() # Получаем путь к YAML-файлу
-
-        # Вызываем синхронную логику импорта для одного конкретного магазина
-        result = import_shop_data_logic(shop.id, yaml_file_path)
+    for shop, result in shop_results:
         if result and result.get("status") == "success": # Если импорт прошел успешно
             success_count += 1
             results_list.append({
@@ -105,6 +130,14 @@ def import_all_shops_data_logic() -> dict:
                 "status": "success",
                 "details": result.get("message", "")
             })
+        elif result and result.get("status") == "skipped": # Импорт магазина уже выполнялся другой задачей
+            skipped_count += 1
+            results_list.append({
+                "shop_id": shop.id,
+                "shop_name": shop.name,
+                "status": "skipped",
+                "details": result.get("message", "")
+            })
         else:
             # Если импорт не прошел успешно
             error_count += 1
@@ -119,25 +152,378 @@ def import_all_shops_data_logic() -> dict:
             })
     ovarall_status = "Частично успешно" if success_count > 0 and error_count > 0 \
         else ("Успешно" if success_count > 0 else "Ошибка")
+    if shop_results and skipped_count == len(shop_results):
+        ovarall_status = "Пропущено" # Все магазины уже импортировались другими задачами
+
+    summary = f"Загружено {success_count} магазинов из {len(shop_results)}, Ошибок: {error_count}"
+    if skipped_count:
+        summary += f", Пропущено (импорт уже выполняется): {skipped_count}"
 
     return {
         "overall_status": ovarall_status,
-        "summary": f"Загружено {success_count} магазинов из {len(shops)}, Ошибок: {error_count}",
+        "summary": summary,
         "results": results_list
     }
 
 
 # --- CELERY ЗАДАЧИ для импорта данных магазина/магазинов (вызывают синхронную логику) ---
-@shared_task
-def import_shop_data_task(shop_id: int, yaml_file_path: str = None) -> dict:
-    """Асинхронная Celery-задача для импорта данных ОДНОГО магазина."""
-    return import_shop_data_logic(shop_id=shop_id, yaml_file_path=yaml_file_path)
+@shared_task(bind=True)
+def import_shop_data_task(self, shop_id: int, yaml_file_path: str = None, force: bool = False,
+                          dry_run: bool = False, full_diff: bool = False) -> dict:
+    """
+    Асинхронная Celery-задача для импорта данных ОДНОГО магазина.
+    Во время импорта задача находится в состоянии PROGRESS с метаданными о прогрессе.
+    Задача держит аренду импорта магазина (см. backend/import_lock.py): если магазин
+    уже импортирует другая задача, импорт пропускается со статусом "skipped".
+    С dry_run=True задача только считает предпросмотр изменений и аренду не захватывает.
+    """
+    if dry_run:
+        return import_shop_data_logic(shop_id=shop_id, yaml_file_path=yaml_file_path, dry_run=True, full_diff=full_diff)
+
+    lock_id = self.request.id or uuid()
+    holder = reserve_shop_import(shop_id, lock_id)
+    if holder != lock_id:
+        return {
+            "status": "skipped",
+            "message": f"Импорт магазина с ID {shop_id} уже выполняется задачей {holder}.",
+            "task_id": holder,
+        }
+
+    def report_progress(progress: dict) -> None:
+        reserve_shop_import(shop_id, lock_id) # Продлеваем аренду, пока импорт идёт
+        if self.request.id: # Задача запущена через Celery, а не вызвана напрямую
+            self.update_state(state="PROGRESS", meta={"shop_id": shop_id, **progress})
+
+    try:
+        result = import_shop_data_logic(
+            shop_id=shop_id, yaml_file_path=yaml_file_path, force=force, progress_callback=report_progress
+        )
+        record_shop_import_result(shop_id, result)
+        return result
+    finally:
+        release_shop_import(shop_id, lock_id)
 
 
 @shared_task
 def import_all_shops_data_task() -> dict:
-    """Асинхронная Celery-задача для импорта данных *ВСЕХ* активных магазинов."""
-    return import_all_shops_data_logic()
+    """
+    Асинхронная Celery-задача для импорта данных *ВСЕХ* активных магазинов.
+    Запускает по подзадаче import_shop_data_task на каждый магазин (chord), чтобы магазины
+    импортировались параллельно на разных воркерах, а сводный отчёт формирует
+    задача-callback summarize_all_shops_import_task.
+    Магазины, импорт которых уже выполняется, не запускаются повторно: они возвращаются
+    в already_running с ID выполняющей задачи.
+    """
+    active_shop_ids = list(Shop.objects.filter(state=True).values_list("id", flat=True))
+    if not active_shop_ids:
+        return summarize_import_results([])
+
+    # Заранее выдаём подзадачам ID и захватываем под них аренду магазинов
+    task_ids, already_running = {}, {}
+    for shop_id in active_shop_ids:
+        task_id = uuid()
+        holder = reserve_shop_import(shop_id, task_id)
+        if holder == task_id:
+            task_ids[shop_id] = task_id
+        else:
+            already_running[shop_id] = holder
+
+    shop_ids = list(task_ids)
+    if not shop_ids:
+        # Все магазины уже импортируются — отчёт того же вида, что и у summarize_all_shops_import_task
+        shops = Shop.objects.in_bulk(already_running)
+        report = summarize_import_results([
+            (shops[shop_id], {"status": "skipped", "message": f"Импорт уже выполняется задачей {holder}."})
+            for shop_id, holder in already_running.items()
+        ])
+        return {**report, "shops_count": 0, "already_running": already_running}
+
+    header = group(import_shop_data_task.s(shop_id).set(task_id=task_ids[shop_id]) for shop_id in shop_ids)
+    try:
+        callback_result = chord(header)(summarize_all_shops_import_task.s(shop_ids))
+    except Exception:
+        for shop_id, task_id in task_ids.items():
+            release_shop_import(shop_id, task_id)
+        raise
+    callback_result.parent.save() # Сохраняем GroupResult, чтобы статус можно было собрать по group_id
+
+    return {
+        "group_id": callback_result.parent.id,
+        "callback_task_id": callback_result.id,
+        "shops_count": len(shop_ids),
+        "already_running": already_running,
+    }
+
+
+@shared_task
+def summarize_all_shops_import_task(results: list, shop_ids: list) -> dict:
+    """Callback chord-а: собирает результаты импорта магазинов в сводный отчёт."""
+    shops = Shop.objects.in_bulk(shop_ids)
+    shop_results = [
+        (shops.get(shop_id) or Shop(id=shop_id, name=f"ID {shop_id}"), result)
+        for shop_id, result in zip(shop_ids, results)
+    ]
+    return summarize_import_results(shop_results)
+
+
+# --- CELERY ЗАДАЧИ для параллельного импорта ОДНОГО большого файла по частям ---
+# Сколько записей product_info попадает в одну часть
+IMPORT_CHUNK_SIZE = 1000
+
+
+@shared_task(bind=True)
+def import_shop_data_chunked_task(self, shop_id: int, yaml_file_path: str = None,
+                                  chunk_size: int = IMPORT_CHUNK_SIZE, force: bool = False) -> dict:
+    """
+    Асинхронная Celery-задача для импорта ОДНОГО магазина по частям.
+    Файл (любого формата, см. load_shop_data) читается потоково один раз и делится на части по chunk_size записей
+    product_info; каждая часть сохраняется в общее хранилище (store_feed_chunk), а задачам import_shop_chunk_task
+    передаётся только имя её файла, поэтому ни эта задача, ни брокер не держат файл целиком. Части импортируются параллельно на разных воркерах
+    (общие категории, товары и параметры пишутся upsert-ом по уникальным ключам),
+    а finalize_chunked_import_task один раз обновляет хэш файла и очищает кэш.
+    Каждая часть фиксируется в своей транзакции: при ошибке части хэш файла
+    не сохраняется, и следующий импорт повторит работу (неизменившиеся строки пропускаются).
+    Аренду импорта магазина захватывает эта задача, а освобождает finalize_chunked_import_task.
+    """
+    try:
+        shop = Shop.objects.get(id=shop_id)
+    except Shop.DoesNotExist:
+        return {"status": "error", "message": f"Магазин с ID {shop_id} не был найден."}
+
+    lock_id = self.request.id or uuid()
+    holder = reserve_shop_import(shop_id, lock_id)
+    if holder != lock_id:
+        return {
+            "status": "skipped",
+            "message": f"Импорт магазина {shop.name} уже выполняется задачей {holder}.",
+            "task_id": holder,
+        }
+
+    if yaml_file_path is None:
+        yaml_file_path = shop.get_source_file_path()
+    chunk_names = []
+    try:
+        with local_feed_file(yaml_file_path) as local_path:
+            source_hash = file_content_hash(local_path)
+            if not force and source_hash == shop.source_hash:
+                release_shop_import(shop_id, lock_id)
+                return unchanged_file_result(shop, yaml_file_path)
+            feed_format = detect_feed_format(local_path)
+            with open_feed_file(local_path, feed_format) as file:
+                records, _ = iter_feed_records(file, feed_format, streaming=True)
+                for number, chunk in enumerate(iter_record_chunks(records, chunk_size)):
+                    chunk_names.append(store_feed_chunk(lock_id, number, chunk))
+    except FileNotFoundError:
+        delete_feed_chunks(chunk_names)
+        release_shop_import(shop_id, lock_id)
+        return {"status": "error", "message": f"Файл {yaml_file_path} не найден."}
+    except yaml.YAMLError as err:
+        delete_feed_chunks(chunk_names)
+        release_shop_import(shop_id, lock_id)
+        return {"status": "error", "message": f"Ошибка YAML: {err}"}
+    except ValueError as err: # FeedFormatError и ошибки разбора JSON
+        delete_feed_chunks(chunk_names)
+        release_shop_import(shop_id, lock_id)
+        return {"status": "error", "message": f"Неверный формат файла: {err}"}
+
+    if not chunk_names:
+        return finalize_chunked_import_task([], shop_id, yaml_file_path, source_hash, lock_id)
+
+    header = group(import_shop_chunk_task.s(shop_id, chunk_name, force, lock_id) for chunk_name in chunk_names)
+    try:
+        callback_result = chord(header)(
+            finalize_chunked_import_task.s(shop_id, yaml_file_path, source_hash, lock_id)
+        )
+    except Exception:
+        delete_feed_chunks(chunk_names)
+        release_shop_import(shop_id, lock_id)
+        raise
+    callback_result.parent.save() # Сохраняем GroupResult для GetImportStatusView
+
+    return {
+        "group_id": callback_result.parent.id,
+        "callback_task_id": callback_result.id,
+        "chunks_count": len(chunk_names),
+    }
+
+
+@shared_task
+def import_shop_chunk_task(shop_id: int, chunk_name: str, force: bool = False, lock_id: str = None) -> dict:
+    """
+    Импорт одной части файла магазина, сохранённой import_shop_data_chunked_task в хранилище.
+    Файл части удаляется после чтения. Каждая часть продлевает аренду импорта магазина.
+    """
+    if lock_id:
+        reserve_shop_import(shop_id, lock_id)
+    try:
+        records = read_feed_chunk(chunk_name)
+    except FileNotFoundError:
+        return {"status": "error", "message": f"Часть импорта {chunk_name} не найдена."}
+    finally:
+        delete_feed_chunks([chunk_name])
+    return load_shop_records(shop_id, records, force=force)
+
+
+@shared_task
+def finalize_chunked_import_task(results: list, shop_id: int, yaml_file_path: str, source_hash: str,
+                                 lock_id: str = None) -> dict:
+    """
+    Callback импорта по частям: сводит счётчики, сохраняет хэш файла, один раз очищает кэш
+    и освобождает аренду импорта магазина, захваченную задачей lock_id.
+    """
+    try:
+        result = finish_chunked_import(results, shop_id, yaml_file_path, source_hash)
+        record_shop_import_result(shop_id, result)
+        return result
+    finally:
+        if lock_id:
+            release_shop_import(shop_id, lock_id)
+
+
+def finish_chunked_import(results: list, shop_id: int, yaml_file_path: str, source_hash: str) -> dict:
+    """Сводит результаты частей импорта магазина (см. finalize_chunked_import_task)."""
+    failed = [result for result in results if result.get("status") != "success"]
+    # Части уже зафиксированы: инвалидируем кэш по их изменениям, даже если часть из них упала
+    changed_category_ids = {category_id for result in results for category_id in result.get("changed_category_ids", [])}
+    if any(result.get("changes_shared_rows") for result in results):
+        invalidate_product_list_cache()
+    elif changed_category_ids:
+        invalidate_product_list_cache(shop_ids=[shop_id], category_ids=changed_category_ids)
+    changed_product_ids = {product_id for result in results for product_id in result.get("changed_product_ids", [])}
+    if changed_product_ids:
+        invalidate_product_detail_cache(changed_product_ids)
+
+    counts = merge_import_counts([result["counts"] for result in results if "counts" in result])
+    if failed:
+        return {
+            "status": "error",
+            "message": f"Ошибка при загрузке {len(failed)} частей из {len(results)}: {failed[0].get('message')}",
+            "counts": counts,
+        }
+
+    # Все части загружены — удаляем товары, которых нет ни в одной из них
+    shop = Shop.objects.get(id=shop_id)
+    seen_info_ids = {info_id for result in results for info_id in result.get("seen_info_ids", [])}
+    seen_category_ids = {category_id for result in results for category_id in result.get("seen_category_ids", [])}
+    with bulk_cache_invalidation(), transaction.atomic():
+        removed_category_ids, removed_product_ids = set(), set()
+        removed = sweep_stale_shop_data(
+            shop, seen_info_ids, seen_category_ids,
+            changed_category_ids=removed_category_ids, changed_product_ids=removed_product_ids,
+        )
+        counts = merge_import_counts([counts, removed])
+        Shop.objects.filter(id=shop_id).update(source_hash=source_hash)
+        if removed_category_ids:
+            invalidate_product_list_cache(shop_ids=[shop_id], category_ids=removed_category_ids)
+        if removed_product_ids:
+            invalidate_product_detail_cache(removed_product_ids)
+    return {
+        "status": "success",
+        "message": f"Данные из {yaml_file_path} успешно загружены по частям ({len(results)}).",
+        "counts": counts,
+    }
+
+
+# --- ПЛАНОВАЯ ПРОВЕРКА файлов поставщиков (Celery beat) ---
+def record_shop_import_result(shop_id: int, result: dict) -> None:
+    """
+    Сохраняет в магазине время, статус и сообщение последнего импорта.
+    После неудачного импорта сбрасывается снимок размера/mtime файла,
+    чтобы следующая плановая проверка заново сравнила хэш и повторила импорт.
+    """
+    result = result or {}
+    fields = {
+        "last_import_at": timezone.now(),
+        "last_import_status": result.get("status", "error"),
+        "last_import_message": result.get("message", ""),
+    }
+    if fields["last_import_status"] == "error":
+        fields.update(source_size=None, source_mtime=None)
+    Shop.objects.filter(id=shop_id).update(**fields)
+
+
+def is_shop_feed_check_due(shop: Shop, now) -> bool:
+    """Пора ли проверять файл магазина: прошло не меньше import_interval минут с прошлой проверки."""
+    if not shop.import_interval:
+        return False
+    return shop.last_checked_at is None or now - shop.last_checked_at >= timedelta(minutes=shop.import_interval)
+
+
+def check_shop_feed(shop: Shop) -> dict:
+    """
+    Проверяет, изменился ли файл источника магазина, и при изменении ставит импорт в очередь.
+    Сначала сравниваются размер и mtime файла с сохранёнными при прошлой проверке (файл не читается),
+    и только если они отличаются — SHA-256 содержимого с хэшем последнего импорта.
+    Импорт запускается под арендой магазина (см. backend/import_lock.py), поэтому
+    уже выполняющийся импорт не дублируется.
+    Returns:
+        dict: {"status": "unchanged" | "enqueued" | "locked" | "missing" | "error", ...}
+    """
+    path = shop.get_source_file_path()
+    fields = {"last_checked_at": timezone.now()}
+    result = {"status": "unchanged"}
+
+    stat = feed_file_stat(path)
+    if stat is None:
+        result = {"status": "missing", "message": f"Файл {path} не найден."}
+    elif stat != (shop.source_size, shop.source_mtime):
+        with local_feed_file(path) as local_path:
+            source_hash = file_content_hash(local_path)
+        if source_hash == shop.source_hash:
+            # Файл перезаписан тем же содержимым — запоминаем новый размер/mtime без импорта
+            fields.update(source_size=stat[0], source_mtime=stat[1])
+        else:
+            result = enqueue_shop_import(shop, path)
+            if result["status"] == "enqueued":
+                fields.update(source_size=stat[0], source_mtime=stat[1])
+
+    fields["last_check_status"] = result["status"]
+    Shop.objects.filter(id=shop.id).update(**fields)
+    return result
+
+
+def enqueue_shop_import(shop: Shop, path: str) -> dict:
+    """Ставит в очередь import_shop_data_task для магазина, заранее захватив под неё аренду импорта."""
+    task_id = uuid()
+    holder = reserve_shop_import(shop.id, task_id)
+    if holder != task_id:
+        return {"status": "locked", "task_id": holder}
+    try:
+        import_shop_data_task.apply_async(args=(shop.id, path), task_id=task_id)
+    except Exception as err:
+        release_shop_import(shop.id, task_id)
+        logger.error(f"Не удалось поставить в очередь импорт магазина {shop.id}: {err}")
+        return {"status": "error", "message": str(err)}
+    return {"status": "enqueued", "task_id": task_id}
+
+
+@shared_task
+def check_shop_feeds_task() -> dict:
+    """
+    Периодическая задача (CELERY_BEAT_SCHEDULE): проверяет файлы активных магазинов,
+    для которых подошёл срок проверки (Shop.import_interval), и запускает импорт
+    только тех, чьи файлы изменились.
+    """
+    now = timezone.now()
+    shops = [shop for shop in Shop.objects.filter(state=True) if is_shop_feed_check_due(shop, now)]
+
+    summary = {"checked": len(shops), "enqueued": {}, "locked": {}, "missing": [], "errors": {}}
+    for shop in shops:
+        try:
+            result = check_shop_feed(shop)
+        except Exception as err:
+            # Ошибка одного магазина не должна останавливать проверку остальных
+            logger.error(f"Ошибка при проверке файла магазина {shop.id}: {err}")
+            Shop.objects.filter(id=shop.id).update(last_checked_at=timezone.now(), last_check_status="error")
+            result = {"status": "error", "message": str(err)}
+
+        if result["status"] in ("enqueued", "locked"):
+            summary[result["status"]][shop.id] = result["task_id"]
+        elif result["status"] == "missing":
+            summary["missing"].append(shop.id)
+        elif result["status"] == "error":
+            summary["errors"][shop.id] = result["message"]
+    return summary
 
 
 # --- CELERY ЗАДАЧА для генерации миниатюр ---
@@ -165,16 +551,41 @@ def generate_thumbnails(app_label: str, model_name: str, pk: int, field_name: st
 
 
 # --- CELERY ЗАДАЧИ для очистки кэша ---
+@shared_task
+def refresh_product_list_cache_task(query: str, token: str) -> str:
+    """
+    Фоновая пересборка устаревшей страницы списка товаров (stale-while-revalidate).
+    Args:
+        query (str): Параметры запроса страницы (urlencoded).
+        token (str): Токен блокировки пересборки, захваченной запросом; задача её освобождает.
+    """
+    from backend.api.v1.product_views import ProductInfoListView
+
+    refresh_product_list(QueryDict(query), ProductInfoListView.render_page, token)
+    return f"Страница списка товаров пересобрана: {query or 'без параметров'}."
+
+
+@shared_task
+def warm_product_list_cache_task(limit: int = None) -> dict:
+    """
+    Прогрев кэша после импорта или инвалидации: заранее собирает самые популярные
+    варианты списка товаров (см. backend/catalog_cache.warm_product_list).
+    """
+    from backend.api.v1.product_views import ProductInfoListView
+
+    return warm_product_list(ProductInfoListView.render_page, limit)
+
+
 @shared_task
 def clear_product_list_cache_task():
-    """Запускает очистку кэша продуктов."""
+    """Запускает очистку кэша продуктов (переход на новое поколение кэша) и прогрев популярных страниц."""
 
     # Вызываем функцию, которая уже работает с redis-py
-    result = clear_product_list_cache()
+    result = invalidate_product_list_cache()
     if result > 0:
-        return f"Успешно очищено {result} ключей кэша."
+        return f"Кэш успешно очищен, новое поколение кэша: {result}."
     elif result == 0:
-        return f"Ключи не найдены. Кэш не требует очистки."
+        return f"Redis не подключен. Кэш не очищен."
     else:
         return "Ошибка очистки кэша."
 
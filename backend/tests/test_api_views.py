@@ -1,10 +1,18 @@
+import hashlib
+import shutil
+import tempfile
+
 from django.urls import reverse
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 from backend.models import Shop
+from backend.import_lock import local_lock_store, reserve_shop_import
 
 
 User = get_user_model()
@@ -26,6 +34,10 @@ class ImportApiViewTestCase(APITestCase):
         self.start_import_shop_url = lambda shop_id: reverse("start_import_shop_api_v1", kwargs={"shop_id": shop_id}) # POST POST /api/v1/start-import-shop/<shop_id>/
         self.get_status_url = lambda task_id: reverse("get_import_status_api_v1", kwargs={"task_id": task_id}) # GET /api/v1/import-status/<task_id>/
 
+        # Аренды импорта хранятся в памяти процесса (Redis в тестах не подключён)
+        local_lock_store.clear()
+        self.addCleanup(local_lock_store.clear)
+
         # Создаём тестовый магазин
         self.shop = Shop.objects.create(
             name="Test Shop for Import",
@@ -77,8 +89,6 @@ class ImportApiViewTestCase(APITestCase):
         """
         Тест: запуск импорта КОНКРЕТНОГО магазина (аутентифицирован, ожидаем 202).
         """
-        mock_task.delay.return_value.id = "test_task_id_shop_67890" # Имитируем id задачи
-
         # Используем URL для конкретного магазина
         url = self.start_import_shop_url(self.shop.id)
 
@@ -88,11 +98,62 @@ class ImportApiViewTestCase(APITestCase):
         # 1. Проверка, что статус ответа 202
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         # 2. Проверка, что ответе корректные данные
-        self.assertEqual(response.data["task_id"], "test_task_id_shop_67890")
+        self.assertFalse(response.data["already_running"])
         self.assertEqual(response.data["message"], f"Импорт магазина {self.shop.name} начат.")
 
-        # 3. Проверка, что задача вызвана с правильным ID магазина
-        mock_task.delay.assert_called_once_with(self.shop.id, None)
+        # 3. Проверка, что задача поставлена с правильным ID магазина и заранее выданным ID задачи
+        mock_task.apply_async.assert_called_once_with(args=(self.shop.id, None), task_id=response.data["task_id"])
+
+
+    @patch("backend.api.v1.api_views.import_shop_data_task")
+    def test_start_import_shop_coalesces_duplicate_requests(self, mock_task):
+        """Тест: повторный запуск импорта того же магазина возвращает ID уже запущенной задачи."""
+        url = self.start_import_shop_url(self.shop.id)
+
+        first = self.client.post(url)
+        second = self.client.post(url)
+
+        # 1. Проверка, что второй запрос получил ID первой задачи
+        self.assertEqual(second.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(second.data["already_running"])
+        self.assertEqual(second.data["task_id"], first.data["task_id"])
+        # 2. Проверка, что задача поставлена в очередь только один раз
+        mock_task.apply_async.assert_called_once()
+
+
+    @patch("backend.api.v1.api_views.import_shop_data_task")
+    def test_start_import_shop_dry_run(self, mock_task):
+        """Тест: предпросмотр импорта ставится без захвата аренды магазина (ожидаем 202)."""
+        mock_task.apply_async.return_value.id = "preview_task_id"
+        url = self.start_import_shop_url(self.shop.id)
+
+        response = self.client.post(url, {"dry_run": True, "full_diff": "true"}, format="json")
+
+        # 1. Проверка ответа и параметров задачи
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["task_id"], "preview_task_id")
+        self.assertTrue(response.data["dry_run"])
+        mock_task.apply_async.assert_called_once_with(
+            args=(self.shop.id, None), kwargs={"dry_run": True, "full_diff": True}
+        )
+        # 2. Проверка, что обычный импорт после предпросмотра не блокируется
+        response = self.client.post(url)
+        self.assertFalse(response.data["already_running"])
+
+
+    @patch("backend.api.v1.api_views.AsyncResult")
+    def test_get_import_status_includes_lock(self, mock_async_result):
+        """Тест: статус задачи, держащей аренду магазина, содержит состояние блокировки."""
+        mock_async_result.return_value = MagicMock(state="PENDING")
+        reserve_shop_import(self.shop.id, "queued_task_id")
+
+        response = self.client.get(self.get_status_url("queued_task_id"))
+
+        # 1. Проверка, что в ответе есть аренда магазина
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["lock"]["shop_id"], self.shop.id)
+        self.assertEqual(response.data["lock"]["task_id"], "queued_task_id")
+        self.assertTrue(response.data["lock"]["held"])
 
 
     def test_get_import_status_unauthorized(self):
@@ -106,3 +167,123 @@ class ImportApiViewTestCase(APITestCase):
         # 1. Проверка, что статус ответа 401
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+
+
+    @patch("backend.api.v1.api_views.GroupResult")
+    @patch("backend.api.v1.api_views.AsyncResult")
+    def test_get_import_status_aggregates_fan_out(self, mock_async_result, mock_group_result):
+        """Тест: статус импорта всех магазинов собирается из подзадач (ожидаем PROGRESS)."""
+        # Задача импорта всех магазинов уже запустила подзадачи, callback ещё не выполнен
+        fan_out_result = MagicMock(state="SUCCESS")
+        fan_out_result.result = {"group_id": "group_1", "callback_task_id": "callback_1", "shops_count": 2}
+        mock_async_result.side_effect = [fan_out_result, MagicMock(state="PENDING")]
+
+        # Одна подзадача завершена, вторая выполняется
+        mock_group_result.restore.return_value.results = [
+            MagicMock(**{"ready.return_value": True, "failed.return_value": False}),
+            MagicMock(**{"ready.return_value": False, "failed.return_value": False}),
+        ]
+        # Отправляем GET-запрос на эндпоинт статуса
+        response = self.client.get(self.get_status_url("fan_out_task_id"))
+
+        # 1. Проверка, что статус ответа 200 и прогресс собран по подзадачам
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["state"], "PROGRESS")
+        self.assertEqual(response.data["progress"], {"total": 2, "completed": 1, "failed": 0})
+        mock_group_result.restore.assert_called_once_with("group_1")
+
+
+    @patch("backend.api.v1.api_views.AsyncResult")
+    def test_get_import_status_returns_progress(self, mock_async_result):
+        """Тест: для выполняющейся задачи возвращаются метаданные прогресса (ожидаем 200)."""
+        progress = {"processed": 500, "total": 1000, "percent": 50.0, "current_category": "Смартфоны",
+                    "rows_per_sec": 250.0, "elapsed_seconds": 2.0, "eta_seconds": 2.0}
+        mock_async_result.return_value = MagicMock(state="PROGRESS", info=progress)
+
+        # Отправляем GET-запрос на эндпоинт статуса
+        response = self.client.get(self.get_status_url("running_task_id"))
+
+        # 1. Проверка, что статус ответа 200 и прогресс передан клиенту
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["state"], "PROGRESS")
+        self.assertEqual(response.data["progress"], progress)
+
+
+class UploadShopFeedApiViewTestCase(APITestCase):
+    """Тестирование загрузки файла поставщика через API"""
+    def setUp(self):
+        """Создаём поставщика с магазином и временное хранилище файлов."""
+        self.supplier = User.objects.create_user(
+            username="supplier@example.com",
+            email="supplier@example.com",
+            password="testpass123",
+            user_type="supplier"
+        )
+        self.shop = Shop.objects.create(name="Магазин поставщика", state=True, user=self.supplier)
+        self.client.force_authenticate(user=self.supplier)
+        self.url = reverse("upload_shop_feed_api_v1", kwargs={"shop_id": self.shop.id})
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        local_lock_store.clear()
+        self.addCleanup(local_lock_store.clear)
+
+    def upload(self, content: bytes, name: str = "price.yaml"):
+        """Отправляет файл на эндпоинт загрузки."""
+        return self.client.post(self.url, {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+
+    @patch("backend.api.v1.api_views.import_shop_data_task")
+    def test_upload_stores_file_and_starts_import(self, mock_task):
+        """Тест: загруженный файл сохраняется в хранилище и ставится в импорт (ожидаем 202)."""
+        content = "categories: []\n".encode("utf-8")
+
+        response = self.upload(content)
+
+        # 1. Проверка ответа и хэша содержимого
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["source_hash"], hashlib.sha256(content).hexdigest())
+        # 2. Проверка, что файл сохранён и стал файлом источника магазина
+        source_file = response.data["source_file"]
+        self.assertTrue(default_storage.exists(source_file))
+        with default_storage.open(source_file, "rb") as stored_file:
+            self.assertEqual(stored_file.read(), content)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.source_file, source_file)
+        # 3. Проверка, что импорт поставлен на сохранённый файл
+        mock_task.apply_async.assert_called_once_with(args=(self.shop.id, source_file), task_id=response.data["task_id"])
+
+
+    @patch("backend.api.v1.api_views.import_shop_data_task")
+    def test_upload_of_last_imported_file_is_skipped(self, mock_task):
+        """Тест: файл с тем же содержимым, что и последний импорт, не импортируется повторно (ожидаем 200)."""
+        content = "categories: []\n".encode("utf-8")
+        Shop.objects.filter(id=self.shop.id).update(source_hash=hashlib.sha256(content).hexdigest())
+
+        response = self.upload(content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "unchanged")
+        mock_task.apply_async.assert_not_called()
+
+
+    @patch("backend.api.v1.api_views.import_shop_data_task")
+    def test_upload_rejects_foreign_shop_and_unknown_format(self, mock_task):
+        """Тест: чужой магазин (ожидаем 403) и неподдерживаемый формат (ожидаем 400)."""
+        # 1. Проверка формата файла
+        response = self.upload(b"data", name="price.xlsx")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # 2. Проверка прав: клиент не может загружать файлы магазина
+        client_user = User.objects.create_user(
+            username="client@example.com", email="client@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=client_user)
+        response = self.upload(b"categories: []\n")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        mock_task.apply_async.assert_not_called()
@@ -0,0 +1,86 @@
+from django.test import TestCase
+from unittest.mock import patch
+
+from backend.models import Shop, Category, Product, ProductInfo
+from backend.cache_invalidation import bulk_cache_invalidation, invalidate_product_list_cache
+from backend.signals import invalidate_product_info_cache
+
+
+class BulkCacheInvalidationTestCase(TestCase):
+    """Тестирование пакетного режима инвалидации кэша списка товаров."""
+    def setUp(self):
+        """Создаём товар для информации о товаре."""
+        self.shop = Shop.objects.create(name="Магазин Кэша", state=True)
+        category = Category.objects.create(name="Категория Кэша")
+        self.product = Product.objects.create(name="Товар Кэша", category=category)
+
+    def create_product_info(self, name: str) -> ProductInfo:
+        return ProductInfo.objects.create(
+            product=self.product, shop=self.shop, name=name, price=10, price_rrc=12, quantity=1
+        )
+
+
+    @patch("backend.cache_invalidation.clear_product_list_cache")
+    @patch("backend.cache_invalidation.invalidate_product_list_tags")
+    def test_signals_invalidate_tags_per_row_outside_bulk_mode(self, mock_tags, mock_clear):
+        """Тест: без пакетного режима каждое сохранение инвалидирует теги магазина и категории."""
+        self.create_product_info("Вариант 1")
+        self.create_product_info("Вариант 2")
+
+        self.assertEqual(mock_tags.call_count, 2)
+        mock_tags.assert_called_with([self.shop.id], {self.product.category_id})
+        mock_clear.assert_not_called()
+
+
+    @patch("backend.cache_invalidation.clear_product_list_cache")
+    @patch("backend.cache_invalidation.invalidate_product_list_tags")
+    def test_bulk_mode_coalesces_invalidation_until_commit(self, mock_tags, mock_clear):
+        """Тест: в пакетном режиме теги инвалидируются один раз после фиксации транзакции."""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with bulk_cache_invalidation():
+                for number in range(3):
+                    info = self.create_product_info(f"Вариант {number}")
+                info.delete()
+                # 1. Проверка, что внутри блока кэш не инвалидировался
+                mock_tags.assert_not_called()
+
+        # 2. Проверка, что после фиксации выполнена одна объединённая инвалидация тегов
+        self.assertEqual(len(callbacks), 1)
+        mock_tags.assert_called_once_with({self.shop.id}, {self.product.category_id})
+        mock_clear.assert_not_called()
+
+
+    @patch("backend.cache_invalidation.clear_product_list_cache")
+    @patch("backend.cache_invalidation.invalidate_product_list_tags")
+    def test_bulk_mode_resolves_categories_once_at_commit(self, mock_tags, mock_clear):
+        """Тест: в пакетном режиме категории строк без загруженного товара узнаются одним запросом при фиксации."""
+        infos = [self.create_product_info(f"Вариант {number}") for number in range(3)]
+        infos = list(ProductInfo.objects.filter(id__in=[info.id for info in infos])) # Товар не загружен
+        mock_tags.reset_mock()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with bulk_cache_invalidation():
+                # 1. Проверка, что строки не запрашивают категорию своего товара
+                with self.assertNumQueries(0):
+                    for info in infos:
+                        invalidate_product_info_cache(info)
+        # 2. Проверка, что при фиксации категории узнаются одним запросом
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+
+        mock_tags.assert_called_once_with({self.shop.id}, {self.product.category_id})
+        mock_clear.assert_not_called()
+
+
+    @patch("backend.cache_invalidation.clear_product_list_cache")
+    @patch("backend.cache_invalidation.invalidate_product_list_tags")
+    def test_bulk_mode_full_clear_wins_over_tags(self, mock_tags, mock_clear):
+        """Тест: если в пакете запрошена очистка всего кэша, теги отдельно не инвалидируются."""
+        with self.captureOnCommitCallbacks(execute=True):
+            with bulk_cache_invalidation():
+                self.create_product_info("Вариант 1")
+                invalidate_product_list_cache()
+
+        mock_clear.assert_called_once_with()
+        mock_tags.assert_not_called()
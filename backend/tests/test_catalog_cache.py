@@ -0,0 +1,685 @@
+import gzip
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.catalog_cache import (PRODUCT_LIST_GENERATION_KEY, RELEASE_LOCK_SCRIPT,
+                                   clear_product_list_cache, product_list_cache_key, product_list_tags,
+                                   invalidate_product_list_tags, get_product_list, refresh_product_list,
+                                   acquire_product_list_rebuild, version_snapshot, local_product_list_cache,
+                                   tag_version_key, build_page_entry, encode_page_entry, decode_page_entry,
+                                   PRODUCT_LIST_GZIP_MIN_SIZE, PRODUCT_LIST_POPULAR_KEY,
+                                   PRODUCT_LIST_POPULARITY_HALF_LIFE, PRODUCT_LIST_WARM_DELAY,
+                                   product_list_hits, product_list_query_string, decay_product_list_popularity,
+                                   popular_product_list_queries, warm_product_list, known_tag_ids,
+                                   invalidate_product_details,
+                                   PRODUCT_LIST_TAG_IDS_MAX_AGE)
+from backend.cache_invalidation import invalidate_product_list_cache
+from backend.tasks import warm_product_list_cache_task
+from backend.local_cache import LocalLRUCache, VersionSnapshot
+from backend import redis_client
+from backend.redis_client import redis_breaker
+
+
+class FakeRedis:
+    """
+    Минимальная замена redis-py в памяти: строки, счётчики, SET NX и pipeline.
+    Как и настоящий клиент с decode_responses=False, хранит и возвращает bytes.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.zsets = {}
+        self.reads = 0  # количество сетевых запросов чтения
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        self.reads += 1
+        return self.values.get(self.encode(key))
+
+    def mget(self, keys):
+        self.reads += 1
+        return [self.values.get(self.encode(key)) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False, get=False):
+        if nx and self.encode(key) in self.values:
+            return None
+        previous = self.values.get(self.encode(key))
+        self.values[self.encode(key)] = self.encode(value)
+        return previous if get else True
+
+    def incr(self, key):
+        value = int(self.values.get(self.encode(key), 0)) + 1
+        self.values[self.encode(key)] = self.encode(value)
+        return value
+
+    def eval(self, script, numkeys, *args):
+        assert script == RELEASE_LOCK_SCRIPT
+        key, token = map(self.encode, args)
+        if self.values.get(key) == token:
+            del self.values[key]
+            return 1
+        return 0
+
+    def delete(self, *keys):
+        return sum(self.values.pop(self.encode(key), None) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def zincrby(self, key, amount, member):
+        zset = self.zsets.setdefault(key, {})
+        zset[self.encode(member)] = zset.get(self.encode(member), 0) + amount
+        return zset[self.encode(member)]
+
+    def zrevrange(self, key, start, end):
+        members = sorted(self.zsets.get(key, {}).items(), key=lambda item: -item[1])
+        return [member for member, _ in members][start:end + 1]
+
+    def zremrangebyrank(self, key, start, end):
+        members = self.zrevrange(key, 0, -1)[::-1] # по возрастанию счёта
+        for member in members[start:len(members) + end + 1 if end < 0 else end + 1]:
+            del self.zsets[key][member]
+
+    def zunionstore(self, destination, keys):
+        (key, weight), = keys.items()
+        self.zsets[destination] = {member: score * weight for member, score in self.zsets.get(key, {}).items()}
+
+    def zremrangebyscore(self, key, min_score, max_score):
+        limit = float(max_score.lstrip("("))
+        self.zsets[key] = {member: score for member, score in self.zsets.get(key, {}).items() if score >= limit}
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+def as_body(render):
+    """Превращает функцию сборки данных страницы в функцию сборки готового тела ответа."""
+    return lambda query_params: json.dumps(render(query_params), ensure_ascii=False).encode()
+
+
+def fetch(query_params, render, **kwargs) -> tuple:
+    """Вызывает get_product_list и возвращает (данные из тела записи, статус)."""
+    entry, status = get_product_list(query_params, as_body(render), **kwargs)
+    body = gzip.decompress(entry["body"]) if entry["encoding"] == "gzip" else entry["body"]
+    return json.loads(body), status
+
+
+def patch_redis(test_case, client, version_max_age: float = 0) -> None:
+    """
+    Подменяет клиента Redis в backend.redis_client на время теста и очищает кэш процесса.
+    По умолчанию версии перечитываются при каждом запросе, как если бы снимок всегда устаревал.
+    Магазины и категории из параметров запросов считаются существующими (см. ProductListTagIdsTestCase).
+    """
+    patchers = [
+        patch("backend.catalog_cache.product_list_tag_exists", return_value=True),
+        patch("backend.redis_client.get_redis_client", return_value=client),
+        patch("backend.redis_client.is_redis_connected", return_value=True),
+        patch.object(version_snapshot, "max_age", version_max_age),
+        patch("backend.tasks.warm_product_list_cache_task.apply_async"),
+    ]
+    for patcher in patchers:
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    for cache in (version_snapshot, local_product_list_cache, product_list_hits):
+        cache.clear()
+        test_case.addCleanup(cache.clear)
+    redis_breaker.reset()
+    test_case.addCleanup(redis_breaker.reset)
+
+
+class ProductListCacheVersionsTestCase(TestCase):
+    """Тестирование поколений и тегов кэша списка товаров (клиент Redis подменён)."""
+    def setUp(self):
+        """Подменяем клиента Redis словарём со счётчиками."""
+        self.values = {}
+        self.client = MagicMock()
+        self.client.mget.side_effect = lambda keys: [self.values.get(key) for key in keys]
+        self.client.incr.side_effect = self.incr
+        self.client.pipeline.return_value.incr.side_effect = self.incr
+        patch_redis(self, self.client)
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def key(self, query: str) -> str:
+        """Ключ кэша для строки запроса, как его строит ProductInfoListView."""
+        return product_list_cache_key(query, product_list_tags(QueryDict(query)))
+
+
+    def test_invalidation_moves_keys_to_new_generation(self):
+        """Тест: очистка всего кэша — один INCR, после которого ключи строятся в новом поколении."""
+        # 1. Проверка ключа до первой инвалидации
+        self.assertEqual(product_list_cache_key('{"page": "1"}'), 'product_list:0:all=0:{"page": "1"}')
+
+        # 2. Проверка, что очистка увеличивает поколение и не перебирает ключи
+        self.assertEqual(clear_product_list_cache(), 1)
+        self.client.incr.assert_called_once_with(PRODUCT_LIST_GENERATION_KEY)
+        self.client.keys.assert_not_called()
+        self.client.scan_iter.assert_not_called()
+        self.client.delete.assert_not_called()
+
+        # 3. Проверка ключа нового поколения
+        self.assertEqual(product_list_cache_key('{"page": "1"}'), 'product_list:1:all=0:{"page": "1"}')
+
+
+    def test_tags_follow_shop_and_category_filters(self):
+        """Тест: теги страницы определяются фильтрами shop_id и category_id."""
+        self.assertEqual(product_list_tags(QueryDict("shop_id=1&page=2")), ["shop:1"])
+        self.assertEqual(product_list_tags(QueryDict("shop_id=1&category_id=3")), ["shop:1", "category:3"])
+        self.assertEqual(product_list_tags(QueryDict("search=ноутбук")), ["all"])
+        self.assertEqual(product_list_tags(QueryDict("shop_id=abc")), ["all"])
+
+
+    def test_targeted_invalidation_keeps_other_shops_pages(self):
+        """Тест: изменения магазина 1 не меняют ключи страниц магазина 2."""
+        before = {query: self.key(query) for query in ("shop_id=1", "shop_id=2", "category_id=5", "category_id=6", "page=1")}
+
+        self.assertEqual(invalidate_product_list_tags(shop_ids=[1], category_ids=[5]), 3)
+        after = {query: self.key(query) for query in before}
+
+        # 1. Проверка, что страницы магазина 1, категории 5 и страницы без фильтров инвалидированы
+        for query in ("shop_id=1", "category_id=5", "page=1"):
+            self.assertNotEqual(before[query], after[query])
+        # 2. Проверка, что страницы других магазинов и категорий остались в кэше
+        for query in ("shop_id=2", "category_id=6"):
+            self.assertEqual(before[query], after[query])
+
+
+    def test_invalidation_uses_budgeted_client(self):
+        """Тест: инвалидации тегов, поколения и карточек выполняются клиентом с бюджетом записи."""
+        invalidate_product_list_tags(shop_ids=[1])
+        clear_product_list_cache()
+        invalidate_product_details([1])
+
+        budgets = {call.args for call in redis_client.get_redis_client.call_args_list}
+        self.assertEqual(budgets, {(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS,)})
+
+
+    def test_redis_errors_do_not_break_requests(self):
+        """Тест: ошибка Redis не ломает построение ключа и инвалидацию."""
+        self.client.mget.side_effect = ConnectionError("Redis недоступен")
+        self.client.incr.side_effect = ConnectionError("Redis недоступен")
+        self.client.pipeline.return_value.execute.side_effect = ConnectionError("Redis недоступен")
+
+        self.assertIsNone(product_list_cache_key("{}"))
+        self.assertEqual(clear_product_list_cache(), -1)
+        self.assertEqual(invalidate_product_list_tags(shop_ids=[1]), -1)
+
+
+class ProductListStampedeTestCase(TestCase):
+    """Тестирование single-flight пересборки и stale-while-revalidate кэша списка товаров."""
+    def setUp(self):
+        """Подменяем Redis и считаем вызовы сборки страницы."""
+        self.redis = FakeRedis()
+        patch_redis(self, self.redis)
+        self.renders = 0
+        self.query = QueryDict("shop_id=1")
+
+    def render(self, query_params):
+        self.renders += 1
+        return [{"id": self.renders}]
+
+
+    def test_miss_then_hit(self):
+        """Тест: первый запрос собирает страницу, следующий берёт её из кэша."""
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 1}], "miss"))
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 1}], "local"))
+        # Запись из Redis (например, собранная другим процессом) попадает и в кэш процесса
+        local_product_list_cache.clear()
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 1}], "hit"))
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 1}], "local"))
+        self.assertEqual(self.renders, 1)
+
+
+    def test_expired_entry_is_served_stale_and_refreshed_once(self):
+        """Тест: устаревшая запись отдаётся сразу, фоновая пересборка запускается один раз."""
+        fetch(self.query, self.render)
+        scheduled = []
+
+        with patch("backend.catalog_cache.time.time", return_value=10 ** 10):
+            # 1. Проверка, что оба запроса получают устаревшую копию, а пересборка ставится один раз
+            for _ in range(2):
+                data, status = fetch(self.query, self.render, schedule_refresh=scheduled.append)
+                self.assertEqual((data, status), ([{"id": 1}], "stale"))
+        self.assertEqual(len(scheduled), 1)
+        self.assertEqual(self.renders, 1)
+
+        # 2. Проверка, что фоновая пересборка обновляет запись и освобождает блокировку
+        refresh_product_list(self.query, as_body(self.render), scheduled[0])
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 2}], "local"))
+        self.assertIsNotNone(acquire_product_list_rebuild('{"shop_id": "1"}'))
+
+
+    def test_invalidated_page_is_rebuilt_by_single_request(self):
+        """Тест: после инвалидации страницу собирает владелец блокировки, остальные получают прошлую версию."""
+        fetch(self.query, self.render)
+        invalidate_product_list_tags(shop_ids=[1])
+        # Другой запрос уже пересобирает страницу
+        self.assertIsNotNone(acquire_product_list_rebuild('{"shop_id": "1"}'))
+
+        self.assertEqual(fetch(self.query, self.render), ([{"id": 1}], "stale"))
+        self.assertEqual(self.renders, 1)
+
+
+    @patch("backend.catalog_cache.PRODUCT_LIST_LOCK_WAIT", 0.2)
+    def test_request_without_stale_copy_waits_for_rebuild(self):
+        """Тест: запрос без устаревшей копии ждёт страницу владельца блокировки, а не собирает её сам."""
+        self.assertIsNotNone(acquire_product_list_rebuild('{"shop_id": "1"}'))
+        other_query = QueryDict("shop_id=1")
+
+        # Владелец блокировки записывает страницу, пока запрос ждёт
+        with patch("backend.catalog_cache.time.sleep", side_effect=lambda seconds: refresh_product_list(
+                other_query, as_body(lambda query_params: [{"id": "готово"}]))):
+            data, status = fetch(self.query, self.render)
+
+        self.assertEqual((data, status), ([{"id": "готово"}], "hit"))
+        self.assertEqual(self.renders, 0)
+
+
+class LocalCacheTestCase(TestCase):
+    """Тестирование кэша в памяти процесса и снимка версий."""
+
+    def test_lru_is_bounded_by_entries_and_bytes(self):
+        """Тест: вытесняются давно использованные записи при превышении количества или размера."""
+        cache = LocalLRUCache(max_entries=2, max_bytes=100)
+        cache.set("a", 1, 10)
+        cache.set("b", 2, 10)
+        cache.get("a")
+        cache.set("c", 3, 10)
+        # 1. Проверка вытеснения по количеству: "b" использовалась давнее всех
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        # 2. Проверка вытеснения по размеру и пропуска записи больше всего кэша
+        cache.set("d", 4, 95)
+        self.assertEqual(cache.stats(), {"entries": 1, "bytes": 95})
+        cache.set("e", 5, 101)
+        self.assertIsNone(cache.get("e"))
+
+
+    def test_snapshot_reads_redis_once_per_interval(self):
+        """Тест: снимок перечитывает версии не чаще max_age и сразу видит свои инвалидации."""
+        redis = FakeRedis()
+        redis.set("v1", 3)
+        snapshot = VersionSnapshot(max_age=60)
+
+        # 1. Проверка, что повторное чтение не обращается к Redis
+        self.assertEqual(snapshot.get(redis.mget, ["v1"]), [3])
+        self.assertEqual(snapshot.get(redis.mget, ["v1"]), [3])
+        self.assertEqual(redis.reads, 1)
+        # 2. Проверка, что новый счётчик дочитывается, а свой INCR виден сразу
+        self.assertEqual(snapshot.get(redis.mget, ["v1", "v2"]), [3, 0])
+        snapshot.update("v1", 4)
+        self.assertEqual(snapshot.get(redis.mget, ["v1"]), [4])
+        self.assertEqual(redis.reads, 2)
+
+
+    def test_snapshot_is_bounded_and_refreshes_only_requested_keys(self):
+        """Тест: снимок хранит не больше max_keys счётчиков и перечитывает только запрошенные."""
+        redis = FakeRedis()
+        snapshot = VersionSnapshot(max_age=0, max_keys=2)
+        for key in ("v1", "v2", "v3"):
+            snapshot.get(redis.mget, [key])
+
+        # 1. Проверка вытеснения самого давно использованного счётчика
+        self.assertEqual(len(snapshot), 2)
+        # 2. Проверка, что устаревший снимок перечитывает только счётчики запроса
+        with patch.object(redis, "mget", wraps=redis.mget) as mget:
+            snapshot.get(redis.mget, ["v3"])
+        mget.assert_called_once_with(["v3"])
+
+
+class ProductListTagIdsTestCase(TestCase):
+    """Тестирование тегов страниц только для существующих магазинов и категорий."""
+    def setUp(self):
+        """Очищаем множества известных ID процесса."""
+        for ids in known_tag_ids.values():
+            ids.clear()
+            self.addCleanup(ids.clear)
+        self.shop = Shop.objects.create(name="Магазин Тегов", state=True)
+        self.category = Category.objects.create(name="Категория Тегов")
+
+
+    def test_unknown_ids_get_all_tag(self):
+        """Тест: фильтр по несуществующему ID не заводит тег, а ID не перечитываются на каждый запрос."""
+        query = QueryDict(f"shop_id={self.shop.id}&category_id={self.category.id}")
+        # 1. Проверка тегов существующих магазина и категории
+        self.assertEqual(product_list_tags(query), [f"shop:{self.shop.id}", f"category:{self.category.id}"])
+        # 2. Проверка, что несуществующий ID получает тег all без повторного чтения ID из БД
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(product_list_tags(QueryDict("shop_id=999999")), ["all"])
+        # 3. Проверка, что новый магазин становится известен после PRODUCT_LIST_TAG_IDS_MAX_AGE
+        new_shop = Shop.objects.create(name="Новый Магазин Тегов", state=True)
+        with patch("backend.local_cache.time.monotonic", return_value=10**9 + PRODUCT_LIST_TAG_IDS_MAX_AGE):
+            self.assertEqual(product_list_tags(QueryDict(f"shop_id={new_shop.id}")), [f"shop:{new_shop.id}"])
+
+
+class LocalProductListTierTestCase(TestCase):
+    """Тестирование кэша страниц в памяти процесса перед Redis."""
+    def setUp(self):
+        """Подменяем Redis; версии перечитываются не чаще раза в минуту."""
+        self.redis = FakeRedis()
+        patch_redis(self, self.redis, version_max_age=60)
+        self.query = QueryDict("shop_id=1")
+
+
+    def test_hot_page_is_served_without_network(self):
+        """Тест: горячая страница отдаётся из памяти процесса без запросов к Redis."""
+        fetch(self.query, lambda query_params: ["страница"])
+        reads = self.redis.reads
+
+        self.assertEqual(fetch(self.query, lambda query_params: ["другая"]), (["страница"], "local"))
+        self.assertEqual(self.redis.reads, reads)
+
+
+    def test_invalidation_by_other_process_is_seen_after_snapshot_refresh(self):
+        """Тест: инвалидация другим процессом видна, как только снимок версий обновится."""
+        fetch(self.query, lambda query_params: ["старая"])
+        # Другой процесс увеличивает версию тега магазина напрямую в Redis
+        self.redis.incr(tag_version_key("shop:1"))
+
+        # 1. Проверка, что до обновления снимка отдаётся страница из памяти
+        self.assertEqual(fetch(self.query, lambda query_params: ["новая"])[1], "local")
+        # 2. Проверка, что после обновления снимка страница собирается заново
+        with patch.object(version_snapshot, "max_age", 0):
+            self.assertEqual(fetch(self.query, lambda query_params: ["новая"]), (["новая"], "miss"))
+
+
+class ProductListWarmupTestCase(TestCase):
+    """Тестирование популярности вариантов запроса и прогрева кэша после инвалидации."""
+    def setUp(self):
+        """Подменяем Redis; счётчики обращений отправляются при каждом запросе."""
+        self.redis = FakeRedis()
+        patch_redis(self, self.redis)
+        patcher = patch.object(product_list_hits, "flush_interval", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rendered = []
+
+    def render(self, query_params):
+        self.rendered.append(product_list_query_string(query_params))
+        return [dict(query_params.items())]
+
+    def visit(self, query: str, times: int) -> str:
+        """Запрашивает страницу times раз, возвращает её нормализованные параметры."""
+        for _ in range(times):
+            fetch(QueryDict(query), self.render)
+        return product_list_query_string(QueryDict(query))
+
+
+    def test_popularity_is_counted_and_decays(self):
+        """Тест: популярность считается по обращениям и уменьшается вдвое за период полураспада."""
+        shop = self.visit("shop_id=1", 3)
+        category = self.visit("category_id=2", 1)
+        self.assertEqual(popular_product_list_queries(10), [shop, category])
+
+        with patch("backend.catalog_cache.time.time", return_value=1000.0):
+            self.assertEqual(decay_product_list_popularity(), 1.0) # первое затухание только запоминает время
+        with patch("backend.catalog_cache.time.time", return_value=1000.0 + PRODUCT_LIST_POPULARITY_HALF_LIFE):
+            self.assertEqual(decay_product_list_popularity(), 0.5)
+        self.assertEqual(self.redis.zsets[PRODUCT_LIST_POPULAR_KEY][shop.encode()], 1.5)
+
+
+    def test_invalidation_schedules_single_warmup(self):
+        """Тест: инвалидация планирует прогрев, повторные инвалидации за время задержки — нет."""
+        invalidate_product_list_cache(shop_ids=[1])
+        invalidate_product_list_cache()
+        warm_product_list_cache_task.apply_async.assert_called_once_with(countdown=PRODUCT_LIST_WARM_DELAY)
+
+
+    def test_warmup_renders_top_pages_after_invalidation(self):
+        """Тест: прогрев собирает только самые популярные страницы, инвалидированные импортом."""
+        shop = self.visit("shop_id=1", 3)
+        category = self.visit("category_id=2", 2)
+        self.visit("search=редкий", 1)
+        invalidate_product_list_cache(shop_ids=[1], category_ids=[2])
+        self.rendered.clear()
+
+        # 1. Проверка, что в нескольких потоках собраны две самые популярные страницы
+        summary = warm_product_list(as_body(self.render), limit=2, concurrency=2)
+        self.assertEqual(summary, {"warmed": 2, "fresh": 0, "locked": 0, "skipped": 0, "errors": 0})
+        self.assertCountEqual(self.rendered, [shop, category])
+
+        # 2. Проверка, что после прогрева запрос пользователя не собирает страницу
+        self.rendered.clear()
+        self.assertIn(fetch(QueryDict("shop_id=1"), self.render)[1], ("local", "hit"))
+        self.assertEqual(warm_product_list(as_body(self.render), limit=2)["fresh"], 2)
+        self.assertEqual(self.rendered, [])
+
+
+class PageEntryFormatTestCase(TestCase):
+    """Тестирование формата записи кэша с готовым телом ответа."""
+    def test_small_body_is_stored_as_is(self):
+        """Тест: небольшое тело хранится без сжатия и восстанавливается из значения Redis."""
+        body = b'[{"id":1}]'
+        entry = decode_page_entry(encode_page_entry(build_page_entry(body)))
+        self.assertEqual(entry["encoding"], "identity")
+        self.assertEqual(entry["body"], body)
+        self.assertTrue(entry["etag"].startswith('W/"'))
+
+
+    def test_large_body_is_gzipped_with_content_etag(self):
+        """Тест: большое тело сжимается gzip, ETag зависит только от содержимого."""
+        body = json.dumps([{"id": n} for n in range(PRODUCT_LIST_GZIP_MIN_SIZE)]).encode()
+        entry = build_page_entry(body)
+        self.assertEqual(entry["encoding"], "gzip")
+        self.assertEqual(gzip.decompress(entry["body"]), body)
+        self.assertEqual(entry["etag"], build_page_entry(body)["etag"])
+        self.assertNotEqual(entry["etag"], build_page_entry(body + b" ")["etag"])
+
+
+    def test_incompressible_body_is_stored_as_is(self):
+        """Тест: тело, которое gzip не уменьшает, хранится без сжатия."""
+        body = os.urandom(PRODUCT_LIST_GZIP_MIN_SIZE * 2)
+        entry = build_page_entry(body)
+        self.assertEqual(entry["encoding"], "identity")
+        self.assertEqual(entry["body"], body)
+
+
+    def test_old_format_is_treated_as_missing(self):
+        """Тест: значения старого формата (JSON без заголовка) не считаются записями."""
+        self.assertIsNone(decode_page_entry(b'{"fresh_until": 1, "data": []}'))
+        self.assertIsNone(decode_page_entry(b"not json\n[]"))
+
+
+class ProductInfoListCacheApiTestCase(APITestCase):
+    """Тестирование кэширования списка товаров в API."""
+    def setUp(self):
+        """Подменяем Redis и создаём товар."""
+        self.redis = FakeRedis()
+        patch_redis(self, self.redis)
+        shop = Shop.objects.create(name="Магазин Кэша API", state=True)
+        product = Product.objects.create(name="Товар Кэша API", category=Category.objects.create(name="Категория API"))
+        ProductInfo.objects.create(product=product, shop=shop, name="Вариант", price=10, price_rrc=12, quantity=3)
+        self.url = reverse("product_info_list_api_v1")
+
+
+    def test_list_is_rendered_once_and_served_from_cache(self):
+        """Тест: список собирается из БД один раз, повторный запрос отдаётся из кэша."""
+        params = {"shop_id": Shop.objects.get().id}
+        first = self.client.get(self.url, params)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, params)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "LOCAL"))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first.json()[0]["quantity"], 3)
+
+
+    def test_if_none_match_returns_not_modified(self):
+        """Тест: запрос с актуальным ETag получает 304 без тела, после изменения — новый ответ."""
+        params = {"shop_id": Shop.objects.get().id}
+        first = self.client.get(self.url, params)
+        etag = first["ETag"]
+
+        # 1. Проверка ответа 304 для совпадающего ETag
+        second = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"], etag)
+
+        # 2. Проверка, что после изменения товара старый ETag больше не подходит
+        info = ProductInfo.objects.get()
+        info.quantity = 5
+        info.save()
+        third = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third["ETag"], etag)
+        self.assertEqual(third.json()[0]["quantity"], 5)
+
+
+    def test_not_modified_does_not_read_body_from_redis(self):
+        """Тест: для 304 из Redis читается только заголовок записи, а не тело страницы."""
+        params = {"shop_id": Shop.objects.get().id}
+        etag = self.client.get(self.url, params)["ETag"]
+        local_product_list_cache.clear() # Другой процесс: страницы нет в его кэше
+
+        with patch.object(self.redis, "get", wraps=self.redis.get) as mock_get:
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual((response.status_code, response["X-Cache"]), (304, "HIT"))
+        read_keys = [call.args[0] for call in mock_get.call_args_list]
+        self.assertTrue(read_keys)
+        self.assertTrue(all(key.endswith(":header") for key in read_keys))
+
+
+    def test_large_page_is_sent_gzipped_to_accepting_clients(self):
+        """Тест: сжатая страница отдаётся с Content-Encoding: gzip или распакованной."""
+        # Страница из одного товара мала: снимаем порог размера и требование выигрыша от сжатия
+        with patch("backend.catalog_cache.PRODUCT_LIST_GZIP_MIN_SIZE", 1), \
+                patch("backend.cache_codec.CACHE_COMPRESS_MIN_RATIO", 10):
+            plain = self.client.get(self.url)
+            compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(compressed.content)), plain.json())
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+
+    def test_failing_redis_degrades_to_database(self):
+        """Тест: при ошибках Redis страница собирается из БД, а разомкнутый выключатель не ждёт Redis."""
+        failing = MagicMock()
+        failing.mget.side_effect = ConnectionError("timeout")
+        failing.get.side_effect = ConnectionError("timeout")
+        failing.set.side_effect = ConnectionError("timeout")
+        failing.pipeline.return_value.execute.side_effect = ConnectionError("timeout")
+        with patch("backend.redis_client.get_redis_client", return_value=failing), \
+                patch("backend.catalog_cache.gzip_body") as mock_gzip:
+            for _ in range(redis_breaker.failure_threshold):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+                self.assertEqual((response.status_code, response["X-Cache"]), (200, "BYPASS"))
+                self.assertNotIn("Content-Encoding", response)
+            # Страница, которая не попадёт в кэш, не сжимается
+            mock_gzip.assert_not_called()
+            calls = len(failing.method_calls)
+            self.assertEqual(redis_breaker.state, "open")
+            # Без версий страницы не читаются и не пишутся под ключами с непроверенными версиями
+            failing.get.assert_not_called()
+            failing.set.assert_not_called()
+
+            # Проверка, что следующие запросы не обращаются к Redis
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()[0]["quantity"], 3)
+        self.assertEqual(len(failing.method_calls), calls)
+
+
+    def test_cache_metrics_are_available_to_admins(self):
+        """Тест: метрики кэша доступны только администраторам."""
+        url = reverse("cache_metrics_api_v1")
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        admin = get_user_model().objects.create_user(
+            username="cache_admin", email="cache_admin@example.com", password="password", is_staff=True
+        )
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["breaker"]["state"], "closed")
+        self.assertIn("entries", response.json()["local_product_list_cache"])
+
+
+class ProductDetailCacheApiTestCase(APITestCase):
+    """Тестирование кэша карточки товара и его инвалидации по товару."""
+    def setUp(self):
+        """Подменяем Redis и создаём два товара с информацией и параметром."""
+        patch_redis(self, FakeRedis())
+        shop = Shop.objects.create(name="Магазин Карточек", state=True)
+        category = Category.objects.create(name="Категория Карточек")
+        self.products = [Product.objects.create(name=f"Карточка {number}", category=category) for number in range(2)]
+        self.infos = [
+            ProductInfo.objects.create(product=product, shop=shop, name="Вариант", price=10, price_rrc=12, quantity=3)
+            for product in self.products
+        ]
+        self.parameter = ProductParameter.objects.create(
+            product_info=self.infos[0], parameter=Parameter.objects.create(name="Цвет"), value="красный"
+        )
+
+    def get(self, product: Product):
+        return self.client.get(reverse("product_detail_api_v1", kwargs={"id": product.id}))
+
+
+    def test_detail_is_served_from_cache(self):
+        """Тест: карточка собирается из БД один раз, повторный запрос не обращается к БД."""
+        first = self.get(self.products[0])
+        with self.assertNumQueries(0):
+            second = self.get(self.products[0])
+
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(self.get(Product(id=0)).status_code, 404)
+
+
+    def test_changes_invalidate_only_affected_product(self):
+        """Тест: изменения информации, параметра и самого товара сбрасывают только его карточку."""
+        for product in self.products:
+            self.get(product)
+
+        # 1. Проверка изменения информации о товаре
+        self.infos[0].quantity = 7
+        self.infos[0].save()
+        response = self.get(self.products[0])
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["product_infos"][0]["quantity"], 7)
+        self.assertEqual(self.get(self.products[1])["X-Cache"], "HIT")
+
+        # 2. Проверка изменения и удаления параметра (товар строки узнаётся при фиксации транзакции)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parameter.value = "синий"
+            self.parameter.save()
+        self.assertEqual(self.get(self.products[0])["X-Cache"], "MISS")
+        # Удаление и один запрос товара строки при фиксации
+        with self.assertNumQueries(2), self.captureOnCommitCallbacks(execute=True):
+            self.parameter.delete()
+        response = self.get(self.products[0])
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["product_infos"][0]["product_parameters"], [])
+        self.assertEqual(self.get(self.products[1])["X-Cache"], "HIT")
+
+        # 3. Проверка изменения товара
+        self.products[1].name = "Новое имя"
+        self.products[1].save()
+        response = self.get(self.products[1])
+        self.assertEqual((response["X-Cache"], response.json()["name"]), ("MISS", "Новое имя"))
+        self.assertEqual(self.get(self.products[0])["X-Cache"], "HIT")
@@ -0,0 +1,125 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+import yaml
+from django.test import TestCase
+from django.utils import timezone
+
+from backend.models import Shop
+from backend.import_lock import local_lock_store, reserve_shop_import, get_shop_import_lock
+from backend.tasks import check_shop_feeds_task, import_shop_data_task
+from backend.tests.test_import_utils import build_shop_yaml
+
+
+@patch("backend.tasks.import_shop_data_task.apply_async")
+class CheckShopFeedsTaskTestCase(TestCase):
+    """Тестирование плановой проверки файлов поставщиков (check_shop_feeds_task)."""
+    def setUp(self):
+        """Создаём файл поставщика и магазин, который на него ссылается."""
+        file = tempfile.NamedTemporaryFile("w", suffix=".yaml", encoding="utf-8", delete=False)
+        with file:
+            yaml.safe_dump(build_shop_yaml(categories=1, products=1, infos=2), file, allow_unicode=True)
+        self.addCleanup(os.remove, file.name)
+        self.file_path = file.name
+        self.shop = Shop.objects.create(name="Магазин по расписанию", state=True, source_file=file.name)
+        local_lock_store.clear()
+        self.addCleanup(local_lock_store.clear)
+
+
+    def make_due(self):
+        """Сдвигает время последней проверки, чтобы магазин снова попал в проверку."""
+        Shop.objects.filter(id=self.shop.id).update(last_checked_at=timezone.now() - timedelta(hours=2))
+
+
+    def test_changed_feed_is_enqueued_once(self, apply_async):
+        """Тест: изменившийся файл ставится в импорт, до срока проверки магазин не проверяется."""
+        # 1. Проверка, что новый файл ставится в очередь под арендой магазина
+        summary = check_shop_feeds_task()
+        self.assertEqual(summary["checked"], 1)
+        task_id = summary["enqueued"][self.shop.id]
+        apply_async.assert_called_once_with(args=(self.shop.id, self.file_path), task_id=task_id)
+        self.assertEqual(get_shop_import_lock(self.shop.id)["task_id"], task_id)
+
+        # 2. Проверка, что результат проверки и снимок файла записаны в магазин
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_check_status, "enqueued")
+        self.assertEqual(self.shop.source_size, os.path.getsize(self.file_path))
+        self.assertIsNotNone(self.shop.last_checked_at)
+
+        # 3. Проверка, что до истечения import_interval магазин не проверяется
+        self.assertEqual(check_shop_feeds_task()["checked"], 0)
+        self.assertEqual(apply_async.call_count, 1)
+
+
+    def test_unchanged_stat_skips_hashing(self, apply_async):
+        """Тест: при тех же размере и mtime файл не читается и импорт не запускается."""
+        stat = os.stat(self.file_path)
+        Shop.objects.filter(id=self.shop.id).update(source_size=stat.st_size, source_mtime=stat.st_mtime)
+
+        with patch("backend.tasks.file_content_hash") as file_content_hash:
+            summary = check_shop_feeds_task()
+        file_content_hash.assert_not_called()
+        apply_async.assert_not_called()
+        self.assertEqual(summary["enqueued"], {})
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_check_status, "unchanged")
+
+
+    def test_touched_feed_with_same_content_is_not_imported(self, apply_async):
+        """Тест: файл с новым mtime, но тем же содержимым, не импортируется повторно."""
+        # 1. Импортируем файл, чтобы в магазине сохранился его хэш
+        import_shop_data_task(self.shop.id, self.file_path)
+        os.utime(self.file_path, (1_000_000, 1_000_000))
+
+        # 2. Проверка, что сравнивается хэш и запоминается новый mtime без импорта
+        check_shop_feeds_task()
+        apply_async.assert_not_called()
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_check_status, "unchanged")
+        self.assertEqual(self.shop.source_mtime, 1_000_000)
+
+
+    def test_locked_and_missing_feeds(self, apply_async):
+        """Тест: занятый импортом магазин и отсутствующий файл не запускают импорт."""
+        # 1. Проверка занятого магазина: снимок файла не сохраняется, чтобы повторить проверку позже
+        reserve_shop_import(self.shop.id, "running_task")
+        summary = check_shop_feeds_task()
+        self.assertEqual(summary["locked"], {self.shop.id: "running_task"})
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_check_status, "locked")
+        self.assertIsNone(self.shop.source_size)
+
+        # 2. Проверка отсутствующего файла
+        self.make_due()
+        Shop.objects.filter(id=self.shop.id).update(source_file="data/no_such_feed.yaml")
+        summary = check_shop_feeds_task()
+        self.assertEqual(summary["missing"], [self.shop.id])
+        apply_async.assert_not_called()
+
+
+    def test_disabled_and_inactive_shops_are_not_checked(self, apply_async):
+        """Тест: магазины с import_interval=0 и неактивные магазины не проверяются."""
+        Shop.objects.filter(id=self.shop.id).update(import_interval=0)
+        Shop.objects.create(name="Неактивный магазин", state=False, source_file=self.file_path)
+
+        self.assertEqual(check_shop_feeds_task()["checked"], 0)
+        apply_async.assert_not_called()
+
+
+    def test_import_result_is_recorded_on_shop(self, apply_async):
+        """Тест: задача импорта записывает результат в магазин, ошибка сбрасывает снимок файла."""
+        # 1. Проверка успешного импорта
+        import_shop_data_task(self.shop.id, self.file_path)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_import_status, "success")
+        self.assertIsNotNone(self.shop.last_import_at)
+
+        # 2. Проверка ошибки: следующая проверка должна заново сравнить файл
+        Shop.objects.filter(id=self.shop.id).update(source_size=1, source_mtime=1.0)
+        import_shop_data_task(self.shop.id, "data/no_such_feed.yaml")
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.last_import_status, "error")
+        self.assertIn("не найден", self.shop.last_import_message)
+        self.assertIsNone(self.shop.source_size)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import yaml
+from django.test import TestCase
+
+from backend.models import Shop, ProductInfo
+from backend.import_lock import (local_lock_store, reserve_shop_import, release_shop_import,
+                                 get_shop_import_lock, get_task_import_lock)
+from backend.tasks import import_shop_data_task, import_all_shops_data_task
+from backend.tests.test_import_utils import build_shop_yaml
+
+
+class ImportLockTestCase(TestCase):
+    """Тестирование блокировки импорта магазина (аренда в памяти процесса)."""
+    def setUp(self):
+        """Создаём тестовый магазин и очищаем аренды."""
+        self.shop = Shop.objects.create(name="Магазин с блокировкой", state=True)
+        local_lock_store.clear()
+        self.addCleanup(local_lock_store.clear)
+
+
+    def test_reserve_returns_current_holder(self):
+        """Тест: аренду держит первая задача, освободить её может только владелец."""
+        # 1. Проверка захвата и повторного захвата владельцем
+        self.assertEqual(reserve_shop_import(self.shop.id, "task_1"), "task_1")
+        self.assertEqual(reserve_shop_import(self.shop.id, "task_1"), "task_1")
+        # 2. Проверка, что другая задача получает ID владельца
+        self.assertEqual(reserve_shop_import(self.shop.id, "task_2"), "task_1")
+        self.assertFalse(release_shop_import(self.shop.id, "task_2"))
+        self.assertEqual(get_task_import_lock("task_1")["held"], True)
+        # 3. Проверка освобождения аренды
+        self.assertTrue(release_shop_import(self.shop.id, "task_1"))
+        self.assertIsNone(get_shop_import_lock(self.shop.id))
+        self.assertEqual(reserve_shop_import(self.shop.id, "task_2"), "task_2")
+
+
+    def test_expired_lease_can_be_taken(self):
+        """Тест: истёкшая аренда не мешает новому импорту."""
+        with patch("backend.import_lock.time.monotonic", return_value=1000.0):
+            reserve_shop_import(self.shop.id, "task_1", ttl=10)
+        with patch("backend.import_lock.time.monotonic", return_value=1011.0):
+            self.assertEqual(reserve_shop_import(self.shop.id, "task_2"), "task_2")
+
+
+    def test_import_task_skips_locked_shop_and_releases_own_lock(self):
+        """Тест: задача импорта пропускает занятый магазин и освобождает свою аренду после импорта."""
+        file = tempfile.NamedTemporaryFile("w", suffix=".yaml", encoding="utf-8", delete=False)
+        with file:
+            yaml.safe_dump(build_shop_yaml(categories=1, products=1, infos=2), file, allow_unicode=True)
+        self.addCleanup(os.remove, file.name)
+
+        # 1. Проверка, что при чужой аренде импорт пропускается
+        reserve_shop_import(self.shop.id, "running_task")
+        result = import_shop_data_task(self.shop.id, file.name)
+        self.assertEqual(result["status"], "skipped")
+        self.assertEqual(result["task_id"], "running_task")
+        self.assertEqual(ProductInfo.objects.count(), 0)
+
+        # 2. Проверка, что после освобождения импорт выполняется и аренда снимается
+        release_shop_import(self.shop.id, "running_task")
+        result = import_shop_data_task(self.shop.id, file.name)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(ProductInfo.objects.count(), 2)
+        self.assertIsNone(get_shop_import_lock(self.shop.id))
+
+
+    def test_all_shops_import_reports_skipped_when_every_shop_is_locked(self):
+        """Тест: если все магазины уже импортируются, отчёт имеет тот же вид со статусом "Пропущено"."""
+        reserve_shop_import(self.shop.id, "running_task")
+
+        result = import_all_shops_data_task()
+
+        self.assertEqual(result["overall_status"], "Пропущено")
+        self.assertIn("Пропущено (импорт уже выполняется): 1", result["summary"])
+        self.assertEqual([shop["status"] for shop in result["results"]], ["skipped"])
+        self.assertEqual(result["already_running"], {self.shop.id: "running_task"})
@@ -0,0 +1,567 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import yaml
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from backend.models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem
+from backend.utils import (load_shop_data, load_shop_data_from_yaml, preview_shop_data, iter_yaml_records,
+                           iter_record_chunks, file_content_hash,
+                           ShopDataImporter, ImportProgress)
+from backend.tasks import import_shop_data_chunked_task, import_shop_chunk_task, finalize_chunked_import_task
+from backend.feed_storage import local_feed_file, store_feed_chunk
+
+
+def build_shop_yaml(categories: int, products: int, infos: int, parameters: int = 2) -> dict:
+    """Формирует данные YAML-файла поставщика заданного размера."""
+    return {
+        "categories": [
+            {
+                "name": f"Категория {c}",
+                "description": f"Описание {c}",
+                "products": [
+                    {
+                        "name": f"Товар {c}-{p}",
+                        "product_infos": [
+                            {
+                                "name": f"Вариант {c}-{p}-{i}",
+                                "price": 100 + i,
+                                "price_rrc": 120 + i,
+                                "quantity": 10 + i,
+                                "parameters": [
+                                    {"name": f"Параметр {k}", "value": f"Значение {k}"}
+                                    for k in range(parameters)
+                                ],
+                            }
+                            for i in range(infos)
+                        ],
+                    }
+                    for p in range(products)
+                ],
+            }
+            for c in range(categories)
+        ]
+    }
+
+
+class LoadShopDataFromYamlTestCase(TestCase):
+    """Тестирование пакетного импорта данных магазина из YAML."""
+    def setUp(self):
+        """Создаём тестовый магазин."""
+        self.shop = Shop.objects.create(name="Тестовый Магазин Импорта", state=True)
+
+    def write_yaml(self, data: dict) -> str:
+        """Сохраняет данные во временный YAML-файл и возвращает путь к нему."""
+        file = tempfile.NamedTemporaryFile("w", suffix=".yaml", encoding="utf-8", delete=False)
+        with file:
+            yaml.safe_dump(data, file, allow_unicode=True)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def write_file(self, content: str, suffix: str) -> str:
+        """Сохраняет текст во временный файл с заданным расширением и возвращает путь к нему."""
+        file = tempfile.NamedTemporaryFile("w", suffix=suffix, encoding="utf-8", delete=False, newline="")
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def assert_same_catalog_as_yaml(self, data: dict, path: str) -> None:
+        """Импортирует файл в отдельный магазин и сравнивает его строки с импортом того же YAML."""
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        other_shop = Shop.objects.create(name="Магазин другого формата", state=True)
+
+        result = load_shop_data(other_shop.id, path)
+
+        self.assertEqual(result["status"], "success")
+        rows = lambda shop: set(
+            ProductInfo.objects.filter(shop=shop).values_list("product__name", "name", "price", "quantity", "fingerprint")
+        )
+        self.assertEqual(rows(other_shop), rows(self.shop))
+        self.assertEqual(
+            set(ProductParameter.objects.filter(product_info__shop=other_shop)
+                .values_list("product_info__name", "parameter__name", "value")),
+            set(ProductParameter.objects.filter(product_info__shop=self.shop)
+                .values_list("product_info__name", "parameter__name", "value")),
+        )
+
+
+    def test_import_creates_rows_and_returns_counts(self):
+        """Тест: первичный импорт создаёт строки и возвращает счётчики по таблицам."""
+        path = self.write_yaml(build_shop_yaml(categories=2, products=3, infos=2))
+
+        result = load_shop_data_from_yaml(self.shop.id, path)
+
+        # 1. Проверка статуса и счётчиков
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["categories"]["inserted"], 2)
+        self.assertEqual(result["counts"]["products"]["inserted"], 6)
+        self.assertEqual(result["counts"]["product_infos"]["inserted"], 12)
+        self.assertEqual(result["counts"]["parameters"]["inserted"], 2)
+        self.assertEqual(result["counts"]["product_parameters"]["inserted"], 24)
+        # 2. Проверка данных в БД
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 12)
+        self.assertEqual(ProductParameter.objects.count(), 24)
+        self.assertEqual(Parameter.objects.count(), 2)
+        self.assertEqual(self.shop.categories.count(), 2)
+
+
+    def test_reimport_updates_existing_rows(self):
+        """Тест: повторный импорт обновляет существующие строки, не создавая дубликатов."""
+        data = build_shop_yaml(categories=1, products=2, infos=1)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        # Меняем цену и переносим товар в новую категорию
+        data["categories"][0]["products"][0]["product_infos"][0]["price"] = 555
+        data["categories"].append({"name": "Новая категория", "products": [data["categories"][0]["products"].pop()]})
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        # 1. Проверка счётчиков
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["product_infos"]["inserted"], 0)
+        self.assertEqual(result["counts"]["products"]["updated"], 1)
+        # 2. Проверка данных в БД
+        self.assertEqual(ProductInfo.objects.count(), 2)
+        self.assertEqual(ProductInfo.objects.get(name="Вариант 0-0-0").price, 555)
+        self.assertEqual(Product.objects.get(name="Товар 0-1").category.name, "Новая категория")
+        self.assertEqual(Category.objects.count(), 2)
+
+
+    def test_query_count_does_not_grow_with_feed_size(self):
+        """Тест: число запросов импорта, удаления пропавших товаров и параметров не зависит от количества строк."""
+        other_shop = Shop.objects.create(name="Второй Магазин Импорта", state=True)
+        large_data = build_shop_yaml(1, 20, 5)
+        for category in large_data["categories"]:
+            category["name"] += " (большой)"
+            for product in category["products"]:
+                product["name"] += " (большой)"
+
+        queries = {}
+        for size, shop, data in (("small", self.shop, build_shop_yaml(1, 2, 2)), ("large", other_shop, large_data)):
+            with CaptureQueriesContext(connection) as first_import:
+                load_shop_data_from_yaml(shop.id, self.write_yaml(data))
+            # Последний товар пропадает из файла, у остальных вариантов удаляется параметр
+            data["categories"][0]["products"].pop()
+            for product in data["categories"][0]["products"]:
+                for info in product["product_infos"]:
+                    info["parameters"].pop()
+            with CaptureQueriesContext(connection) as second_import:
+                result = load_shop_data_from_yaml(shop.id, self.write_yaml(data))
+            self.assertGreater(result["counts"]["product_infos"]["removed"], 0)
+            self.assertGreater(result["counts"]["product_parameters"]["removed"], 0)
+            queries[size] = (len(first_import), len(second_import))
+
+        # 1. Проверка, что 100 строк записаны тем же числом запросов, что и 4
+        self.assertEqual(ProductInfo.objects.filter(shop=other_shop).count(), 95)
+        self.assertLessEqual(queries["large"][0], queries["small"][0])
+        # 2. Проверка, что удаление пропавших товаров и параметров тоже не зависит от числа строк
+        self.assertLessEqual(queries["large"][1], queries["small"][1])
+
+
+    def test_missing_file_returns_error(self):
+        """Тест: импорт несуществующего файла возвращает ошибку."""
+        result = load_shop_data_from_yaml(self.shop.id, "data/не_существует.yaml")
+
+        self.assertEqual(result["status"], "error")
+
+
+    def test_streaming_import_matches_full_load(self):
+        """Тест: потоковый импорт даёт тот же результат, что и загрузка файла целиком."""
+        data = build_shop_yaml(categories=2, products=3, infos=2)
+        # Ключи категории после товаров и посторонние ключи верхнего уровня не мешают разбору
+        data["name"] = "Магазин"
+        data["categories"][1] = {"products": data["categories"][1]["products"], "name": "Категория 1"}
+
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml(data), streaming=True)
+
+        # 1. Проверка статуса и счётчиков
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["product_infos"]["inserted"], 12)
+        self.assertEqual(result["counts"]["product_parameters"]["inserted"], 24)
+        # 2. Проверка данных в БД
+        self.assertEqual(Product.objects.filter(category__name="Категория 1").count(), 3)
+        self.assertEqual(self.shop.categories.count(), 2)
+
+
+    def test_streaming_import_rejects_non_mapping_file(self):
+        """Тест: потоковый импорт файла, не содержащего словарь, возвращает ошибку."""
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml(["не", "словарь"]), streaming=True)
+
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(ProductInfo.objects.count(), 0)
+
+
+    def test_unchanged_file_is_skipped(self):
+        """Тест: повторный импорт того же файла не пишет в БД."""
+        path = self.write_yaml(build_shop_yaml(categories=1, products=2, infos=2))
+        load_shop_data_from_yaml(self.shop.id, path)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = load_shop_data_from_yaml(self.shop.id, path)
+
+        # 1. Проверка, что импорт завершён без записи строк
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["product_infos"]["inserted"], 0)
+        self.assertEqual(result["counts"]["product_infos"]["updated"], 0)
+        self.assertFalse([query for query in queries.captured_queries if "UPDATE" in query["sql"]])
+
+
+    def test_delta_import_rewrites_only_changed_rows(self):
+        """Тест: изменённая строка обновляется, остальные пропускаются по отпечатку."""
+        data = build_shop_yaml(categories=1, products=2, infos=2)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        changed_info = data["categories"][0]["products"][1]["product_infos"][0]
+        changed_info["quantity"] = 99
+        changed_info["parameters"] = changed_info["parameters"][:1]
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        # 1. Проверка счётчиков
+        counts = result["counts"]
+        self.assertEqual(counts["product_infos"]["updated"], 1)
+        self.assertEqual(counts["product_infos"]["unchanged"], 3)
+        self.assertEqual(counts["product_parameters"]["removed"], 1)
+        # 2. Проверка данных в БД
+        info = ProductInfo.objects.get(name="Вариант 0-1-0")
+        self.assertEqual(info.quantity, 99)
+        self.assertEqual(info.product_parameters.count(), 1)
+
+
+    @patch("backend.cache_invalidation.clear_product_list_cache")
+    @patch("backend.cache_invalidation.invalidate_product_list_tags")
+    def test_import_invalidates_only_affected_cache_tags(self, mock_tags, mock_clear):
+        """Тест: импорт инвалидирует кэш магазина и изменённых категорий, а общие строки — весь кэш."""
+        data = build_shop_yaml(categories=2, products=1, infos=1)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        first, second = (Category.objects.get(name=f"Категория {number}").id for number in range(2))
+        mock_tags.reset_mock()
+
+        # 1. Проверка: изменился товар второй категории — инвалидируются только её теги
+        data["categories"][1]["products"][0]["product_infos"][0]["quantity"] = 99
+        with self.captureOnCommitCallbacks(execute=True):
+            load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        mock_tags.assert_called_once_with({self.shop.id}, {second})
+
+        # 2. Проверка: товар первой категории пропал из файла — инвалидируется его категория
+        data["categories"][0]["products"] = []
+        with self.captureOnCommitCallbacks(execute=True):
+            load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        mock_tags.assert_called_with({self.shop.id}, {first})
+        mock_clear.assert_not_called()
+
+        # 3. Проверка: изменилось описание категории (видно всем магазинам) — очищается весь кэш
+        data["categories"][1]["description"] = "Новое описание"
+        with self.captureOnCommitCallbacks(execute=True):
+            load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        mock_clear.assert_called_once_with()
+
+
+    @patch("backend.cache_invalidation.invalidate_product_details")
+    def test_import_invalidates_changed_product_details(self, mock_details):
+        """Тест: импорт удаляет из кэша карточки только изменившихся и пропавших товаров."""
+        data = build_shop_yaml(categories=1, products=3, infos=1)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        first, second, third = (Product.objects.get(name=f"Товар 0-{number}").id for number in range(3))
+
+        # 1. Проверка: изменился второй товар, третий пропал из файла
+        data["categories"][0]["products"][1]["product_infos"][0]["quantity"] = 99
+        del data["categories"][0]["products"][2]
+        with self.captureOnCommitCallbacks(execute=True):
+            load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        mock_details.assert_called_once_with({second, third})
+        self.assertNotIn(first, mock_details.call_args.args[0])
+
+
+    def use_temp_media_root(self):
+        """Подменяет хранилище временным каталогом (туда пишутся части импорта)."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+    def store_chunks(self, data: dict, chunk_size: int) -> list:
+        """Делит записи файла на части и сохраняет их в хранилище, как import_shop_data_chunked_task."""
+        self.use_temp_media_root()
+        chunks = iter_record_chunks(iter_yaml_records(data["categories"]), chunk_size)
+        return [store_feed_chunk("test", number, chunk) for number, chunk in enumerate(chunks)]
+
+
+    def test_chunked_import_matches_single_import(self):
+        """Тест: импорт по частям с общими категориями и товарами даёт тот же результат."""
+        data = build_shop_yaml(categories=2, products=3, infos=3)
+        path = self.write_yaml(data)
+        chunk_names = self.store_chunks(data, chunk_size=4)
+
+        # Части получают только имена своих файлов, затем завершающая задача сводит результаты
+        results = [import_shop_chunk_task(self.shop.id, chunk_name) for chunk_name in chunk_names]
+        result = finalize_chunked_import_task(results, self.shop.id, path, "hash")
+
+        # 1. Проверка статуса и сводных счётчиков
+        self.assertEqual(len(chunk_names), 5)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["product_infos"]["inserted"], 18)
+        self.assertEqual(result["counts"]["categories"]["inserted"], 2)
+        # 2. Проверка данных в БД, сохранённого хэша файла и удаления файлов частей
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 18)
+        self.assertEqual(Product.objects.count(), 6)
+        self.assertEqual(ProductParameter.objects.count(), 36)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.source_hash, "hash")
+        self.assertFalse(any(default_storage.exists(chunk_name) for chunk_name in chunk_names))
+
+
+    def test_chunked_import_reads_and_hashes_feed_once(self):
+        """Тест: файл читается и хэшируется один раз, а части получают имена своих файлов в хранилище."""
+        self.use_temp_media_root()
+        path = self.write_yaml(build_shop_yaml(categories=2, products=2, infos=2))
+
+        with patch("backend.tasks.chord") as mock_chord, \
+                patch("backend.tasks.file_content_hash", wraps=file_content_hash) as mock_hash, \
+                patch("backend.tasks.local_feed_file", wraps=local_feed_file) as mock_open:
+            result = import_shop_data_chunked_task.apply(args=(self.shop.id, path, 3)).get()
+        header = mock_chord.call_args.args[0]
+        callback = mock_chord.return_value.call_args.args[0]
+        results = [chunk.type(*chunk.args) for chunk in header.tasks]
+        callback.type(results, *callback.args)
+
+        # 1. Проверка: файл поставщика открыт и хэширован один раз, частей столько, сколько записано
+        mock_open.assert_called_once_with(path)
+        mock_hash.assert_called_once()
+        self.assertEqual(result["chunks_count"], 3)
+        self.assertEqual(len(header.tasks), 3)
+        # 2. Проверка данных в БД и сохранённого хэша файла
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 8)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.source_hash, file_content_hash(path))
+
+
+    def test_missing_chunk_file_is_reported(self):
+        """Тест: часть, файла которой нет в хранилище, возвращает ошибку и ничего не импортирует."""
+        self.use_temp_media_root()
+
+        result = import_shop_chunk_task(self.shop.id, "feeds/chunks/test/00000.jsonl")
+
+        self.assertEqual(result["status"], "error")
+        self.assertFalse(ProductInfo.objects.filter(shop=self.shop).exists())
+
+
+    def test_products_dropped_from_feed_are_swept(self):
+        """Тест: товары, пропавшие из файла, удаляются, а товары из заказов обнуляются."""
+        data = build_shop_yaml(categories=2, products=2, infos=1)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        ordered_info = ProductInfo.objects.get(name="Вариант 0-1-0")
+        OrderItem.objects.create(order=Order.objects.create(), product_info=ordered_info, quantity=1)
+
+        # Убираем из файла вторую категорию и второй товар первой категории
+        data["categories"][0]["products"].pop()
+        data["categories"].pop()
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        # 1. Проверка счётчиков удаления
+        counts = result["counts"]
+        self.assertEqual(counts["product_infos"]["removed"], 3)
+        self.assertEqual(counts["product_parameters"]["removed"], 4)
+        self.assertEqual(counts["category_links"]["removed"], 1)
+        # 2. Проверка данных в БД: товар из заказа сохранён с нулевым остатком
+        self.assertEqual(
+            set(ProductInfo.objects.filter(shop=self.shop).values_list("name", "quantity")),
+            {("Вариант 0-0-0", 10), ("Вариант 0-1-0", 0)},
+        )
+        self.assertEqual(list(self.shop.categories.values_list("name", flat=True)), ["Категория 0"])
+
+        # 3. Проверка, что вернувшийся в файл товар снова получает остаток
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(build_shop_yaml(categories=1, products=2, infos=1)))
+        ordered_info.refresh_from_db()
+        self.assertEqual(ordered_info.quantity, 10)
+
+
+    def test_zero_quantity_and_incomplete_rows_are_not_swept(self):
+        """Тест: нулевой остаток импортируется, а неполная строка из файла пропускается, но не удаляется."""
+        data = build_shop_yaml(categories=1, products=2, infos=1)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        # Первый товар закончился, у второго пропала цена
+        data["categories"][0]["products"][0]["product_infos"][0]["quantity"] = 0
+        del data["categories"][0]["products"][1]["product_infos"][0]["price"]
+        path = self.write_yaml(data)
+        preview = preview_shop_data(self.shop.id, path)
+        counts = load_shop_data_from_yaml(self.shop.id, path)["counts"]["product_infos"]
+
+        # 1. Проверка счётчиков предпросмотра и импорта
+        self.assertEqual(preview["summary"]["remove"], 0)
+        self.assertEqual((counts["updated"], counts["removed"]), (1, 0))
+        # 2. Проверка данных в БД
+        self.assertEqual(
+            set(ProductInfo.objects.filter(shop=self.shop).values_list("name", "quantity")),
+            {("Вариант 0-0-0", 0), ("Вариант 0-1-0", 10)},
+        )
+
+
+    def test_empty_feed_does_not_sweep_catalog(self):
+        """Тест: файл без товаров не удаляет ассортимент магазина."""
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(build_shop_yaml(categories=1, products=2, infos=1)))
+
+        result = load_shop_data_from_yaml(self.shop.id, self.write_yaml({"categories": []}))
+
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 2)
+
+
+    def test_chunked_import_sweeps_products_missing_from_all_chunks(self):
+        """Тест: импорт по частям удаляет только товары, которых нет ни в одной части."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+
+        data["categories"][1]["products"].pop()
+        path = self.write_yaml(data)
+        results = [import_shop_chunk_task(self.shop.id, name) for name in self.store_chunks(data, chunk_size=2)]
+        result = finalize_chunked_import_task(results, self.shop.id, path, "hash")
+
+        # 1. Проверка счётчиков и данных в БД
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["counts"]["product_infos"]["removed"], 2)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 6)
+
+
+    def test_json_import_matches_yaml(self):
+        """Тест: JSON той же структуры импортируется так же, как YAML."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+
+        self.assert_same_catalog_as_yaml(data, self.write_file(json.dumps(data, ensure_ascii=False), ".json"))
+
+
+    def test_ndjson_import_matches_yaml(self):
+        """Тест: NDJSON (строка на вариант товара, параметры словарём) импортируется так же, как YAML."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+        lines = [
+            json.dumps({
+                "category": category["name"], "category_description": category["description"],
+                "product": product["name"], "name": info["name"], "price": info["price"],
+                "price_rrc": info["price_rrc"], "quantity": info["quantity"],
+                "parameters": {parameter["name"]: parameter["value"] for parameter in info["parameters"]},
+            }, ensure_ascii=False)
+            for category in data["categories"]
+            for product in category["products"]
+            for info in product["product_infos"]
+        ]
+
+        self.assert_same_catalog_as_yaml(data, self.write_file("\n".join(lines) + "\n\n", ".ndjson"))
+
+
+    def test_csv_import_matches_yaml(self):
+        """Тест: CSV с плоскими столбцами и столбцами param:* импортируется так же, как YAML."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+        lines = ["category,category_description,product,info,price,price_rrc,quantity,param:Параметр 0,param:Параметр 1"]
+        for category in data["categories"]:
+            for product in category["products"]:
+                for info in product["product_infos"]:
+                    values = [parameter["value"] for parameter in info["parameters"]]
+                    lines.append(",".join([
+                        category["name"], category["description"], product["name"], info["name"],
+                        str(info["price"]), str(info["price_rrc"]), str(info["quantity"]), *values,
+                    ]))
+
+        self.assert_same_catalog_as_yaml(data, self.write_file("\r\n".join(lines), ".csv"))
+
+
+    def test_malformed_feeds_return_error(self):
+        """Тест: файлы с ошибками формата не импортируются."""
+        broken_files = [
+            self.write_file('{"categories": [', ".json"),
+            self.write_file('{"category": "Категория", "product": "Товар"}\nне json\n', ".ndjson"),
+            self.write_file("category,product,price\nКатегория,Товар,10\n", ".csv"),
+            self.write_file("category,product,info,price,price_rrc,quantity\nК,Т,В,дорого,10,1\n", ".csv"),
+        ]
+
+        for path in broken_files:
+            with self.subTest(path=path):
+                result = load_shop_data(self.shop.id, path)
+                # 1. Проверка, что импорт завершился ошибкой формата без записи строк
+                self.assertEqual(result["status"], "error")
+                self.assertIn("Неверный формат файла", result["message"])
+                self.assertEqual(ProductInfo.objects.count(), 0)
+
+
+    def test_dry_run_previews_changes_without_writing(self):
+        """Тест: предпросмотр не пишет в БД и совпадает с результатом последующего импорта."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+        load_shop_data_from_yaml(self.shop.id, self.write_yaml(data))
+        data["categories"][0]["products"][0]["product_infos"][0]["price"] = 999  # изменение цены
+        data["categories"][0]["products"][0]["product_infos"][1]["parameters"].pop()  # изменение параметров
+        data["categories"][1]["products"].pop()  # удаление двух вариантов
+        data["categories"][0]["products"].append(  # новый товар
+            {"name": "Новый товар", "product_infos": [{"name": "Новый вариант", "price": 10, "price_rrc": 12,
+                                                       "quantity": 1, "parameters": []}]}
+        )
+        path = self.write_yaml(data)
+
+        with CaptureQueriesContext(connection) as queries:
+            preview = preview_shop_data(self.shop.id, path)
+
+        # 1. Проверка, что предпросмотр только читал БД
+        self.assertEqual(preview["status"], "success")
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in queries.captured_queries))
+        self.assertEqual(ProductInfo.objects.get(name="Вариант 0-0-0").price, 100)
+        # 2. Проверка сводки и подробностей изменений
+        self.assertEqual(preview["summary"], {"create": 1, "update": 2, "unchanged": 4, "remove": 2})
+        updates = {change["name"]: change for change in preview["sample"]["update"]}
+        self.assertEqual(updates["Вариант 0-0-0"]["old"]["price"], "100.00")
+        self.assertEqual(updates["Вариант 0-0-0"]["new"]["price"], "999.00")
+        self.assertEqual(updates["Вариант 0-0-0"]["changed_fields"], ["price"])
+        self.assertEqual(updates["Вариант 0-0-1"]["changed_fields"], ["parameters"])
+        # 3. Проверка, что импорт выполняет ровно предсказанные изменения
+        counts = load_shop_data_from_yaml(self.shop.id, path)["counts"]["product_infos"]
+        self.assertEqual(
+            (counts["inserted"], counts["updated"], counts["unchanged"], counts["removed"]), (1, 2, 4, 2)
+        )
+
+
+    def test_dry_run_saves_full_diff(self):
+        """Тест: полный отчёт предпросмотра сохраняется в хранилище построчно."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        path = self.write_yaml(build_shop_yaml(categories=1, products=2, infos=2))
+
+        with override_settings(MEDIA_ROOT=media_root):
+            preview = preview_shop_data(self.shop.id, path, full_diff=True)
+            with default_storage.open(preview["diff_file"], "rb") as diff_file:
+                changes = [json.loads(line) for line in diff_file]
+
+        self.assertEqual(len(changes), 4)
+        self.assertEqual({change["action"] for change in changes}, {"create"})
+
+
+    def test_dry_run_reports_invalid_values(self):
+        """Тест: неверная цена в файле даёт ошибку предпросмотра, а не исключение задачи."""
+        data = build_shop_yaml(categories=1, products=1, infos=1)
+        data["categories"][0]["products"][0]["product_infos"][0]["price"] = "сто рублей"
+
+        preview = preview_shop_data(self.shop.id, self.write_yaml(data))
+
+        self.assertEqual(preview["status"], "error")
+        self.assertNotIn("summary", preview)
+
+
+    def test_progress_is_reported_during_import(self):
+        """Тест: импорт публикует прогресс с числом обработанных записей и текущей категорией."""
+        data = build_shop_yaml(categories=2, products=2, infos=2)
+        reports = []
+        progress = ImportProgress(reports.append, total=8, interval=0)
+
+        importer = ShopDataImporter(self.shop, batch_size=3, progress=progress)
+        importer.add_records(iter_yaml_records(data["categories"]))
+        importer.finish()
+
+        # 1. Проверка последнего опубликованного прогресса
+        self.assertEqual(reports[-1]["processed"], 8)
+        self.assertEqual(reports[-1]["percent"], 100.0)
+        self.assertEqual(reports[-1]["current_category"], "Категория 1")
+        self.assertEqual(reports[-1]["eta_seconds"], 0.0)
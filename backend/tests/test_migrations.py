@@ -0,0 +1,71 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class UniqueImportKeysMigrationTest(TransactionTestCase):
+    """Миграции 0011 объединяют дубли, созданные прежним импортом, до добавления уникальных ограничений."""
+
+    migrate_from = [("backend", "0010_product_detail_view_product_original_image_and_more")]
+    migrate_to = [("backend", "0011_unique_import_keys")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_and_references_repointed(self):
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model("backend", "User")
+        Shop = apps.get_model("backend", "Shop")
+        Category = apps.get_model("backend", "Category")
+        Product = apps.get_model("backend", "Product")
+        ProductInfo = apps.get_model("backend", "ProductInfo")
+        Parameter = apps.get_model("backend", "Parameter")
+        ProductParameter = apps.get_model("backend", "ProductParameter")
+        Cart = apps.get_model("backend", "Cart")
+        CartItem = apps.get_model("backend", "CartItem")
+
+        shop = Shop.objects.create(name="Связной")
+        other_shop = Shop.objects.create(name="Евросеть")
+        category = Category.objects.create(name="Смартфоны")
+        category.shops.add(shop)
+        duplicate_category = Category.objects.create(name="Смартфоны")
+        duplicate_category.shops.add(other_shop)
+        product = Product.objects.create(name="iPhone", category=category)
+        duplicate_product = Product.objects.create(name="iPhone", category=duplicate_category)
+        color = Parameter.objects.create(name="Цвет")
+        duplicate_color = Parameter.objects.create(name="Цвет")
+        memory = Parameter.objects.create(name="Память")
+        info_fields = {"shop": shop, "name": "iPhone", "quantity": 1, "price": 100, "price_rrc": 110}
+        info = ProductInfo.objects.create(product=product, **info_fields)
+        duplicate_info = ProductInfo.objects.create(product=duplicate_product, **info_fields)
+        ProductParameter.objects.create(product_info=info, parameter=color, value="чёрный")
+        ProductParameter.objects.create(product_info=duplicate_info, parameter=duplicate_color, value="белый")
+        ProductParameter.objects.create(product_info=duplicate_info, parameter=memory, value="128")
+        cart = Cart.objects.create(user=User.objects.create(email="buyer@example.com", username="buyer"))
+        CartItem.objects.create(cart=cart, product_info=info, quantity=1)
+        CartItem.objects.create(cart=cart, product_info=duplicate_info, quantity=2)
+
+        apps = self.migrate(self.migrate_to)
+        Category = apps.get_model("backend", "Category")
+        Product = apps.get_model("backend", "Product")
+        ProductInfo = apps.get_model("backend", "ProductInfo")
+        Parameter = apps.get_model("backend", "Parameter")
+        ProductParameter = apps.get_model("backend", "ProductParameter")
+        CartItem = apps.get_model("backend", "CartItem")
+
+        self.assertEqual(list(Category.objects.values_list("id", flat=True)), [category.id])
+        self.assertEqual(set(Category.objects.get().shops.values_list("id", flat=True)), {shop.id, other_shop.id})
+        self.assertEqual(list(Product.objects.values_list("id", "category_id")), [(product.id, category.id)])
+        self.assertEqual(set(Parameter.objects.values_list("id", flat=True)), {color.id, memory.id})
+        self.assertEqual(list(ProductInfo.objects.values_list("id", flat=True)), [info.id])
+        self.assertEqual(
+            set(ProductParameter.objects.values_list("product_info_id", "parameter_id", "value")),
+            {(info.id, color.id, "чёрный"), (info.id, memory.id, "128")},
+        )
+        self.assertEqual(list(CartItem.objects.values_list("product_info_id", "quantity")), [(info.id, 3)])
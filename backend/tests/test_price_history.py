@@ -0,0 +1,103 @@
+import os
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+
+import yaml
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from backend.models import Shop, ProductInfo, ProductInfoHistory, Order, OrderItem
+from backend.utils import load_shop_data_from_yaml
+from backend.tests.test_import_utils import build_shop_yaml
+
+
+User = get_user_model()
+
+
+class PriceHistoryTestCase(APITestCase):
+    """Тестирование истории цен и остатков"""
+    def setUp(self):
+        """Создаём магазин и авторизованного пользователя."""
+        self.shop = Shop.objects.create(name="Магазин с историей", state=True)
+        self.user = User.objects.create_user(
+            username="analyst@example.com", email="analyst@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def import_data(self, data: dict) -> dict:
+        """Импортирует данные через временный YAML-файл."""
+        file = tempfile.NamedTemporaryFile("w", suffix=".yaml", encoding="utf-8", delete=False)
+        with file:
+            yaml.safe_dump(data, file, allow_unicode=True)
+        self.addCleanup(os.remove, file.name)
+        return load_shop_data_from_yaml(self.shop.id, file.name)
+
+
+    def test_import_records_history_only_for_changed_values(self):
+        """Тест: история пишется при создании строки и при изменении цены или количества."""
+        data = build_shop_yaml(categories=1, products=1, infos=2)
+        result = self.import_data(data)
+        self.assertEqual(result["counts"]["price_history"]["inserted"], 2)
+
+        # Меняем цену одного варианта и только параметры другого
+        data["categories"][0]["products"][0]["product_infos"][0]["price"] = 150
+        data["categories"][0]["products"][0]["product_infos"][1]["parameters"].pop()
+        result = self.import_data(data)
+
+        # 1. Проверка, что изменение параметров не попало в историю
+        self.assertEqual(result["counts"]["price_history"]["inserted"], 1)
+        info = ProductInfo.objects.get(name="Вариант 0-0-0")
+        self.assertEqual(list(info.history.values_list("price", flat=True)), [Decimal("100.00"), Decimal("150.00")])
+        self.assertEqual(ProductInfo.objects.get(name="Вариант 0-0-1").history.count(), 1)
+
+
+    def test_swept_ordered_product_gets_single_zero_history_row(self):
+        """Тест: товар из нескольких заказов, пропавший из файла, обнуляется одной строкой истории."""
+        self.import_data(build_shop_yaml(categories=1, products=2, infos=1))
+        ordered_info = ProductInfo.objects.get(name="Вариант 0-1-0")
+        for _ in range(2):
+            OrderItem.objects.create(order=Order.objects.create(), product_info=ordered_info, quantity=1)
+
+        result = self.import_data(build_shop_yaml(categories=1, products=1, infos=1))
+
+        # 1. Проверка счётчиков импорта: учтены и удаление, и запись истории
+        self.assertEqual(result["counts"]["product_infos"]["removed"], 1)
+        self.assertEqual(result["counts"]["price_history"]["inserted"], 1)
+        # 2. Проверка истории обнулённого товара
+        self.assertEqual(list(ordered_info.history.values_list("quantity", flat=True)), [10, 0])
+
+
+    def test_history_endpoint_returns_points_and_buckets(self):
+        """Тест: эндпоинт истории возвращает точки и агрегаты по дням (ожидаем 200)."""
+        self.import_data(build_shop_yaml(categories=1, products=1, infos=1))
+        info = ProductInfo.objects.get()
+        info.history.all().delete()
+        for day, hour, price, quantity in [(1, 9, 100, 5), (1, 18, 120, 3), (2, 10, 90, 7)]:
+            ProductInfoHistory.objects.create(
+                product_info=info, price=price, price_rrc=price, quantity=quantity,
+                recorded_at=timezone.make_aware(datetime(2026, 3, day, hour)),
+            )
+        url = reverse("product_info_history_api_v1", kwargs={"id": info.id})
+
+        # 1. Проверка точек истории за период
+        response = self.client.get(url, {"date_from": "2026-03-01", "date_to": "2026-03-01"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([point["price"] for point in response.data], ["100.00", "120.00"])
+
+        # 2. Проверка агрегатов по дням
+        response = self.client.get(url, {"bucket": "day"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]["price_min"], "100.00")
+        self.assertEqual(response.data[0]["price_max"], "120.00")
+        self.assertEqual(response.data[0]["price_avg"], "110.00")
+        self.assertEqual(response.data[0]["quantity_min"], 3)
+        self.assertEqual(response.data[0]["changes"], 2)
+
+        # 3. Проверка неверного интервала
+        response = self.client.get(url, {"bucket": "year"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
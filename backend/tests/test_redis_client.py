@@ -0,0 +1,147 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from backend import redis_client
+from backend.circuit_breaker import CircuitBreaker
+from backend.cache_codec import ZLIB_HEADER, CACHE_COMPRESS_MIN_SIZE, compression_stats
+
+
+class RedisClientTestCase(TestCase):
+    """Тестирование ленивого подключения к Redis и пакетных операций кэша."""
+    def setUp(self):
+        """Подменяем клиента Redis и сбрасываем состояние подключения модуля."""
+        self.client = MagicMock()
+        patchers = [
+            patch("backend.redis_client.get_redis_client", return_value=self.client),
+            patch("backend.redis_client._connected", False),
+            patch("backend.redis_client._next_connect_at", 0.0),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        redis_client.redis_breaker.reset()
+        self.addCleanup(redis_client.redis_breaker.reset)
+
+
+    def test_unavailable_redis_is_retried_after_interval(self):
+        """Тест: недоступный при старте Redis подключается позже, после подключения PING не повторяется."""
+        self.client.ping.side_effect = [ConnectionError("refused"), True]
+
+        with patch("backend.redis_client.time.monotonic", return_value=100.0):
+            # 1. Проверка, что неудачное подключение повторяется не раньше REDIS_RECONNECT_INTERVAL
+            self.assertFalse(redis_client.is_redis_connected())
+            self.assertFalse(redis_client.is_redis_connected())
+            self.assertEqual(self.client.ping.call_count, 1)
+
+        with patch("backend.redis_client.time.monotonic", return_value=100.0 + redis_client.REDIS_RECONNECT_INTERVAL):
+            # 2. Проверка, что после паузы Redis подключается и дальше не пингуется
+            self.assertTrue(redis_client.is_redis_connected())
+            self.assertTrue(redis_client.is_redis_connected())
+            self.assertEqual(self.client.ping.call_count, 2)
+        # 3. Проверка, что PING идёт через клиента с бюджетом, а не с обычным таймаутом и повторами
+        redis_client.get_redis_client.assert_called_with(redis_client.REDIS_CACHE_WRITE_TIMEOUT_MS)
+
+
+    def test_cache_calls_cost_single_round_trip(self):
+        """Тест: чтение и пакетные операции выполняются одной командой, без SELECT."""
+        self.client.get.return_value = b'{"a": 1}'
+        self.client.mget.return_value = [b"1", None]
+
+        self.assertEqual(redis_client.get_cache("key"), {"a": 1})
+        self.assertEqual(redis_client.get_many_cache(["k1", "k2"]), {"k1": 1})
+        self.assertTrue(redis_client.set_many_cache({"k1": 1, "k2": 2}, timeout=60))
+
+        self.client.execute_command.assert_not_called()
+        self.client.mget.assert_called_once_with(["k1", "k2"])
+        batch = self.client.pipeline.return_value
+        self.assertEqual(batch.set.call_count, 2)
+        batch.execute.assert_called_once_with()
+
+
+    def test_failing_redis_is_skipped_until_probe(self):
+        """Тест: после серии ошибок кэш не обращается к Redis, пока пробный запрос не пройдёт."""
+        self.client.get.side_effect = ConnectionError("timeout")
+        for _ in range(redis_client.REDIS_BREAKER_FAILURE_THRESHOLD):
+            self.assertIsNone(redis_client.get_cache("key"))
+
+        # 1. Проверка, что разомкнутый выключатель пропускает Redis совсем
+        self.assertEqual(redis_client.redis_breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNone(redis_client.get_cache("key"))
+        self.assertEqual(self.client.get.call_count, redis_client.REDIS_BREAKER_FAILURE_THRESHOLD)
+        self.assertEqual(redis_client.cache_metrics()["breaker"]["rejected"], 1)
+
+        # 2. Проверка, что после паузы успешный пробный запрос замыкает выключатель
+        self.client.get.side_effect = None
+        self.client.get.return_value = b"1"
+        with patch.object(redis_client.redis_breaker, "reset_timeout", 0):
+            self.assertEqual(redis_client.get_cache("key"), 1)
+        self.assertEqual(redis_client.redis_breaker.state, CircuitBreaker.CLOSED)
+
+
+class CacheCompressionTestCase(TestCase):
+    """Тестирование сжатия значений JSON-кэша."""
+    def setUp(self):
+        """Подменяем клиента Redis словарём и обнуляем счётчики сжатия."""
+        self.values = {}
+        self.client = MagicMock()
+        self.client.set.side_effect = lambda key, value, ex=None: self.values.__setitem__(key, value)
+        self.client.get.side_effect = self.values.get
+        patchers = [
+            patch("backend.redis_client.get_redis_client", return_value=self.client),
+            patch("backend.redis_client.is_redis_connected", return_value=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        compression_stats.reset()
+        self.addCleanup(compression_stats.reset)
+
+
+    def test_large_value_is_compressed_transparently(self):
+        """Тест: большое значение хранится сжатым с заголовком, малое — как есть."""
+        large = [{"id": n, "name": "Товар", "product_parameters": []} for n in range(CACHE_COMPRESS_MIN_SIZE // 10)]
+        redis_client.set_cache("large", large)
+        redis_client.set_cache("small", {"id": 1})
+
+        # 1. Проверка формата хранения
+        self.assertTrue(self.values["large"].startswith(ZLIB_HEADER))
+        self.assertEqual(self.values["small"], b'{"id": 1}')
+        # 2. Проверка, что значения читаются как записаны
+        self.assertEqual(redis_client.get_cache("large"), large)
+        self.assertEqual(redis_client.get_cache("small"), {"id": 1})
+
+        # 3. Проверка метрик сжатия
+        metrics = redis_client.cache_metrics()["compression"]
+        self.assertEqual((metrics["compressed"], metrics["skipped"], metrics["decompressed"]), (1, 1, 1))
+        self.assertLess(metrics["ratio"], 0.5)
+
+
+    def test_old_uncompressed_values_still_decode(self):
+        """Тест: значения, записанные до сжатия (строка JSON), читаются без изменений."""
+        self.values["old"] = '{"a": [1, 2]}'.encode()
+        self.assertEqual(redis_client.get_cache("old"), {"a": [1, 2]})
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Тестирование состояний автоматического выключателя."""
+    def test_half_open_allows_single_probe(self):
+        """Тест: после паузы пропускается один пробный запрос, его ошибка снова размыкает выключатель."""
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        with patch("backend.circuit_breaker.time.monotonic", return_value=breaker._opened_at + 10):
+            # 1. Проверка, что пробный запрос один
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertFalse(breaker.allow())
+            # 2. Проверка, что ошибка пробного запроса снова размыкает выключатель
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow())
+
+        metrics = breaker.metrics()
+        self.assertEqual((metrics["failures"], metrics["opened"], metrics["rejected"]), (3, 2, 3))
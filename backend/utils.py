@@ -1,16 +1,82 @@
-"""Обработка данных магазинов из YAML-файлов."""
+"""Обработка данных магазинов из файлов поставщиков (YAML, JSON, NDJSON, CSV)."""
+import csv
+import hashlib
+import os
+import time
+from decimal import Decimal, InvalidOperation
+import tempfile
+import ujson
 import yaml
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.db import transaction
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from django.db.models import Q
+from django.utils import timezone
+from .models import (Shop, Category, Product, ProductInfo, ProductInfoHistory, Parameter, ProductParameter,
+                     OrderItem)
+from .cache_invalidation import bulk_cache_invalidation, invalidate_product_list_cache, invalidate_product_detail_cache
 import logging
 
 
-def load_shop_data_from_yaml(shop_id: int, yaml_file_path: str) -> dict:
+# Сколько записей product_info накапливается перед записью пачки в БД
+IMPORT_BATCH_SIZE = 1000
+
+# Таблицы, по которым импорт возвращает счётчики строк
+IMPORT_TABLES = ("categories", "category_links", "products", "product_infos", "parameters", "product_parameters",
+                 "price_history")
+IMPORT_COUNTERS = ("inserted", "updated", "unchanged", "removed")
+
+# Файлы больше этого размера (в байтах) по умолчанию читаются потоково
+IMPORT_STREAMING_THRESHOLD = 20 * 1024 * 1024
+
+# Как часто (в секундах) импорт публикует прогресс
+IMPORT_PROGRESS_INTERVAL = 2.0
+
+# Что делать с товарами магазина, пропавшими из файла поставщика:
+# "delete" — удалить (товары из оформленных заказов только обнуляются, чтобы сохранить историю заказов),
+# "zero" — оставить строки, обнулив остаток
+IMPORT_STALE_POLICIES = ("delete", "zero")
+IMPORT_STALE_POLICY = "delete"
+
+# Используем C-загрузчик libyaml, если PyYAML собран с ним
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Форматы файлов поставщиков по расширению; файлы с другим расширением читаются как YAML
+FEED_FORMATS = {
+    ".yaml": "yaml", ".yml": "yaml",
+    ".json": "json",
+    ".ndjson": "ndjson", ".jsonl": "ndjson",
+    ".csv": "csv",
+}
+
+# Сколько изменений каждого вида попадает в краткий отчёт предпросмотра импорта
+IMPORT_DIFF_SAMPLE_SIZE = 20
+
+# Каталог хранилища для полных отчётов предпросмотра импорта
+IMPORT_DIFF_DIR = "import_diffs"
+
+# Префикс столбцов CSV со значениями параметров: "param:Цвет"
+CSV_PARAMETER_PREFIX = "param:"
+
+
+class FeedFormatError(ValueError):
+    """Файл поставщика не соответствует ожидаемому формату."""
+
+
+def load_shop_data(shop_id: int, file_path: str, feed_format: str = None, streaming: bool = None,
+                   force: bool = False, progress_callback=None) -> dict:
     """
-    Загружает данные магазина из YAML-файла и обновляет/создает соответствующие модели Django.
+    Загружает данные магазина из файла поставщика и обновляет/создает соответствующие модели Django.
+    Все форматы разворачиваются в одинаковые записи (см. iter_feed_records) и пишутся ShopDataImporter.
     Args:
         shop_id (int): ID магазина в базе данных.
-        yaml_file_path (str): Путь к YAML-файлу с данными.
+        file_path (str): Путь к файлу с данными.
+        feed_format (str): "yaml", "json", "ndjson" или "csv". По умолчанию определяется по расширению.
+        streaming (bool): Читать файл потоково, не загружая его целиком в память.
+            По умолчанию включается для файлов больше IMPORT_STREAMING_THRESHOLD.
+            NDJSON и CSV всегда читаются построчно, JSON — всегда целиком.
+        force (bool): Перезаписать все строки, даже если файл и отпечатки строк не изменились.
+        progress_callback (callable): Получает словарь с прогрессом импорта (см. ImportProgress).
     """
     try:
         shop = Shop.objects.get(id=shop_id) # Получаем конкретный магазин
@@ -18,128 +84,1203 @@ def load_shop_data_from_yaml(shop_id: int, yaml_file_path: str) -> dict:
         print(f"Ошибка: магазин с ID {shop_id} не существует.")
         return {"status": "error", "message": f"Магазин с ID {shop_id} не был найден."}
 
+    if feed_format is None:
+        feed_format = detect_feed_format(file_path)
     try:
-        with open(yaml_file_path, "r", encoding="utf-8") as file:
-            yaml_data = yaml.safe_load(file) # Читаем YAML-файл
+        file = open_feed_file(file_path, feed_format)
     except FileNotFoundError:
-        print(f"Ошибка: файл {yaml_file_path} не найден.")
-        return {"status": "error", "message": f"Файл {yaml_file_path} не найден."}
+        print(f"Ошибка: файл {file_path} не найден.")
+        return {"status": "error", "message": f"Файл {file_path} не найден."}
+
+    with file:
+        source_hash = file_content_hash(file_path)
+        if not force and source_hash == shop.source_hash:
+            # Файл не менялся с последнего успешного импорта — в БД писать нечего
+            return unchanged_file_result(shop, file_path)
+
+        file_size = os.fstat(file.fileno()).st_size
+        if streaming is None:
+            streaming = file_size >= IMPORT_STREAMING_THRESHOLD
+
+        try:
+            records, total = iter_feed_records(file, feed_format, streaming=streaming)
+        except yaml.YAMLError as err:
+            print(f"Ошибка при чтении YAML-файла: {err}")
+            return {"status": "error", "message": f"Ошибка YAML: {err}"}
+        except ValueError as err: # FeedFormatError и ошибки разбора JSON
+            print(f"Ошибка при чтении файла {file_path}: {err}")
+            return {"status": "error", "message": f"Неверный формат файла: {err}"}
+
+        if total is None:
+            # Записи разбираются по мере чтения файла внутри транзакции, и их общее число
+            # заранее неизвестно — оцениваем долю по прочитанным байтам
+            progress = ImportProgress(
+                progress_callback, position=lambda: file.buffer.tell() / file_size if file_size else None
+            )
+        else:
+            progress = ImportProgress(progress_callback, total=total)
+
+        importer = ShopDataImporter(shop, force=force, progress=progress)
+        transaction_started_at = time.perf_counter()
+        try:
+            # Пакетный режим: вся инвалидация кэша за импорт — одна очистка после фиксации
+            with bulk_cache_invalidation(), transaction.atomic(): # Начинаем транзакцию
+                """Транзакция для обеспечения целостности данных."""
+                importer.add_records(records)
+                importer.finish()
+                # Файл прочитан целиком — убираем всё, чего в нём больше нет
+                counts = importer.sweep()
+                Shop.objects.filter(id=shop.id).update(source_hash=source_hash)
+                # Пакетная запись не вызывает сигналы post_save, поэтому запрашиваем инвалидацию явно
+                importer.invalidate_cache()
+            transaction_seconds = time.perf_counter() - transaction_started_at
+        except yaml.YAMLError as err:
+            print(f"Ошибка при чтении YAML-файла: {err}")
+            return {"status": "error", "message": f"Ошибка YAML: {err}"}
+        except FeedFormatError as err:
+            print(f"Ошибка при чтении файла {file_path}: {err}")
+            return {"status": "error", "message": f"Неверный формат файла: {err}"}
+        except Exception as err:
+            logging.exception(f"Ошибка при загрузке данных из {file_path} для магазина {shop.name}: {err}")
+            return {"status": "error", "message": f"Ошибка при загрузке данных: {err}"}
+
+     # Возвращаем успешный статус
+    return {
+        "status": "success",
+        "message": f"Данные из {file_path} успешно загружены для магазина {shop.name}.",
+        "counts": counts,
+        "timings": {"transaction_seconds": round(transaction_seconds, 3)},
+    }
+
+
+def load_shop_data_from_yaml(shop_id: int, yaml_file_path: str, streaming: bool = None,
+                             force: bool = False, progress_callback=None) -> dict:
+    """
+    Загружает данные магазина из YAML-файла (см. load_shop_data).
+    Args:
+        shop_id (int): ID магазина в базе данных.
+        yaml_file_path (str): Путь к YAML-файлу с данными.
+        streaming (bool): Читать файл потоково, не загружая его целиком в память.
+        force (bool): Перезаписать все строки, даже если файл и отпечатки строк не изменились.
+        progress_callback (callable): Получает словарь с прогрессом импорта (см. ImportProgress).
+    """
+    return load_shop_data(
+        shop_id, yaml_file_path, feed_format="yaml", streaming=streaming,
+        force=force, progress_callback=progress_callback,
+    )
+
+
+def preview_shop_data(shop_id: int, file_path: str, feed_format: str = None, streaming: bool = None,
+                      full_diff: bool = False, policy: str = IMPORT_STALE_POLICY) -> dict:
+    """
+    Предпросмотр импорта (dry-run): вычисляет, какие строки импорт создаст, изменит и удалит,
+    ничего не записывая в БД (см. ShopImportPreview).
+    Args:
+        shop_id (int): ID магазина в базе данных.
+        file_path (str): Путь к файлу с данными (любой формат load_shop_data).
+        full_diff (bool): Сохранить полный список изменений (NDJSON) в хранилище default_storage.
+        policy (str): Режим удаления пропавших товаров, как при импорте.
+    Returns:
+        dict: summary — число изменений каждого вида, sample — первые IMPORT_DIFF_SAMPLE_SIZE
+            изменений каждого вида, diff_file/diff_url — полный отчёт (если запрошен).
+    """
+    try:
+        shop = Shop.objects.get(id=shop_id)
+    except Shop.DoesNotExist:
+        return {"status": "error", "message": f"Магазин с ID {shop_id} не был найден."}
+
+    if feed_format is None:
+        feed_format = detect_feed_format(file_path)
+    try:
+        file = open_feed_file(file_path, feed_format)
+    except FileNotFoundError:
+        return {"status": "error", "message": f"Файл {file_path} не найден."}
+
+    # Полный отчёт пишется построчно во временный файл, в памяти остаются только счётчики и примеры
+    diff_output = tempfile.TemporaryFile("w+b") if full_diff else None
+    try:
+        with file:
+            if streaming is None:
+                streaming = os.fstat(file.fileno()).st_size >= IMPORT_STREAMING_THRESHOLD
+            preview = ShopImportPreview(shop, policy=policy, output=diff_output)
+            records, _ = iter_feed_records(file, feed_format, streaming=streaming)
+            preview.add_records(records)
+            preview.finish()
+
+        result = {
+            "status": "success",
+            "dry_run": True,
+            "message": f"Предпросмотр импорта {file_path} для магазина {shop.name}: в БД ничего не записано.",
+            "summary": preview.summary,
+            "sample": preview.sample,
+        }
+        if diff_output is not None:
+            diff_output.seek(0)
+            diff_name = default_storage.save(
+                f"{IMPORT_DIFF_DIR}/shop_{shop.id}/{time.strftime('%Y%m%d-%H%M%S')}.ndjson", File(diff_output)
+            )
+            result["diff_file"] = diff_name
+            result["diff_url"] = default_storage.url(diff_name)
+        return result
     except yaml.YAMLError as err:
-        print(f"Ошибка при чтении YAML-файла: {err}")
         return {"status": "error", "message": f"Ошибка YAML: {err}"}
+    except ValueError as err: # FeedFormatError и ошибки разбора JSON
+        return {"status": "error", "message": f"Неверный формат файла: {err}"}
+    except (InvalidOperation, KeyError, TypeError) as err: # Неверные значения в записях, как при импорте
+        logging.exception(f"Ошибка при предпросмотре данных из {file_path} для магазина {shop.name}: {err}")
+        return {"status": "error", "message": f"Ошибка в данных файла: {err}"}
+    finally:
+        if diff_output is not None:
+            diff_output.close()
 
-    if not isinstance(yaml_data, dict):
-        print("Ошибка: YAML-файл должен содержать объект словарь.")
-        return {"status": "error", "message": "Неверный формат YAML-файла."}
 
+def load_shop_records(shop_id: int, records: list, force: bool = False) -> dict:
+    """
+    Импортирует готовые записи (часть файла поставщика) в одной транзакции.
+    Используется параллельным импортом по частям: кэш и хэш файла обновляет завершающая задача.
+    """
+    try:
+        shop = Shop.objects.get(id=shop_id)
+    except Shop.DoesNotExist:
+        return {"status": "error", "message": f"Магазин с ID {shop_id} не был найден."}
+
+    importer = ShopDataImporter(shop, force=force)
     try:
-        with transaction.atomic(): # Начинаем транзакцию
-            """Транзакция для обеспечения целостности данных."""
-            _process_categories(yaml_data.get("categories", []), shop)
+        with transaction.atomic():
+            # Кэш очищает завершающая задача, поэтому здесь инвалидация не запрашивается
+            importer.add_records(records)
+            counts = importer.finish()
     except Exception as err:
-        logging.exception(f"Ошибка при загрузке данных из {yaml_file_path} для магазина {shop.name}: {err}")
+        logging.exception(f"Ошибка при загрузке части данных для магазина {shop.name}: {err}")
         return {"status": "error", "message": f"Ошибка при загрузке данных: {err}"}
-     # Возвращаем успешный статус
     return {
         "status": "success",
-        "message": f"Данные из {yaml_file_path} успешно загружены для магазина {shop.name}."
+        "counts": counts,
+        "has_changes": importer.has_changes,
+        # Теги кэша для инвалидации завершающей задачей (см. ShopDataImporter.invalidate_cache)
+        "changed_category_ids": sorted(importer.changed_category_ids),
+        "changes_shared_rows": importer.changes_shared_rows,
+        "changed_product_ids": sorted(importer.changed_product_ids),
+        # Удаление пропавших товаров выполняет завершающая задача по объединению этих множеств
+        "seen_info_ids": sorted(importer.seen_info_ids),
+        "seen_category_ids": sorted(importer.seen_category_ids),
     }
 
 
-def _process_categories(categories_data: list, shop: Shop) -> None:
-    """Обрабатывает Категории товаров из YAML-данных и связывает их с магазином."""
-    for category_data in categories_data:
-        cat_name = category_data.get("name")
-        cat_description = category_data.get("description", "")
+def sweep_stale_shop_data(shop: Shop, seen_info_ids: set, seen_category_ids: set,
+                          policy: str = IMPORT_STALE_POLICY, batch_size: int = IMPORT_BATCH_SIZE,
+                          changed_category_ids: set = None, changed_product_ids: set = None) -> dict:
+    """
+    Удаляет (mark-and-sweep) товары магазина, которых не было в последнем файле поставщика,
+    и связи магазина с категориями, в которых у него не осталось товаров.
+    Args:
+        shop (Shop): Магазин.
+        seen_info_ids (set): ID информации о товарах, встреченной в файле.
+        seen_category_ids (set): ID категорий, встреченных в файле.
+        policy (str): "delete" или "zero" (см. IMPORT_STALE_POLICY).
+        changed_category_ids (set): Если передано, дополняется категориями удалённых
+            и обнулённых товаров (для инвалидации кэша по тегам).
+        changed_product_ids (set): Если передано, дополняется ID их товаров (для инвалидации карточек).
+    Returns:
+        dict: Счётчики удалённых строк по таблицам (в формате ShopDataImporter.empty_counts).
+    """
+    if policy not in IMPORT_STALE_POLICIES:
+        raise ValueError(f"Неизвестный режим удаления товаров: {policy}")
+    counts = ShopDataImporter.empty_counts()
+    if not seen_info_ids:
+        # Пустой файл скорее говорит об ошибке выгрузки, чем о снятии всего ассортимента
+        logging.warning(f"В файле магазина {shop.name} нет товаров, удаление пропавших товаров пропущено.")
+        return counts
+
+    # Разность считаем в Python: список ID файла может превышать лимит параметров запроса
+    stale_ids = sorted(
+        set(ProductInfo.objects.filter(shop=shop).order_by().values_list("id", flat=True)) - set(seen_info_ids)
+    )
+    # Подзапрос, а не JOIN с позициями заказов: товар из нескольких заказов не должен повторяться
+    ordered = Q(id__in=OrderItem.objects.values("product_info_id"))
+    for start in range(0, len(stale_ids), batch_size):
+        batch = ProductInfo.objects.filter(id__in=stale_ids[start:start + batch_size])
+        if changed_category_ids is not None or changed_product_ids is not None:
+            # Уже обнулённые строки, которые не будут удалены, страницы каталога не меняют
+            affected = ~Q(quantity=0, fingerprint="")
+            if policy == "delete":
+                affected |= ~ordered
+            rows = set(batch.filter(affected).order_by().values_list("product_id", "product__category_id"))
+            if changed_category_ids is not None:
+                changed_category_ids.update(category_id for _, category_id in rows)
+            if changed_product_ids is not None:
+                changed_product_ids.update(product_id for product_id, _ in rows)
+        to_zero = batch
+        if policy == "delete":
+            # Товары из оформленных заказов не удаляем, иначе каскадно удалятся позиции заказов
+            to_zero = batch.filter(ordered)
+            _, deleted = batch.exclude(ordered).delete()
+            counts["product_infos"]["removed"] += deleted.get(ProductInfo._meta.label, 0)
+            counts["product_parameters"]["removed"] += deleted.get(ProductParameter._meta.label, 0)
+        # Сбрасываем отпечаток, чтобы вернувшийся в файл товар снова получил свой остаток
+        to_zero = to_zero.exclude(quantity=0, fingerprint="")
+        zeroed = [
+            ProductInfo(id=info_id, price=price, price_rrc=price_rrc, quantity=0)
+            for info_id, price, price_rrc, quantity in to_zero.values_list("id", "price", "price_rrc", "quantity")
+            if quantity != 0
+        ]
+        counts["product_infos"]["removed"] += to_zero.update(quantity=0, fingerprint="")
+        if zeroed:
+            record_price_history(zeroed, batch_size=batch_size)
+            counts["price_history"]["inserted"] += len(zeroed)
+
+    counts["category_links"]["removed"], _ = (
+        Category.shops.through.objects.filter(shop_id=shop.id)
+        .exclude(category_id__in=seen_category_ids)
+        .exclude(category_id__in=ProductInfo.objects.filter(shop=shop).values("product__category_id"))
+        .delete()
+    )
+    return counts
+
+
+def record_price_history(infos: list, batch_size: int = IMPORT_BATCH_SIZE) -> None:
+    """Добавляет в историю текущие цены и количество переданных строк (одна пачка insert-ов)."""
+    recorded_at = timezone.now()
+    ProductInfoHistory.objects.bulk_create(
+        [
+            ProductInfoHistory(
+                product_info_id=info.id, price=info.price, price_rrc=info.price_rrc,
+                quantity=info.quantity, recorded_at=recorded_at,
+            )
+            for info in infos
+        ],
+        batch_size=batch_size,
+    )
+
+
+def iter_record_chunks(records, chunk_size: int):
+    """
+    Делит последовательность записей на части по chunk_size записей product_info.
+    Части независимы: каждая запись несёт свою категорию и товар целиком.
+    """
+    chunk = []
+    infos_in_chunk = 0
+    for record in records:
+        chunk.append(record)
+        if "product" in record:
+            infos_in_chunk += 1
+        if infos_in_chunk >= chunk_size:
+            yield chunk
+            chunk, infos_in_chunk = [], 0
+    if chunk:
+        yield chunk
+
+
+def merge_import_counts(counts_list: list) -> dict:
+    """Складывает счётчики строк нескольких частичных импортов."""
+    merged = ShopDataImporter.empty_counts()
+    for counts in counts_list:
+        for table, table_counts in counts.items():
+            for counter, value in table_counts.items():
+                merged[table][counter] += value
+    return merged
+
+
+def unchanged_file_result(shop: Shop, yaml_file_path: str) -> dict:
+    """Результат импорта файла, не изменившегося с последнего успешного импорта."""
+    return {
+        "status": "success",
+        "message": f"Файл {yaml_file_path} не изменился с последнего импорта магазина {shop.name}.",
+        "counts": ShopDataImporter.empty_counts(),
+    }
+
+
+def file_content_hash(file_path: str) -> str:
+    """Считает SHA-256 содержимого файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detect_feed_format(file_path: str) -> str:
+    """Определяет формат файла поставщика по расширению (по умолчанию YAML)."""
+    return FEED_FORMATS.get(os.path.splitext(file_path)[1].lower(), "yaml")
+
+
+def open_feed_file(file_path: str, feed_format: str):
+    """Открывает файл поставщика на чтение с параметрами, которые нужны его формату."""
+    if feed_format not in FEED_FORMATS.values():
+        raise FeedFormatError(f"Неизвестный формат файла: {feed_format}")
+    if feed_format == "csv":
+        # utf-8-sig убирает BOM, который добавляют табличные редакторы при экспорте
+        return open(file_path, "r", encoding="utf-8-sig", newline="")
+    return open(file_path, "r", encoding="utf-8")
 
-        if not cat_name:
-            print("Пропущена категория без имени.")
-            continue
-        # Получаем или создаем категорию
-        category, created = Category.objects.get_or_create(
-            name=cat_name,
-            defaults={"description": cat_description}
-        )
-        if not created:
-            category.description = cat_description
-            category.save()
 
-        # Добавляем магазин к категории, если его там еще нет
-        category.shops.add(shop)
+def iter_feed_records(file, feed_format: str, streaming: bool = True) -> tuple:
+    """
+    Разбирает открытый файл поставщика в последовательность записей product_info.
+    Returns:
+        tuple: (записи, общее число записей product_info или None, если оно заранее неизвестно).
+            Форматы, которые читаются целиком, разбираются сразу: ошибки формата
+            возникают здесь, а не во время импорта.
+    """
+    if feed_format == "ndjson":
+        return iter_ndjson_records(file), None
+    if feed_format == "csv":
+        return iter_csv_records(file), None
+    if feed_format == "yaml" and streaming:
+        return iter_yaml_records_streaming(file), None
 
-        # Обрабатываем товары в категории
-        _process_products(category_data.get("products", []), category, shop)
+    if feed_format == "json":
+        data = ujson.load(file) # JSON разбирается целиком: ujson на порядок быстрее YAML
+    else:
+        data = yaml.load(file, Loader=YAML_LOADER) # Читаем YAML-файл
+    if not isinstance(data, dict):
+        raise FeedFormatError(f"файл {feed_format.upper()} должен содержать объект словарь.")
+    return iter_yaml_records(data.get("categories", [])), count_yaml_product_infos(data)
 
 
-def _process_products(products_data: list, category: Category, shop: Shop) -> None:
-    """Обрабатывает товары из YAML-данных и связывает их с категорией и магазином."""
-    for product_data in products_data:
-        prod_name = product_data.get("name")
+def iter_ndjson_records(lines):
+    """
+    Читает NDJSON построчно: каждая строка — одна запись product_info
+    {"category", "category_description", "product", "name", "price", "price_rrc", "quantity", "parameters"},
+    где parameters — словарь {название: значение} или список [{"name", "value"}].
+    Строка без "product" только связывает категорию с магазином.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = ujson.loads(line)
+        except ValueError as err:
+            raise FeedFormatError(f"строка {line_number}: {err}") from err
+        if not isinstance(data, dict):
+            raise FeedFormatError(f"строка {line_number}: ожидался объект словарь.")
 
-        if not prod_name:
-            print("Пропущен товар без имени.")
+        category = _category_record({"name": data.get("category"), "description": data.get("category_description", "")})
+        if category is None:
             continue
-        # Получаем или создаем товар
-        product, created = Product.objects.get_or_create(
-            name=prod_name,
-            defaults={"category": category}
-        )
-        # Если продукт уже существовал, но не был в нужной категории, обновим его категорию
-        if not created and product.category != category:
-            product.category = category
-            product.save()
-        # Обрабатываем информацию о продукте
-        _process_product_infos(product_data.get("product_infos", []), product, shop)
+        if not data.get("product"):
+            yield category
+            continue
+
+        parameters = data.get("parameters") or []
+        if isinstance(parameters, dict):
+            parameters = [{"name": name, "value": value} for name, value in parameters.items()]
+        yield from _iter_product_records(category, {
+            "name": data["product"],
+            "product_infos": [{**data, "parameters": parameters}],
+        })
+
+
+def iter_csv_records(file):
+    """
+    Читает CSV построчно. Столбцы: category, product, info, price, price_rrc, quantity,
+    необязательный category_description и по столбцу на параметр: "param:<название>".
+    Пустые значения параметров пропускаются.
+    """
+    reader = csv.DictReader(file)
+    missing = {"category", "product", "info", "price", "price_rrc", "quantity"} - set(reader.fieldnames or [])
+    if missing:
+        raise FeedFormatError(f"в CSV-файле нет столбцов: {', '.join(sorted(missing))}.")
+    parameter_columns = [
+        (column, column[len(CSV_PARAMETER_PREFIX):])
+        for column in reader.fieldnames if column.startswith(CSV_PARAMETER_PREFIX)
+    ]
+
+    try:
+        for row in reader:
+            category = _category_record({"name": row["category"], "description": row.get("category_description") or ""})
+            if category is None:
+                continue
+            if not row["product"]:
+                yield category
+                continue
+            yield from _iter_product_records(category, {
+                "name": row["product"],
+                "product_infos": [{
+                    "name": row["info"],
+                    "price": _csv_number(row["price"], Decimal, reader.line_num),
+                    "price_rrc": _csv_number(row["price_rrc"], Decimal, reader.line_num),
+                    "quantity": _csv_number(row["quantity"], int, reader.line_num),
+                    "parameters": [
+                        {"name": name, "value": row[column]} for column, name in parameter_columns if row[column]
+                    ],
+                }],
+            })
+    except csv.Error as err:
+        raise FeedFormatError(f"строка {reader.line_num}: {err}") from err
+
+
+def _csv_number(value: str, number_type, line_number: int):
+    """Преобразует число из CSV; пустое значение становится None (запись будет пропущена)."""
+    if not value:
+        return None
+    try:
+        return number_type(value.strip())
+    except (ValueError, InvalidOperation) as err:
+        raise FeedFormatError(f"строка {line_number}: неверное число {value!r}.") from err
+
+
+def to_money(value) -> Decimal:
+    """Цена из файла поставщика (int, float, str или Decimal) с двумя знаками после запятой."""
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+
+def is_complete_info_record(record: dict) -> bool:
+    """
+    Есть ли в записи product_info все обязательные значения (записи без них пропускаются).
+    Нулевые цена и количество — допустимые значения, а не отсутствующие.
+    """
+    return bool(record.get("name")) and all(
+        record.get(field) is not None for field in ("price", "price_rrc", "quantity")
+    )
+
+
+def shop_info_ids(shop: Shop, keys) -> set:
+    """
+    ID информации о товарах магазина по парам (название товара, название записи) одним запросом.
+    Нужен для пропущенных неполных записей: строка есть в файле, поэтому её нельзя удалять как пропавшую.
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+    return {
+        info_id
+        for info_id, product, name in ProductInfo.objects.filter(
+            shop=shop, product__name__in={product for product, _ in keys}, name__in={name for _, name in keys}
+        ).order_by().values_list("id", "product__name", "name")
+        if (product, name) in keys
+    }
+
+
+def product_info_fingerprint(record: dict) -> str:
+    """
+    Отпечаток содержимого записи product_info: цены, количество и параметры.
+    Совпадение отпечатков означает, что строку и её параметры можно не перезаписывать.
+    """
+    parts = [
+        str(to_money(record["price"])),
+        str(to_money(record["price_rrc"])),
+        str(int(record["quantity"])),
+        *sorted(f"{name}={value}" for name, value in record["parameters"] if name and value),
+    ]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
 
 
-def _process_product_infos(product_infos_data: list, product: Product, shop: Shop) -> None:
+def count_yaml_product_infos(yaml_data: dict) -> int:
+    """Считает записи product_info в загруженном YAML-файле (для оценки прогресса)."""
+    return sum(
+        len(product_data.get("product_infos") or [])
+        for category_data in yaml_data.get("categories") or []
+        if isinstance(category_data, dict)
+        for product_data in category_data.get("products") or []
+        if isinstance(product_data, dict)
+    )
+
+
+class ImportProgress:
     """
-    Обрабатывает информацию о продукте (цена, количество и т.д.)
-    из YAML-данных и связывает ее с продуктом и магазином.
+    Учёт прогресса импорта: обработанные записи product_info, текущая категория,
+    скорость и оценка оставшегося времени. Публикует прогресс через callback
+    не чаще, чем раз в interval секунд, чтобы не нагружать result backend.
     """
-    for info_data in product_infos_data:
-        info_name = info_data.get("name")
-        price = info_data.get("price")
-        price_rrc = info_data.get("price_rrc")
-        quantity = info_data.get("quantity")
 
-        if not all([info_name, price, price_rrc, quantity]):
-            print(f"Пропущена информация о продукте '{info_name}' из-за отсутствующих данных.")
+    def __init__(self, callback=None, total: int = None, position=None,
+                 interval: float = IMPORT_PROGRESS_INTERVAL):
+        self.callback = callback
+        self.total = total
+        self.position = position  # callable -> доля обработанного файла (0..1) или None
+        self.interval = interval
+        self.processed = 0
+        self.current_category = None
+        self._started_at = time.monotonic()
+        self._reported_at = self._started_at
+
+    def advance(self, record: dict) -> None:
+        """Отмечает обработанную запись и при необходимости публикует прогресс."""
+        self.current_category = record["category"]
+        if "product" in record:
+            self.processed += 1
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if now - self._reported_at >= self.interval:
+            self._reported_at = now
+            self.callback(self.as_dict())
+
+    def as_dict(self) -> dict:
+        """Текущий прогресс в виде словаря для метаданных Celery-задачи."""
+        elapsed = time.monotonic() - self._started_at
+        rows_per_sec = self.processed / elapsed if elapsed > 0 else 0.0
+
+        if self.total:
+            fraction = min(self.processed / self.total, 1.0)
+        else:
+            fraction = self.position() if self.position else None
+        eta_seconds = None
+        if fraction:
+            eta_seconds = round(elapsed / fraction - elapsed, 1)
+
+        return {
+            "processed": self.processed,
+            "total": self.total,
+            "percent": round(fraction * 100, 1) if fraction is not None else None,
+            "current_category": self.current_category,
+            "rows_per_sec": round(rows_per_sec, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta_seconds,
+        }
+
+
+def iter_yaml_records(categories_data: list):
+    """
+    Разворачивает структуру categories → products → product_infos в плоские записи.
+    Каждая запись описывает одну информацию о товаре вместе с категорией, товаром и параметрами.
+    Для категории без товаров выдаётся запись без ключа "product", чтобы связать её с магазином.
+    """
+    for category_data in categories_data or []:
+        category = _category_record(category_data)
+        if category is None:
             continue
-        # Получаем или создаем информацию о продукте
-        product_info, created = ProductInfo.objects.get_or_create(
-            product=product,
-            shop=shop,
-            name=info_name,
-            defaults={"price": price, "price_rrc": price_rrc, "quantity": quantity}
+        yield category
+
+        for product_data in category_data.get("products") or []:
+            yield from _iter_product_records(category, product_data)
+
+
+def _category_record(category_data: dict):
+    """Возвращает общую часть записей категории или None, если у категории нет имени."""
+    cat_name = category_data.get("name")
+
+    if not cat_name:
+        print("Пропущена категория без имени.")
+        return None
+    return {"category": cat_name, "category_description": category_data.get("description", "")}
+
+
+def _iter_product_records(category: dict, product_data: dict):
+    """Выдаёт записи по каждой информации о товаре."""
+    prod_name = product_data.get("name")
+
+    if not prod_name:
+        print("Пропущен товар без имени.")
+        return
+    for info_data in product_data.get("product_infos") or []:
+        yield {
+            **category,
+            "product": prod_name,
+            "name": info_data.get("name"),
+            "price": info_data.get("price"),
+            "price_rrc": info_data.get("price_rrc"),
+            "quantity": info_data.get("quantity"),
+            "parameters": [
+                (param_data.get("name"), param_data.get("value"))
+                for param_data in info_data.get("parameters") or []
+            ],
+        }
+
+
+def iter_yaml_records_streaming(stream):
+    """
+    Потоковый аналог iter_yaml_records: обходит YAML-файл как последовательность событий парсера.
+    В памяти целиком строится только один товар со своими product_infos, поэтому
+    потребление памяти не зависит от размера файла.
+    """
+    events = _YamlEventReader(stream)
+    events.expect(yaml.StreamStartEvent)
+    events.expect(yaml.DocumentStartEvent)
+    if not isinstance(events.next(), yaml.MappingStartEvent):
+        raise yaml.YAMLError("Неверный формат YAML-файла: ожидался объект словарь.")
+
+    while not events.at(yaml.MappingEndEvent):
+        key = events.construct()
+        if key == "categories" and events.at(yaml.SequenceStartEvent):
+            events.next()
+            while not events.at(yaml.SequenceEndEvent):
+                yield from _iter_category_records_streaming(events)
+            events.next()
+        else:
+            events.construct() # Остальные ключи верхнего уровня не нужны, пропускаем значение
+
+
+def _iter_category_records_streaming(events):
+    """Выдаёт записи одной категории, разбирая её товары по одному."""
+    if not events.at(yaml.MappingStartEvent):
+        events.construct()
+        print("Пропущена категория без имени.")
+        return
+    events.next()
+
+    category_data = {}
+    deferred_products = [] # Товары, встретившиеся в файле раньше имени категории
+    category = None
+    resolved = False
+    while not events.at(yaml.MappingEndEvent):
+        key = events.construct()
+        if key == "products" and events.at(yaml.SequenceStartEvent):
+            events.next()
+            while not events.at(yaml.SequenceEndEvent):
+                product_data = events.construct()
+                if not isinstance(product_data, dict):
+                    continue
+                if not resolved and "name" in category_data:
+                    resolved = True
+                    category = _category_record(category_data)
+                    if category is not None:
+                        yield category
+                if category is not None:
+                    yield from _iter_product_records(category, product_data)
+                elif not resolved:
+                    deferred_products.append(product_data)
+            events.next()
+        else:
+            category_data[key] = events.construct()
+    events.next()
+
+    if not resolved:
+        category = _category_record(category_data)
+        if category is None:
+            return
+        yield category
+    elif category is None:
+        return
+    elif category["category_description"] != category_data.get("description", ""):
+        # Описание шло в файле после товаров: обновляем категорию отдельной записью
+        yield _category_record(category_data)
+    for product_data in deferred_products:
+        yield from _iter_product_records(category, product_data)
+
+
+class _YamlEventReader:
+    """Обёртка над потоком событий yaml.parse: заглядывание вперёд и сборка поддеревьев."""
+
+    def __init__(self, stream):
+        self._events = yaml.parse(stream, Loader=YAML_LOADER)
+        self._current = next(self._events)
+        self._resolver = yaml.resolver.Resolver()
+        self._constructor = yaml.constructor.SafeConstructor()
+        self._anchors = {}
+
+    def at(self, event_class) -> bool:
+        """Является ли текущее событие событием указанного типа."""
+        return isinstance(self._current, event_class)
+
+    def next(self):
+        """Возвращает текущее событие и переходит к следующему."""
+        event, self._current = self._current, next(self._events, None)
+        if event is None:
+            raise yaml.YAMLError("Неожиданный конец YAML-файла.")
+        return event
+
+    def expect(self, event_class):
+        if not self.at(event_class):
+            raise yaml.YAMLError(f"Неверный формат YAML-файла: ожидалось {event_class.__name__}.")
+        return self.next()
+
+    def construct(self):
+        """Собирает значение, начинающееся с текущего события, в объект Python."""
+        return self._constructor.construct_document(self._compose())
+
+    def _compose(self):
+        event = self.next()
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self._anchors:
+                raise yaml.YAMLError(f"Неизвестный якорь {event.anchor}.")
+            return self._anchors[event.anchor]
+
+        if isinstance(event, yaml.ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self._resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+            node = yaml.ScalarNode(tag, event.value, style=event.style)
+        elif isinstance(event, yaml.SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self._resolver.resolve(yaml.SequenceNode, None, event.implicit)
+            node = yaml.SequenceNode(tag, [], flow_style=event.flow_style)
+            while not self.at(yaml.SequenceEndEvent):
+                node.value.append(self._compose())
+            self.next()
+        elif isinstance(event, yaml.MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self._resolver.resolve(yaml.MappingNode, None, event.implicit)
+            node = yaml.MappingNode(tag, [], flow_style=event.flow_style)
+            while not self.at(yaml.MappingEndEvent):
+                node.value.append((self._compose(), self._compose()))
+            self.next()
+        else:
+            raise yaml.YAMLError(f"Неожиданное событие YAML: {event}.")
+
+        if getattr(event, "anchor", None):
+            self._anchors[event.anchor] = node
+        return node
+
+
+class ShopDataImporter:
+    """
+    Пакетный импорт данных магазина.
+
+    Записи накапливаются в буфере и сбрасываются в БД пачками: существующие строки
+    подгружаются одним запросом на таблицу, новые создаются через bulk_create
+    (upsert по уникальным ключам), изменённые обновляются через bulk_update.
+    Количество запросов зависит от числа пачек, а не от числа строк.
+
+    Для каждой информации о товаре хранится отпечаток содержимого (product_info_fingerprint):
+    строки с неизменившимся отпечатком и их параметры не перезаписываются.
+    """
+
+    def __init__(self, shop: Shop, batch_size: int = IMPORT_BATCH_SIZE, force: bool = False,
+                 progress: ImportProgress = None):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.force = force
+        self.progress = progress
+        self.counts = self.empty_counts()
+
+        # Категории и параметры немногочисленны, поэтому кэшируем их на всё время импорта
+        self._categories = {}  # name -> Category
+        self._parameter_ids = {}  # name -> id
+        self._linked_category_ids = set(shop.categories.values_list("id", flat=True))
+
+        self._pending_categories = {}  # name -> description
+        self._pending_infos = []
+        self._skipped_infos = set()  # (product, name) пропущенных неполных записей пачки
+
+        # Строки, встреченные в файле: всё остальное у магазина удаляет sweep()
+        self.seen_info_ids = set()
+        self.seen_category_ids = set()
+
+        # Что инвалидировать в кэше списка товаров (см. invalidate_cache)
+        self.changed_category_ids = set()  # категории созданных, изменённых и удалённых строк магазина
+        self.changes_shared_rows = False  # изменились общие для всех магазинов категории или товары
+        self.changed_product_ids = set()  # товары, карточки которых изменились (см. invalidate_cache)
+
+    @staticmethod
+    def empty_counts() -> dict:
+        """Нулевые счётчики строк по всем таблицам."""
+        return {table: dict.fromkeys(IMPORT_COUNTERS, 0) for table in IMPORT_TABLES}
+
+    @property
+    def has_changes(self) -> bool:
+        """Были ли созданы, изменены или удалены какие-либо строки."""
+        return any(
+            count["inserted"] or count["updated"] or count["removed"] for count in self.counts.values()
         )
-        # Если объект уже существовал, обновляем поля
-        if not created:
-            product_info.price = price
-            product_info.price_rrc = price_rrc
-            product_info.quantity = quantity
-            product_info.save()
-        # Обрабатываем параметры продукта
-        _process_product_parameters(info_data.get("parameters", []), product_info)
-
-
-def _process_product_parameters(parameters_data: list, product_info: ProductInfo) -> None:
-    """Обрабатывает параметры продукта из YAML-данных и связывает их с информацией о продукте."""
-    for param_data in parameters_data:
-        param_name = param_data.get("name")
-        param_value = param_data.get("value")
-
-        if not all([param_name, param_value]):
-            print(f"Пропущен параметр {product_info.product.name} из-за отсутствующих данных.")
-            continue
 
-        # Получаем или создаем параметр
-        parameter, _ = Parameter.objects.get_or_create(name=param_name)
+    def add_records(self, records) -> None:
+        """Добавляет в импорт последовательность записей."""
+        for record in records:
+            self.add(record)
+
+    def add(self, record: dict) -> None:
+        """Добавляет одну запись в буфер и сбрасывает буфер, когда он заполнен."""
+        if self.progress is not None:
+            self.progress.advance(record)
+        self._pending_categories[record["category"]] = record.get("category_description", "")
+        if "product" not in record:
+            return
+
+        if not is_complete_info_record(record):
+            print(f"Пропущена информация о продукте '{record.get('name')}' из-за отсутствующих данных.")
+            self._skipped_infos.add((record["product"], record.get("name")))
+            if len(self._skipped_infos) >= self.batch_size:
+                self.flush()
+            return
+
+        self._pending_infos.append(record)
+        if len(self._pending_infos) >= self.batch_size:
+            self.flush()
+
+    def finish(self) -> dict:
+        """Записывает остаток буфера и возвращает счётчики строк по таблицам."""
+        self.flush()
+        return self.counts
+
+    def sweep(self, policy: str = IMPORT_STALE_POLICY) -> dict:
+        """
+        Удаляет товары магазина, не встретившиеся в импорте (см. sweep_stale_shop_data).
+        Вызывается после finish(), только если импортирован весь файл поставщика.
+        """
+        removed = sweep_stale_shop_data(
+            self.shop, self.seen_info_ids, self.seen_category_ids, policy=policy, batch_size=self.batch_size,
+            changed_category_ids=self.changed_category_ids, changed_product_ids=self.changed_product_ids,
+        )
+        for table, table_counts in removed.items():
+            self._count(table, **table_counts)
+        return self.counts
+
+    def invalidate_cache(self) -> None:
+        """
+        Запрашивает инвалидацию кэша списка товаров по изменениям импорта:
+        только страницы магазина и затронутых категорий, а если изменились описания
+        категорий или категории товаров (они видны на страницах всех магазинов) — весь кэш.
+        """
+        if self.changes_shared_rows:
+            invalidate_product_list_cache()
+        elif self.changed_category_ids:
+            invalidate_product_list_cache(shop_ids=[self.shop.id], category_ids=self.changed_category_ids)
+        if self.changed_product_ids:
+            invalidate_product_detail_cache(self.changed_product_ids)
+
+    def flush(self) -> None:
+        """Записывает накопленную пачку в БД."""
+        if not self._pending_categories and not self._pending_infos:
+            return
+        self._flush_categories()
+        if self._pending_infos:
+            product_ids = self._flush_products()
+            parameter_ids = self._flush_parameters()
+            self._flush_product_infos(product_ids, parameter_ids)
+        # Неполные записи не пишутся, но строки есть в файле — sweep() их не удаляет
+        self.seen_info_ids.update(shop_info_ids(self.shop, self._skipped_infos))
+
+        self._pending_categories = {}
+        self._pending_infos = []
+        self._skipped_infos = set()
+
+    def _count(self, table: str, **deltas) -> None:
+        for counter, delta in deltas.items():
+            self.counts[table][counter] += delta
+
+    def _flush_categories(self) -> None:
+        """Создаёт/обновляет категории пачки и связывает их с магазином."""
+        unknown = [name for name in self._pending_categories if name not in self._categories]
+        first_seen = len(unknown)
+        if unknown:
+            for category in Category.objects.filter(name__in=unknown).order_by():
+                self._categories[category.name] = category
+
+        to_create, to_update = [], []
+        # Строки пишутся в порядке ключей, чтобы параллельные импорты блокировали их в одном порядке
+        for name, description in sorted(self._pending_categories.items()):
+            category = self._categories.get(name)
+            if category is None:
+                to_create.append(Category(name=name, description=description))
+            elif category.description != description:
+                category.description = description
+                to_update.append(category)
+
+        if to_create:
+            Category.objects.bulk_create(
+                to_create, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=["name"], update_fields=["description"],
+            )
+            for category in to_create:
+                self._categories[category.name] = category
+        if to_update:
+            Category.objects.bulk_update(to_update, ["description"], batch_size=self.batch_size)
+            self.changes_shared_rows = True
+        self._count(
+            "categories", inserted=len(to_create), updated=len(to_update),
+            unchanged=max(first_seen - len(to_create) - len(to_update), 0),
+        )
+
+        self.seen_category_ids.update(self._categories[name].id for name in self._pending_categories)
+
+        # Добавляем магазин к категориям, если его там еще нет
+        new_links = [
+            Category.shops.through(category_id=self._categories[name].id, shop_id=self.shop.id)
+            for name in self._pending_categories
+            if self._categories[name].id not in self._linked_category_ids
+        ]
+        if new_links:
+            Category.shops.through.objects.bulk_create(new_links, ignore_conflicts=True)
+            self._linked_category_ids.update(link.category_id for link in new_links)
+            self._count("category_links", inserted=len(new_links))
+
+    def _flush_products(self) -> dict:
+        """Создаёт товары пачки и переносит их в нужную категорию. Возвращает name -> id."""
+        wanted = {}  # name -> category_id (последняя категория побеждает, как при построчной записи)
+        for record in self._pending_infos:
+            wanted[record["product"]] = self._categories[record["category"]].id
+
+        existing = {
+            product.name: product
+            for product in Product.objects.filter(name__in=wanted).only("id", "name", "category_id").order_by()
+        }
+        to_create, to_update = [], []
+        for name, category_id in sorted(wanted.items()):
+            product = existing.get(name)
+            if product is None:
+                to_create.append(Product(name=name, category_id=category_id))
+            elif product.category_id != category_id:
+                product.category_id = category_id
+                to_update.append(product)
+
+        if to_create:
+            Product.objects.bulk_create(
+                to_create, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=["name"], update_fields=["category"],
+            )
+        if to_update:
+            Product.objects.bulk_update(to_update, ["category"], batch_size=self.batch_size)
+            self.changes_shared_rows = True
+            self.changed_product_ids.update(product.id for product in to_update)
+        self._count(
+            "products", inserted=len(to_create), updated=len(to_update),
+            unchanged=len(wanted) - len(to_create) - len(to_update),
+        )
+
+        return {product.name: product.id for product in [*existing.values(), *to_create]}
+
+    def _flush_parameters(self) -> dict:
+        """Создаёт недостающие параметры. Возвращает name -> id."""
+        names = {
+            param_name
+            for record in self._pending_infos
+            for param_name, param_value in record["parameters"]
+            if param_name and param_value
+        }
+        unknown = names - self._parameter_ids.keys()
+        if unknown:
+            self._parameter_ids.update(
+                Parameter.objects.filter(name__in=unknown).order_by().values_list("name", "id")
+            )
+            to_create = [Parameter(name=name) for name in sorted(unknown - self._parameter_ids.keys())]
+            if to_create:
+                Parameter.objects.bulk_create(
+                    to_create, batch_size=self.batch_size,
+                    update_conflicts=True, unique_fields=["name"], update_fields=["name"],
+                )
+                self._parameter_ids.update((parameter.name, parameter.id) for parameter in to_create)
+                self._count("parameters", inserted=len(to_create))
+        return self._parameter_ids
 
-        # Создаем или обновляем связь между информацией о продукте и параметром
-        ProductParameter.objects.update_or_create(
-            product_info=product_info,
-            parameter=parameter,
-            defaults={"value": param_value}
+    def _flush_product_infos(self, product_ids: dict, parameter_ids: dict) -> None:
+        """Создаёт/обновляет информацию о товарах пачки и значения их параметров."""
+        rows = {}  # (product_id, name) -> запись
+        for record in self._pending_infos:
+            rows[(product_ids[record["product"]], record["name"])] = record
+
+        existing = {
+            (info.product_id, info.name): info
+            for info in ProductInfo.objects.filter(
+                shop=self.shop, product_id__in={product_id for product_id, _ in rows}
+            ).order_by()
+        }
+        to_create, to_update, changed = [], [], {}
+        value_changed = []  # строки, у которых изменились цены или количество (для истории)
+        for (product_id, name), record in sorted(rows.items()):
+            fingerprint = product_info_fingerprint(record)
+            info = existing.get((product_id, name))
+            if info is None:
+                info = ProductInfo(product_id=product_id, shop=self.shop, name=name)
+                to_create.append(info)
+                old_values = None
+            elif info.fingerprint == fingerprint and not self.force:
+                self.seen_info_ids.add(info.id)
+                continue # Содержимое не изменилось — строку и её параметры не трогаем
+            else:
+                to_update.append(info)
+                old_values = (info.price, info.price_rrc, info.quantity)
+            info.price = to_money(record["price"])
+            info.price_rrc = to_money(record["price_rrc"])
+            info.quantity = int(record["quantity"])
+            info.fingerprint = fingerprint
+            changed[(product_id, name)] = info
+            self.changed_category_ids.add(self._categories[record["category"]].id)
+            self.changed_product_ids.add(product_id)
+            if old_values != (info.price, info.price_rrc, info.quantity):
+                value_changed.append(info)
+
+        fields = ["price", "price_rrc", "quantity", "fingerprint"]
+        if to_create:
+            ProductInfo.objects.bulk_create(
+                to_create, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=["product", "shop", "name"], update_fields=fields,
+            )
+        if to_update:
+            ProductInfo.objects.bulk_update(to_update, fields, batch_size=self.batch_size)
+        self.seen_info_ids.update(info.id for info in changed.values())
+        self._count(
+            "product_infos", inserted=len(to_create), updated=len(to_update),
+            unchanged=len(rows) - len(changed),
+        )
+        if value_changed:
+            record_price_history(value_changed, batch_size=self.batch_size)
+            self._count("price_history", inserted=len(value_changed))
+
+        if changed:
+            self._flush_product_parameters(
+                {info.id: rows[key] for key, info in changed.items()}, parameter_ids
+            )
+
+    def _flush_product_parameters(self, records_by_info_id: dict, parameter_ids: dict) -> None:
+        """
+        Записывает значения параметров изменившихся строк, пропуская не изменившиеся значения
+        и удаляя параметры, которых больше нет в записи. Значения пишутся без сигналов: карточки товаров
+        этих строк инвалидирует invalidate_cache() (товары уже в changed_product_ids).
+        """
+        wanted = {}  # (product_info_id, parameter_id) -> value
+        for info_id, record in records_by_info_id.items():
+            for param_name, param_value in record["parameters"]:
+                if not all([param_name, param_value]):
+                    print(f"Пропущен параметр {record['product']} из-за отсутствующих данных.")
+                    continue
+                wanted[(info_id, parameter_ids[param_name])] = str(param_value)
+
+        existing = {
+            (product_parameter.product_info_id, product_parameter.parameter_id): product_parameter
+            for product_parameter in ProductParameter.objects.filter(product_info_id__in=records_by_info_id).order_by()
+        }
+        to_create, to_update = [], []
+        for (info_id, parameter_id), value in sorted(wanted.items()):
+            product_parameter = existing.get((info_id, parameter_id))
+            if product_parameter is None:
+                to_create.append(ProductParameter(product_info_id=info_id, parameter_id=parameter_id, value=value))
+            elif product_parameter.value != value:
+                product_parameter.value = value
+                to_update.append(product_parameter)
+        to_delete = [product_parameter.id for key, product_parameter in existing.items() if key not in wanted]
+
+        if to_create:
+            ProductParameter.objects.bulk_create(
+                to_create, batch_size=self.batch_size,
+                update_conflicts=True, unique_fields=["product_info", "parameter"], update_fields=["value"],
+            )
+        if to_update:
+            ProductParameter.objects.bulk_update(to_update, ["value"], batch_size=self.batch_size)
+        if to_delete:
+            ProductParameter.objects.filter(id__in=to_delete).delete()
+        self._count(
+            "product_parameters", inserted=len(to_create), updated=len(to_update), removed=len(to_delete),
+            unchanged=len(wanted) - len(to_create) - len(to_update),
+        )
+
+
+class ShopImportPreview:
+    """
+    Предпросмотр импорта магазина (dry-run) без записи в БД.
+
+    Записи обрабатываются пачками, как в ShopDataImporter: на пачку выполняются два
+    чтения (товары по именам и информация о товарах магазина), в конце — чтение
+    оставшихся товаров магазина для расчёта удалений. Изменения определяются
+    по тем же отпечаткам, поэтому предпросмотр совпадает с результатом импорта.
+
+    Каждое изменение — словарь с ключом action ("create", "update", "remove"); полный список
+    пишется построчно (NDJSON) в output, в памяти хранятся только счётчики и первые примеры.
+    """
+
+    ACTIONS = ("create", "update", "unchanged", "remove")
+
+    def __init__(self, shop: Shop, batch_size: int = IMPORT_BATCH_SIZE, policy: str = IMPORT_STALE_POLICY,
+                 output=None, sample_size: int = IMPORT_DIFF_SAMPLE_SIZE):
+        if policy not in IMPORT_STALE_POLICIES:
+            raise ValueError(f"Неизвестный режим удаления товаров: {policy}")
+        self.shop = shop
+        self.batch_size = batch_size
+        self.policy = policy
+        self.output = output  # бинарный файл для полного отчёта или None
+        self.sample_size = sample_size
+        self.summary = dict.fromkeys(self.ACTIONS, 0)
+        self.sample = {"create": [], "update": [], "remove": []}
+
+        self._pending_infos = {}  # (product, name) -> запись
+        self._skipped_infos = set()  # (product, name) пропущенных неполных записей пачки
+        self._seen_info_ids = set()
+
+    def add_records(self, records) -> None:
+        """Добавляет в предпросмотр последовательность записей."""
+        for record in records:
+            self.add(record)
+
+    def add(self, record: dict) -> None:
+        """Добавляет одну запись; записи без товара или с неполными данными импорт пропускает."""
+        if "product" not in record:
+            return
+        if not is_complete_info_record(record):
+            self._skipped_infos.add((record["product"], record.get("name")))
+            if len(self._skipped_infos) >= self.batch_size:
+                self.flush()
+            return
+        self._pending_infos[(record["product"], record["name"])] = record
+        if len(self._pending_infos) >= self.batch_size:
+            self.flush()
+
+    def finish(self) -> dict:
+        """Обрабатывает остаток буфера, добавляет удаления и возвращает summary."""
+        self.flush()
+        self._diff_removed()
+        return self.summary
+
+    def flush(self) -> None:
+        """Сравнивает пачку записей с информацией о товарах магазина в БД."""
+        # Неполные записи импорт пропускает, но и не удаляет (см. ShopDataImporter.flush)
+        self._seen_info_ids.update(shop_info_ids(self.shop, self._skipped_infos))
+        self._skipped_infos = set()
+        if not self._pending_infos:
+            return
+        product_ids = dict(
+            Product.objects.filter(name__in={product for product, _ in self._pending_infos})
+            .order_by().values_list("name", "id")
         )
+        existing = {
+            (info["product_id"], info["name"]): info
+            for info in ProductInfo.objects.filter(shop=self.shop, product_id__in=product_ids.values())
+            .order_by().values("id", "product_id", "name", "price", "price_rrc", "quantity", "fingerprint")
+        }
+
+        for (product, name), record in sorted(self._pending_infos.items()):
+            info = existing.get((product_ids.get(product), name))
+            new = self._values(record)
+            if info is None:
+                self._emit({"action": "create", "product": product, "name": name, **new})
+                continue
+            self._seen_info_ids.add(info["id"])
+            fingerprint = product_info_fingerprint(record)
+            if info["fingerprint"] == fingerprint:
+                self.summary["unchanged"] += 1
+                continue
+
+            old = self._values(info)
+            changed_fields = [field for field in new if new[field] != old[field]]
+            # Отпечаток с прежними ценами и новыми параметрами совпадает — значит, параметры те же
+            if product_info_fingerprint({**record, **old}) != info["fingerprint"]:
+                changed_fields.append("parameters")
+            self._emit({
+                "action": "update", "id": info["id"], "product": product, "name": name,
+                "old": old, "new": new, "changed_fields": changed_fields,
+            })
+        self._pending_infos = {}
+
+    def _diff_removed(self) -> None:
+        """Товары магазина, которых нет в файле: будут удалены или обнулены (см. sweep_stale_shop_data)."""
+        if not self._seen_info_ids:
+            return # Как и импорт, файл без товаров ничего не удаляет
+        stale = [
+            info for info in ProductInfo.objects.filter(shop=self.shop).order_by("id")
+            .values("id", "product__name", "name", "price", "price_rrc", "quantity", "fingerprint")
+            if info["id"] not in self._seen_info_ids
+        ]
+        ordered_ids = set()
+        if self.policy == "delete":
+            for start in range(0, len(stale), self.batch_size):
+                ordered_ids.update(OrderItem.objects.filter(
+                    product_info_id__in=[info["id"] for info in stale[start:start + self.batch_size]]
+                ).values_list("product_info_id", flat=True))
+
+        for info in stale:
+            zero = self.policy == "zero" or info["id"] in ordered_ids
+            if zero and info["quantity"] == 0 and not info["fingerprint"]:
+                continue # Уже обнулён прошлым импортом
+            self._emit({
+                "action": "remove", "id": info["id"], "product": info["product__name"], "name": info["name"],
+                "old": self._values(info), "mode": "zero" if zero else "delete",
+            })
+
+    @staticmethod
+    def _values(data: dict) -> dict:
+        """Цены и количество в виде, пригодном для JSON (цены — строки с двумя знаками)."""
+        return {
+            "price": str(to_money(data["price"])),
+            "price_rrc": str(to_money(data["price_rrc"])),
+            "quantity": int(data["quantity"]),
+        }
 
+    def _emit(self, change: dict) -> None:
+        action = change["action"]
+        self.summary[action] += 1
+        if len(self.sample[action]) < self.sample_size:
+            self.sample[action].append(change)
+        if self.output is not None:
+            self.output.write(ujson.dumps(change, ensure_ascii=False).encode("utf-8") + b"\n")
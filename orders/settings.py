@@ -239,6 +239,16 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Europe/Moscow"
 
+# Периодические задачи (запускаются процессом `celery -A backend beat`)
+CELERY_BEAT_SCHEDULE = {
+    # Проверка файлов поставщиков: импорт запускается только для изменившихся файлов,
+    # интервал проверки каждого магазина задаётся полем Shop.import_interval
+    "check-shop-feeds": {
+        "task": "backend.tasks.check_shop_feeds_task",
+        "schedule": timedelta(seconds=int(os.getenv("SHOP_FEED_CHECK_SECONDS", 60))),
+    },
+}
+
 
 # --- Настройка Redis ---
 REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")